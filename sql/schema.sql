@@ -19,7 +19,10 @@ CREATE TABLE detraf_arquivo_batimento_avancado (
     cnl_de_b VARCHAR(10),
     area_local_de_b VARCHAR(10),
     data_hora DATETIME,
-    INDEX idx_detraf_data_hora (data_hora)
+    a_num VARCHAR(32),
+    b_num VARCHAR(32),
+    INDEX idx_detraf_data_hora (data_hora),
+    INDEX idx_detraf_match (a_num, b_num, data_hora)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
 -- Resultado do processamento (match/perdidas/erros)
@@ -30,6 +33,10 @@ CREATE TABLE detraf_processado_batimento_avancado (
     cdr_id BIGINT NULL,
     status VARCHAR(20) NOT NULL,
     observacao VARCHAR(255) NULL,
+    ref_eot_a VARCHAR(32) NULL,
+    ref_eot_b VARCHAR(32) NULL,
+    ref_origem_a VARCHAR(20) NULL,
+    ref_origem_b VARCHAR(20) NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_detraf_id (detraf_id),
     INDEX idx_cdr_id (cdr_id)
@@ -61,10 +68,10 @@ CREATE TABLE IF NOT EXISTS detraf_context_batimento_avancado (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
--- Tabela de CDR normalizado para batimento (persistida)
--- Obs.: o pipeline recria/trunca esta tabela; aqui deixamos o DDL base
+-- Tabela de CDR normalizado para batimento (persistida, atualizada incrementalmente)
+-- src/dst já normalizados (apenas dígitos; 12/13 dígitos => corta 2 à esquerda)
 CREATE TABLE IF NOT EXISTS cdr_batimento_avancado (
-    id BIGINT,
+    id BIGINT NOT NULL PRIMARY KEY,
     calldate DATETIME,
     src VARCHAR(32),
     dst VARCHAR(32),
@@ -73,49 +80,83 @@ CREATE TABLE IF NOT EXISTS cdr_batimento_avancado (
     duration INT,
     billsec INT,
     sentido VARCHAR(16),
-    disposition VARCHAR(32)
+    disposition VARCHAR(32),
+    bucket INT,                      -- FLOOR(TO_SECONDS(calldate) / 360)
+    INDEX idx_cdr_bat_match (src, dst, calldate),
+    INDEX idx_cdr_bat_bucket (src, dst, bucket),
+    INDEX idx_cdr_bat_calldate (calldate)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 
--- View consolidada para consulta (depende das tabelas acima e da `cdr`)
+-- High-water mark da carga incremental de cdr_batimento_avancado (1 linha)
+CREATE TABLE IF NOT EXISTS cdr_batimento_avancado_estado (
+    id TINYINT NOT NULL PRIMARY KEY,
+    ultimo_cdr_id BIGINT NOT NULL,
+    calldate_inicio DATETIME NOT NULL,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Resultado materializado do batimento (STATUS/codigo_erro/diferenca_tempo calculados uma vez por run)
+CREATE TABLE IF NOT EXISTS detraf_resultado_batimento_avancado (
+    id BIGINT NOT NULL PRIMARY KEY,
+    detraf_id BIGINT NOT NULL,
+    cdr_id BIGINT NULL,
+    status VARCHAR(20) NOT NULL,
+    status_ordem TINYINT NOT NULL,
+    diferenca_tempo VARCHAR(8) NULL,
+    data_hora DATETIME NULL,
+    origem VARCHAR(32) NULL,
+    destino VARCHAR(32) NULL,
+    eot_a_batimento VARCHAR(10) NULL,
+    eot_b_batimento VARCHAR(10) NULL,
+    cdr_eot_a VARCHAR(32) NULL,
+    cdr_eot_b VARCHAR(32) NULL,
+    codigo_erro TINYINT NULL,
+    recuperacao_de_conta TINYINT NOT NULL DEFAULT 0,
+    observacao VARCHAR(255) NULL,
+    ref_eot_a VARCHAR(32) NULL,
+    ref_eot_b VARCHAR(32) NULL,
+    ref_origem_a VARCHAR(20) NULL,
+    ref_origem_b VARCHAR(20) NULL,
+    INDEX idx_resultado_status (status, data_hora, codigo_erro),
+    INDEX idx_resultado_codigo (codigo_erro)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Totais do batimento por status/código/recuperação (lidos pelo sintético)
+CREATE TABLE IF NOT EXISTS detraf_resumo_batimento_avancado (
+    status VARCHAR(20) NOT NULL,
+    codigo_erro TINYINT NOT NULL DEFAULT 0,
+    recuperacao_de_conta TINYINT NOT NULL DEFAULT 0,
+    total BIGINT NOT NULL,
+    PRIMARY KEY (status, codigo_erro, recuperacao_de_conta)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- Etapas concluídas por run (detraf run --resume)
+CREATE TABLE IF NOT EXISTS detraf_checkpoint_batimento_avancado (
+    run_id VARCHAR(20) NOT NULL,
+    arquivo_hash CHAR(64) NOT NULL,
+    periodo CHAR(6) NOT NULL,
+    eot VARCHAR(10) NOT NULL,
+    etapa VARCHAR(20) NOT NULL,
+    detalhes TEXT NULL,
+    concluida_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, etapa),
+    INDEX idx_checkpoint_chave (arquivo_hash, periodo, eot, concluida_em)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+
+-- View consolidada para consulta (lê apenas o resultado materializado)
 CREATE OR REPLACE VIEW detraf_batimento_avancado_vw AS
-SELECT dc.id AS ID,
-       CASE
-         WHEN dc.cdr_id IS NULL THEN 'Perdido'
-         WHEN (c.disposition IS NOT NULL AND UPPER(c.disposition) <> 'ANSWERED') THEN 'Erro'
-         WHEN ( (c.EOT_A <=> d.eot_de_a) AND (c.EOT_B <=> d.eot_de_b) ) THEN 'Conferência'
-         ELSE 'Erro'
-       END AS STATUS,
-       CASE
-         WHEN dc.cdr_id IS NULL THEN NULL
-         ELSE CONCAT(LPAD(FLOOR(ABS(TIMESTAMPDIFF(SECOND, d.data_hora, c.calldate))/60), 2, '0'), ':', LPAD(MOD(ABS(TIMESTAMPDIFF(SECOND, d.data_hora, c.calldate)), 60), 2, '0'))
-       END AS diferenca_tempo,
-       DATE_FORMAT(d.data_hora, '%Y-%m-%d %H:%i:%s') AS Data_hora_batimento,
-       CASE
-         WHEN LENGTH(REGEXP_REPLACE(d.assinante_a_numero, '[^0-9]', '')) IN (12,13)
-              THEN SUBSTRING(REGEXP_REPLACE(d.assinante_a_numero, '[^0-9]', ''), 3)
-         ELSE REGEXP_REPLACE(d.assinante_a_numero, '[^0-9]', '')
-       END AS `origem batimento`,
-       CASE
-         WHEN LENGTH(REGEXP_REPLACE(d.assinante_b_numero, '[^0-9]', '')) IN (12,13)
-              THEN SUBSTRING(REGEXP_REPLACE(d.assinante_b_numero, '[^0-9]', ''), 3)
-         ELSE REGEXP_REPLACE(d.assinante_b_numero, '[^0-9]', '')
-       END AS `destino batimento`,
-       d.eot_de_a AS EOT_A_Batimento,
-       d.eot_de_b AS EOT_B_Batimento,
-       dc.cdr_id AS id_cdr,
-       c.EOT_A AS cdr_eot_A,
-       c.EOT_B AS cdr_eot_B,
-       CASE
-         WHEN dc.cdr_id IS NULL THEN 4
-         WHEN (c.disposition IS NOT NULL AND UPPER(c.disposition) <> 'ANSWERED') THEN 1
-         WHEN ((c.EOT_A IS NOT NULL AND d.eot_de_a IS NOT NULL AND c.EOT_A <> d.eot_de_a)
-               AND (c.EOT_B IS NOT NULL AND d.eot_de_b IS NOT NULL AND c.EOT_B <> d.eot_de_b)) THEN 5
-         WHEN (c.EOT_A IS NOT NULL AND d.eot_de_a IS NOT NULL AND c.EOT_A <> d.eot_de_a) THEN 3
-         WHEN (c.EOT_B IS NOT NULL AND d.eot_de_b IS NOT NULL AND c.EOT_B <> d.eot_de_b) THEN 2
-         ELSE NULL
-       END AS codigo_erro,
-       dc.observacao
-FROM detraf_processado_batimento_avancado dc
-JOIN detraf_arquivo_batimento_avancado d ON dc.detraf_id = d.id
-LEFT JOIN cdr c ON c.id = dc.cdr_id
-ORDER BY FIELD(STATUS, 'Conferência','Erro','Perdido'), d.data_hora, codigo_erro;
+SELECT id AS ID,
+       status AS STATUS,
+       diferenca_tempo,
+       DATE_FORMAT(data_hora, '%Y-%m-%d %H:%i:%s') AS Data_hora_batimento,
+       origem AS `origem batimento`,
+       destino AS `destino batimento`,
+       eot_a_batimento AS EOT_A_Batimento,
+       eot_b_batimento AS EOT_B_Batimento,
+       cdr_id AS id_cdr,
+       cdr_eot_a AS cdr_eot_A,
+       cdr_eot_b AS cdr_eot_B,
+       codigo_erro,
+       observacao
+FROM detraf_resultado_batimento_avancado
+ORDER BY status_ordem, data_hora, codigo_erro;
@@ -0,0 +1,502 @@
+from __future__ import annotations
+"""Benchmark ponta a ponta (``detraf bench``).
+
+Gera um cenário sintético reprodutível (mesma semente → mesmos dados): o
+arquivo DETRAF no layout de ``configs/detraf_layout.yaml`` e as bases
+``cdr``, ``numeros_portados`` e ``cadup`` correspondentes, com volume e taxas
+controláveis:
+
+- ``perda``: fração das linhas do DETRAF sem chamada no CDR (Perdido, código 4);
+- ``erro``: fração das linhas casadas com erro, sorteado entre ``codigos``
+  (1 = não atendida, 2/3/5 = EOT de B/A/ambos divergente no CDR);
+- ``portabilidade``: fração dos números (por lado) com registro em
+  ``numeros_portados`` (parte deles com um registro anterior, mais antigo);
+- ``ruido``: linhas extras no CDR sem correspondência no DETRAF.
+
+Os arquivos ficam em ``var/bench/dados_<chave>/`` (``manifest.json`` com o
+cenário e os totais esperados) e são reaproveitados enquanto os parâmetros
+não mudarem. A geração é em streaming (memória constante até dezenas de
+milhões de linhas).
+
+O cenário é carregado em um banco próprio de benchmark (nunca o banco
+configurado), o pipeline do ``detraf run`` roda inteiro e o resultado —
+tempos por etapa e conferência do resumo com os totais esperados — vai para
+``var/bench/bench_<ts>.json``, que serve de baseline entre versões
+(``comparar``).
+"""
+
+import hashlib
+import json
+import random
+import time
+from datetime import datetime, timedelta
+from calendar import monthrange
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+from .env import CONFIGS_DIR, ROOT
+from .log import info, ok, warn
+
+BENCH_DIR = ROOT / "var" / "bench"
+BANCO_PADRAO = "detraf_bench"
+LAYOUT_PADRAO = CONFIGS_DIR / "detraf_layout.yaml"
+VERSAO_DADOS = 1
+INSERT_BATCH = 10_000
+# Etapas mais curtas que isso não entram no veredito de regressão (ruído de medição)
+MIN_SEG_COMPARACAO = 0.5
+
+CODIGOS_ERRO = (1, 2, 3, 5)
+DDDS = ("11", "21", "27", "31", "41", "47", "51", "61", "62", "71", "81", "85", "91")
+PREFIXOS_POR_DDD = 40
+EOTS = tuple(f"{n:03d}" for n in range(101, 131))
+
+CREATE_BASES = (
+    """
+    CREATE TABLE cdr (
+        id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        calldate DATETIME NOT NULL,
+        src VARCHAR(32),
+        dst VARCHAR(32),
+        EOT_A VARCHAR(32),
+        EOT_B VARCHAR(32),
+        duration INT,
+        billsec INT,
+        sentido VARCHAR(16),
+        disposition VARCHAR(32),
+        INDEX idx_cdr_calldate (calldate)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE numeros_portados (
+        id BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        numero VARCHAR(20) NOT NULL,
+        eot VARCHAR(10),
+        data_janela DATETIME,
+        INDEX idx_np_numero (numero, data_janela),
+        INDEX idx_np_janela (data_janela)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+    """
+    CREATE TABLE cadup (
+        id INT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        CN VARCHAR(2) NOT NULL,
+        prefixo VARCHAR(5) NOT NULL,
+        MCDU_inicial CHAR(4) NOT NULL,
+        MCDU_final CHAR(4) NOT NULL,
+        empresa_receptora VARCHAR(10),
+        INDEX idx_cadup (CN, prefixo)
+    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+    """,
+)
+
+# Arquivo TSV -> (tabela, colunas)
+BASES = {
+    "cdr.tsv": ("cdr", ("calldate", "src", "dst", "EOT_A", "EOT_B", "duration", "billsec", "sentido", "disposition")),
+    "numeros_portados.tsv": ("numeros_portados", ("numero", "eot", "data_janela")),
+    "cadup.tsv": ("cadup", ("CN", "prefixo", "MCDU_inicial", "MCDU_final", "empresa_receptora")),
+}
+
+
+class Cenario:
+    """Parâmetros do conjunto sintético (volume, taxas, período e semente)."""
+
+    def __init__(
+        self,
+        linhas: int = 100_000,
+        periodo: str = "202501",
+        eot: str = "101",
+        perda: float = 0.10,
+        erro: float = 0.10,
+        codigos: Sequence[int] = CODIGOS_ERRO,
+        portabilidade: float = 0.05,
+        ruido: float = 0.20,
+        semente: int = 42,
+    ):
+        if linhas < 1:
+            raise ValueError("O cenário precisa de pelo menos 1 linha.")
+        if len(periodo) != 6 or not periodo.isdigit():
+            raise ValueError(f"Período inválido: {periodo} (use YYYYMM)")
+        for nome, taxa in (("perda", perda), ("erro", erro), ("portabilidade", portabilidade)):
+            if not 0.0 <= taxa <= 1.0:
+                raise ValueError(f"Taxa de {nome} fora de [0, 1]: {taxa}")
+        if ruido < 0:
+            raise ValueError(f"Taxa de ruído negativa: {ruido}")
+        invalidos = [c for c in codigos if c not in CODIGOS_ERRO]
+        if invalidos or not codigos:
+            raise ValueError(f"Códigos de erro inválidos: {list(codigos)} (use: {', '.join(map(str, CODIGOS_ERRO))})")
+        self.linhas = int(linhas)
+        self.periodo = periodo
+        self.eot = eot
+        self.perda = float(perda)
+        self.erro = float(erro)
+        self.codigos = tuple(sorted(set(int(c) for c in codigos)))
+        self.portabilidade = float(portabilidade)
+        self.ruido = float(ruido)
+        self.semente = int(semente)
+
+    def como_dict(self) -> dict:
+        return {
+            "linhas": self.linhas,
+            "periodo": self.periodo,
+            "eot": self.eot,
+            "perda": self.perda,
+            "erro": self.erro,
+            "codigos": list(self.codigos),
+            "portabilidade": self.portabilidade,
+            "ruido": self.ruido,
+            "semente": self.semente,
+        }
+
+    def chave(self) -> str:
+        bruto = json.dumps({"versao": VERSAO_DADOS, **self.como_dict()}, sort_keys=True)
+        return hashlib.sha1(bruto.encode("utf-8")).hexdigest()[:12]
+
+
+def _tsv(valores: Iterable) -> str:
+    return "\t".join("\\N" if v is None else str(v) for v in valores) + "\n"
+
+
+class _Linha:
+    """Monta linhas de largura fixa a partir do layout (campos ausentes ficam em branco)."""
+
+    def __init__(self, layout_path: Path):
+        from .import_detraf_fw import _load_layout
+        campos = sorted(_load_layout(str(layout_path)), key=lambda f: f["slice_start"])
+        self.largura = max(f["slice_start"] + f["length"] for f in campos)
+        self.campos: List[Tuple[str, int, int]] = [(f["name"], f["slice_start"], f["length"]) for f in campos]
+
+    def montar(self, valores: Dict[str, str]) -> str:
+        partes = []
+        pos = 0
+        for nome, inicio, tamanho in self.campos:
+            if inicio < pos:  # sobreposição no layout: o campo anterior prevalece
+                continue
+            if inicio > pos:
+                partes.append(" " * (inicio - pos))
+            partes.append(str(valores.get(nome, "")).ljust(tamanho)[:tamanho])
+            pos = inicio + tamanho
+        partes.append(" " * (self.largura - pos))
+        return "".join(partes) + "\n"
+
+
+class _Gerador:
+    def __init__(self, cenario: Cenario):
+        self.c = cenario
+        self.rng = random.Random(cenario.semente)
+        # (CN, prefixo) -> (EOT de 0000-4999, EOT de 5000-9999)
+        self.cadup: Dict[Tuple[str, str], Tuple[str, str]] = {}
+        self.prefixos: Dict[str, List[str]] = {}
+        for ddd in DDDS:
+            pref = ["9" + f"{p:04d}" for p in sorted(self.rng.sample(range(10_000), PREFIXOS_POR_DDD))]
+            self.prefixos[ddd] = pref
+            for p in pref:
+                self.cadup[(ddd, p)] = (self.rng.choice(EOTS), self.rng.choice(EOTS))
+
+    def numero(self) -> Tuple[str, str]:
+        """(número nacional de 11 dígitos, EOT do CADUP)."""
+        ddd = self.rng.choice(DDDS)
+        prefixo = self.rng.choice(self.prefixos[ddd])
+        mcdu = self.rng.randrange(10_000)
+        baixo, alto = self.cadup[(ddd, prefixo)]
+        return f"{ddd}{prefixo}{mcdu:04d}", (baixo if mcdu < 5_000 else alto)
+
+    def outro_eot(self, eot: str) -> str:
+        while True:
+            e = self.rng.choice(EOTS)
+            if e != eot:
+                return e
+
+    def formato_detraf(self, n: str) -> str:
+        # Com ou sem DDI/CSP: 13 dígitos perdem os 2 da esquerda na normalização
+        return n if self.rng.random() < 0.5 else "55" + n
+
+    def registro_detraf(self, seq: int, quando: datetime, a: str, eot_a: str, b: str, eot_b: str, duracao: int) -> Dict[str, str]:
+        """Campos de uma linha do DETRAF (nomes do layout)."""
+        fim = quando + timedelta(seconds=duracao)
+        return {
+            "sequencial": f"{seq:010d}",
+            "assinante_a": self.formato_detraf(a),
+            "eot_de_a": eot_a,
+            "cnl_de_a": f"{int(a[:2]) * 1000:05d}",
+            "area_local_de_a": f"{a[:2]:0>4}",
+            "data_da_chamada": quando.strftime("%Y%m%d"),
+            "hora_de_atendimento": quando.strftime("%H%M%S"),
+            "assinante_b": self.formato_detraf(b),
+            "eot_de_b": eot_b,
+            "cnl_de_b": f"{int(b[:2]) * 1000:05d}",
+            "area_local_de_b": f"{b[:2]:0>4}",
+            "data_de_termino": fim.strftime("%Y%m%d"),
+            "hora_de_termino": fim.strftime("%H%M%S"),
+            "classe": "00001",
+            "condicao_de_entrada": "00",
+            "condicao_de_saida": "00",
+            "categoria_de_a": "01",
+            "povpi": "0000000",
+            "grupo_horario": "1",
+            "chave_portabilidade": "0" * 12,
+            "duracao_real_da_chamada": f"{duracao // 3600:03d}{duracao % 3600 // 60:02d}{duracao % 60:02d}",
+            "duracao_minima_remunerada": f"{duracao * 10:010d}",
+            "valor_liquido": f"{duracao * 3:011d}",
+            "eqt_filial_despesa": "000",
+            "eqt_filial_receita": "000",
+        }
+
+    def formato_cdr(self, n: str) -> str:
+        r = self.rng.random()
+        if r < 0.4:
+            return n
+        if r < 0.8:
+            return "55" + n
+        return f"+55 ({n[:2]}) {n[2:7]}-{n[7:]}"
+
+
+def gerar_cenario(cenario: Cenario, pasta: Optional[Path] = None, layout_path: Path = LAYOUT_PADRAO) -> dict:
+    """Gera (ou reaproveita) os arquivos do cenário e devolve o ``manifest``."""
+    pasta = Path(pasta) if pasta else BENCH_DIR / f"dados_{cenario.chave()}"
+    manifest_path = pasta / "manifest.json"
+    if manifest_path.exists():
+        try:
+            manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+            if manifest.get("cenario") == cenario.como_dict() and manifest.get("versao") == VERSAO_DADOS:
+                ok(f"Cenário sintético reaproveitado: {pasta}")
+                manifest["pasta"] = str(pasta)
+                return manifest
+        except Exception:
+            pass
+
+    pasta.mkdir(parents=True, exist_ok=True)
+    t0 = time.perf_counter()
+    g = _Gerador(cenario)
+    rng = g.rng
+    linha = _Linha(layout_path)
+    ano, mes = int(cenario.periodo[:4]), int(cenario.periodo[4:])
+    inicio = datetime(ano, mes, 1)
+    # Última hora do mês fica livre: término e CDR (±4 min) não saem do mês
+    janela_seg = monthrange(ano, mes)[1] * 86_400 - 3_600
+
+    esperado = {"linhas": cenario.linhas, "pares": 0, "perdidos": 0, "codigos": {str(c): 0 for c in cenario.codigos}}
+    n_cdr = n_np = 0
+    with (pasta / "cadup.tsv").open("w", encoding="utf-8", newline="\n") as f_cad:
+        for (cn, prefixo), (baixo, alto) in g.cadup.items():
+            f_cad.write(_tsv((cn, prefixo, "0000", "4999", baixo)))
+            f_cad.write(_tsv((cn, prefixo, "5000", "9999", alto)))
+
+    with (pasta / "detraf.txt").open("w", encoding="ascii", newline="\n") as f_det, \
+            (pasta / "cdr.tsv").open("w", encoding="utf-8", newline="\n") as f_cdr, \
+            (pasta / "numeros_portados.tsv").open("w", encoding="utf-8", newline="\n") as f_np:
+
+        def referencia(numero: str, eot_cadup: str, quando: datetime) -> str:
+            """EOT correto do número; com portabilidade, grava o(s) registro(s) em numeros_portados."""
+            nonlocal n_np
+            if rng.random() >= cenario.portabilidade:
+                return eot_cadup
+            eot = g.outro_eot(eot_cadup)
+            janela = quando - timedelta(days=rng.randint(1, 400))
+            if rng.random() < 0.3:
+                # Registro anterior com outro EOT: vale o mais recente
+                antiga = janela - timedelta(days=rng.randint(1, 400))
+                f_np.write(_tsv((numero, g.outro_eot(eot), antiga.strftime("%Y-%m-%d 00:00:00"))))
+                n_np += 1
+            f_np.write(_tsv((numero, eot, janela.strftime("%Y-%m-%d 00:00:00"))))
+            n_np += 1
+            return eot
+
+        for i in range(1, cenario.linhas + 1):
+            quando = inicio + timedelta(seconds=rng.randrange(janela_seg))
+            a, eot_a = g.numero()
+            b, eot_b = g.numero()
+            ref_a = referencia(a, eot_a, quando)
+            ref_b = referencia(b, eot_b, quando)
+            duracao = rng.randint(5, 1_800)
+            f_det.write(linha.montar(g.registro_detraf(i, quando, a, ref_a, b, ref_b, duracao)))
+
+            if rng.random() < cenario.perda:
+                esperado["perdidos"] += 1
+            else:
+                esperado["pares"] += 1
+                codigo = rng.choice(cenario.codigos) if rng.random() < cenario.erro else None
+                if codigo is not None:
+                    esperado["codigos"][str(codigo)] += 1
+                calldate = quando + timedelta(seconds=rng.randint(-240, 240))
+                f_cdr.write(_tsv((
+                    calldate.strftime("%Y-%m-%d %H:%M:%S"),
+                    g.formato_cdr(a),
+                    g.formato_cdr(b),
+                    g.outro_eot(ref_a) if codigo in (3, 5) else ref_a,
+                    g.outro_eot(ref_b) if codigo in (2, 5) else ref_b,
+                    duracao + 2,
+                    0 if codigo == 1 else duracao,
+                    "sainte",
+                    "NO ANSWER" if codigo == 1 else "ANSWERED",
+                )))
+                n_cdr += 1
+
+            # Ruído: chamadas do CDR sem linha no DETRAF
+            extras = int(cenario.ruido) + (1 if rng.random() < cenario.ruido % 1 else 0)
+            for _ in range(extras):
+                x, eot_x = g.numero()
+                y, eot_y = g.numero()
+                dt = inicio + timedelta(seconds=rng.randrange(janela_seg))
+                dur = rng.randint(5, 600)
+                f_cdr.write(_tsv((
+                    dt.strftime("%Y-%m-%d %H:%M:%S"), g.formato_cdr(x), g.formato_cdr(y),
+                    eot_x, eot_y, dur + 2, dur, "sainte", "ANSWERED",
+                )))
+                n_cdr += 1
+
+    erros = sum(esperado["codigos"].values())
+    esperado["conferencia"] = esperado["pares"] - erros
+    esperado["erros"] = erros
+    manifest = {
+        "versao": VERSAO_DADOS,
+        "cenario": cenario.como_dict(),
+        "esperado": esperado,
+        "arquivos": {
+            "detraf": "detraf.txt",
+            **{nome: nome for nome in BASES},
+        },
+        "linhas_bases": {"cdr": n_cdr, "numeros_portados": n_np, "cadup": 2 * len(g.cadup)},
+        "segundos_geracao": round(time.perf_counter() - t0, 3),
+        "gerado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    manifest_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    manifest["pasta"] = str(pasta)
+    ok(
+        f"Cenário sintético gerado em {pasta}: {cenario.linhas} linhas DETRAF, {n_cdr} CDR, "
+        f"{n_np} numeros_portados ({manifest['segundos_geracao']:.1f}s)"
+    )
+    return manifest
+
+
+# ---------- banco de benchmark ----------
+def _carregar_tsv(cur, tabela: str, colunas: Sequence[str], path: Path, load_data: bool) -> int:
+    cols = ", ".join(colunas)
+    if load_data:
+        cur.execute(
+            f"LOAD DATA LOCAL INFILE %s INTO TABLE {tabela} CHARACTER SET utf8mb4 "
+            f"FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\' LINES TERMINATED BY '\\n' ({cols})",
+            (str(path),),
+        )
+        return cur.rowcount or 0
+    sql = f"INSERT INTO {tabela} ({cols}) VALUES ({', '.join(['%s'] * len(colunas))})"
+    total = 0
+    lote = []
+    with path.open("r", encoding="utf-8") as fh:
+        for linha in fh:
+            lote.append(tuple(None if v == "\\N" else v for v in linha.rstrip("\n").split("\t")))
+            if len(lote) >= INSERT_BATCH:
+                cur.executemany(sql, lote)
+                total += len(lote)
+                lote = []
+    if lote:
+        cur.executemany(sql, lote)
+        total += len(lote)
+    return total
+
+
+def preparar_banco(banco: str, manifest: dict) -> Dict[str, int]:
+    """Cria o banco de benchmark (se preciso) e recarrega ``cdr``/``numeros_portados``/``cadup``."""
+    from .db import get_connection
+    from .import_detraf_fw import _local_infile_enabled
+
+    with get_connection(database=None) as conn, conn.cursor() as cur:
+        cur.execute(f"CREATE DATABASE IF NOT EXISTS `{banco}` CHARACTER SET utf8mb4")
+    pasta = Path(manifest["pasta"])
+    carregadas: Dict[str, int] = {}
+    with get_connection(database=banco, local_infile=True) as conn, conn.cursor() as cur:
+        load_data = _local_infile_enabled(cur)
+        if not load_data:
+            warn("Servidor com local_infile desabilitado; carga das bases via executemany.")
+        for tabela in ("cdr", "numeros_portados", "cadup"):
+            cur.execute(f"DROP TABLE IF EXISTS {tabela}")
+        for ddl in CREATE_BASES:
+            cur.execute(ddl)
+        for arquivo, (tabela, colunas) in BASES.items():
+            t0 = time.perf_counter()
+            carregadas[tabela] = _carregar_tsv(cur, tabela, colunas, pasta / arquivo, load_data)
+            info(f"{tabela}: {carregadas[tabela]} linhas carregadas em {time.perf_counter() - t0:.1f}s")
+    return carregadas
+
+
+def conferir(banco: str, esperado: dict) -> Tuple[dict, List[str]]:
+    """Compara ``detraf_resumo_batimento_avancado`` do banco de benchmark com os totais esperados."""
+    from .db import get_connection
+    from .resultado import TABELA_RESUMO
+
+    obtido = {"perdidos": 0, "conferencia": 0, "codigos": {}}
+    with get_connection(database=banco) as conn, conn.cursor() as cur:
+        cur.execute(f"SELECT status, codigo_erro, SUM(total) AS total FROM {TABELA_RESUMO} GROUP BY status, codigo_erro")
+        for row in cur.fetchall() or []:
+            if isinstance(row, dict):
+                status, codigo, total = row["status"], int(row["codigo_erro"]), int(row["total"])
+            else:
+                status, codigo, total = row[0], int(row[1]), int(row[2])
+            if status == "Perdido":
+                obtido["perdidos"] += total
+            elif status == "Conferência":
+                obtido["conferencia"] += total
+            else:
+                obtido["codigos"][str(codigo)] = obtido["codigos"].get(str(codigo), 0) + total
+    divergencias = []
+    for chave in ("perdidos", "conferencia"):
+        if obtido[chave] != esperado[chave]:
+            divergencias.append(f"{chave}: esperado {esperado[chave]}, obtido {obtido[chave]}")
+    for codigo in sorted(set(esperado["codigos"]) | set(obtido["codigos"])):
+        e, o = esperado["codigos"].get(codigo, 0), obtido["codigos"].get(codigo, 0)
+        if e != o:
+            divergencias.append(f"código {codigo}: esperado {e}, obtido {o}")
+    return obtido, divergencias
+
+
+# ---------- baseline ----------
+def revisao_git() -> Optional[str]:
+    """Commit atual do checkout (identifica a versão medida), se disponível."""
+    import subprocess
+    try:
+        r = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=str(ROOT), capture_output=True, text=True, timeout=5,
+        )
+        return r.stdout.strip() or None if r.returncode == 0 else None
+    except Exception:
+        return None
+
+
+def salvar_resultado(dados: dict, pasta: Path = BENCH_DIR) -> Path:
+    pasta.mkdir(parents=True, exist_ok=True)
+    path = pasta / f"bench_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path.write_text(json.dumps(dados, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def comparar(atual: dict, baseline: dict, tolerancia: float = 0.10) -> List[str]:
+    """Imprime o tempo por etapa (baseline x atual) e devolve as etapas que pioraram além da tolerância.
+
+    Etapas abaixo de ``MIN_SEG_COMPARACAO`` na baseline aparecem na tabela mas não entram no veredito.
+    """
+    if baseline.get("cenario") != atual.get("cenario"):
+        warn("Baseline gerada com outro cenário; a comparação é apenas indicativa.")
+    base = {e["etapa"]: e for e in baseline.get("etapas", [])}
+    regressoes = []
+    largura = max([len(e["etapa"]) for e in atual.get("etapas", [])] + [5]) + 2
+    cab = f"{'etapa':<{largura}}{'baseline(s)':>12}{'atual(s)':>10}{'variação':>10}"
+    print("─" * len(cab))
+    print(cab)
+    print("─" * len(cab))
+    for e in atual.get("etapas", []):
+        b = base.get(e["etapa"])
+        if b is None:
+            print(f"{e['etapa']:<{largura}}{'-':>12}{e['segundos']:>10.2f}{'nova':>10}")
+            continue
+        var = (e["segundos"] - b["segundos"]) / b["segundos"] if b["segundos"] > 0 else 0.0
+        pior = b["segundos"] >= MIN_SEG_COMPARACAO and var > tolerancia
+        if pior:
+            regressoes.append(f"{e['etapa']}: {b['segundos']:.2f}s → {e['segundos']:.2f}s ({var:+.0%})")
+        print(
+            f"{e['etapa']:<{largura}}{b['segundos']:>12.2f}{e['segundos']:>10.2f}{var:>+10.0%}"
+            + ("  (regressão)" if pior else "")
+        )
+    print("─" * len(cab))
+    tb, ta = baseline.get("segundos_pipeline"), atual.get("segundos_pipeline")
+    if tb and ta:
+        info(f"Pipeline: baseline {tb:.1f}s | atual {ta:.1f}s ({(ta - tb) / tb:+.1%})")
+    return regressoes
@@ -0,0 +1,162 @@
+from __future__ import annotations
+"""Índice em memória do CADUP (faixas de MCDU por CN/prefixo).
+
+O ``cadup`` é lido uma vez e compactado em arrays ordenados por
+``MCDU_inicial`` para cada ``(CN, prefixo)``; a busca é binária (``bisect``)
+e não faz round trip ao banco. Faixas sobrepostas são tratadas com o
+máximo acumulado de ``MCDU_final``: a busca recua a partir da última faixa
+com início <= MCDU e para assim que nenhuma faixa anterior pode cobri-lo.
+Havendo mais de uma faixa válida, vence a de maior ``MCDU_inicial`` (a mais
+específica); a consulta original (``LIMIT 1`` sem ``ORDER BY``) não definia
+qual.
+
+O índice é salvo em ``var/cache/cadup.idx`` junto com a chave do conteúdo
+(``CHECKSUM TABLE cadup``, ou ``COUNT(*)`` se indisponível); execuções
+seguintes partem do snapshot enquanto a chave não mudar.
+"""
+
+import pickle
+import time
+from array import array
+from bisect import bisect_right
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from .env import ROOT
+from .log import info, ok, warn
+from .normalizer import _split_number_for_cadup
+
+CACHE_DIR = ROOT / "var" / "cache"
+SNAPSHOT = "cadup.idx"
+SNAPSHOT_VERSAO = 1
+FETCH_BATCH = 50_000
+
+
+def _int(valor) -> Optional[int]:
+    try:
+        return int(str(valor).strip())
+    except Exception:
+        return None
+
+
+def _chave_cadup(cur) -> str:
+    """Identifica o conteúdo atual do ``cadup`` sem transferir a tabela."""
+    try:
+        cur.execute("CHECKSUM TABLE cadup")
+        row = cur.fetchone()
+        chk = row.get("Checksum") if isinstance(row, dict) else row[1]
+        if chk is not None:
+            return f"checksum:{chk}"
+    except Exception:
+        pass
+    cur.execute("SELECT COUNT(*) AS total FROM cadup")
+    row = cur.fetchone()
+    total = row["total"] if isinstance(row, dict) else row[0]
+    return f"count:{total}"
+
+
+class CadupIndex:
+    """Faixas de MCDU por ``(CN, prefixo)``: ``(inicios, fins, fim_max, eots)``."""
+
+    def __init__(self, faixas: Dict[Tuple[str, str], tuple], chave: str = ""):
+        self.faixas = faixas
+        self.chave = chave
+
+    @classmethod
+    def construir(cls, linhas, chave: str = "") -> "CadupIndex":
+        """Monta o índice a partir de ``(CN, prefixo, MCDU_inicial, MCDU_final, empresa_receptora)``."""
+        grupos: Dict[Tuple[str, str], list] = {}
+        for cn, prefixo, ini, fim, eot in linhas:
+            ini_i = _int(ini); fim_i = _int(fim)
+            if ini_i is None or fim_i is None or cn is None or prefixo is None:
+                continue
+            grupos.setdefault((str(cn), str(prefixo)), []).append((ini_i, fim_i, str(eot) if eot is not None else None))
+        faixas = {}
+        for k, lst in grupos.items():
+            lst.sort(key=lambda x: (x[0], x[1]))
+            inicios = array("q", (x[0] for x in lst))
+            fins = array("q", (x[1] for x in lst))
+            fim_max = array("q")
+            m = None
+            for f in fins:
+                m = f if m is None or f > m else m
+                fim_max.append(m)
+            faixas[k] = (inicios, fins, fim_max, [x[2] for x in lst])
+        return cls(faixas, chave)
+
+    def lookup(self, numero: str) -> Tuple[Optional[str], str]:
+        """Equivalente a ``_lookup_eot_cadup``: (eot, 'cadup') ou (None, '')."""
+        tipo, cn, prefixo, mcdu = _split_number_for_cadup(numero)
+        if not tipo:
+            return None, ''
+        f = self.faixas.get((cn, prefixo))
+        if not f:
+            return None, ''
+        inicios, fins, fim_max, eots = f
+        m = int(mcdu)
+        i = bisect_right(inicios, m) - 1
+        while i >= 0 and fim_max[i] >= m:
+            if fins[i] >= m:
+                return eots[i], 'cadup'
+            i -= 1
+        return None, ''
+
+    def __len__(self) -> int:
+        return sum(len(f[0]) for f in self.faixas.values())
+
+    # --- snapshot em disco ---
+    def salvar(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        with tmp.open("wb") as fh:
+            pickle.dump({"versao": SNAPSHOT_VERSAO, "chave": self.chave, "faixas": self.faixas}, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        tmp.replace(path)
+
+    @classmethod
+    def abrir(cls, path: Path) -> Optional["CadupIndex"]:
+        try:
+            with path.open("rb") as fh:
+                data = pickle.load(fh)
+            if data.get("versao") != SNAPSHOT_VERSAO:
+                return None
+            return cls(data["faixas"], data.get("chave", ""))
+        except Exception:
+            return None
+
+    @classmethod
+    def carregar(cls, cur, cache_dir: Path = CACHE_DIR) -> "CadupIndex":
+        """Retorna o índice atual: snapshot local se a chave bater, senão relê o ``cadup``."""
+        global _MEMO
+        chave = _chave_cadup(cur)
+        if _MEMO is not None and _MEMO.chave == chave:
+            return _MEMO
+        path = Path(cache_dir) / SNAPSHOT
+        idx = cls.abrir(path)
+        if idx is not None and idx.chave == chave:
+            ok(f"Índice CADUP carregado do snapshot ({len(idx)} faixas)")
+            _MEMO = idx
+            return idx
+        t0 = time.perf_counter()
+        cur.execute("SELECT CN, prefixo, MCDU_inicial, MCDU_final, empresa_receptora FROM cadup")
+        linhas = []
+        while True:
+            rows = cur.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            for r in rows:
+                if isinstance(r, dict):
+                    linhas.append((r["CN"], r["prefixo"], r["MCDU_inicial"], r["MCDU_final"], r["empresa_receptora"]))
+                else:
+                    linhas.append(tuple(r))
+        idx = cls.construir(linhas, chave)
+        try:
+            idx.salvar(path)
+        except Exception as ex:
+            warn(f"Não foi possível salvar snapshot do CADUP: {ex}")
+        info(f"Índice CADUP reconstruído ({len(idx)} faixas em {time.perf_counter() - t0:.1f}s)")
+        _MEMO = idx
+        return idx
+
+
+# Índice já carregado neste processo
+_MEMO: Optional[CadupIndex] = None
@@ -0,0 +1,235 @@
+from __future__ import annotations
+"""Checkpoints do ``detraf run`` (``detraf_checkpoint_batimento_avancado``).
+
+Cada etapa concluída do pipeline grava uma linha com o ``run_id``, a
+assinatura do arquivo DETRAF, o período e o EOT, mais os contadores que as
+etapas seguintes precisam (ex.: pares/perdidas do matching para conferir o
+resumo). ``detraf run --resume`` procura o último run com a mesma chave
+(arquivo, período, EOT) e pula as etapas já concluídas, em ordem: uma etapa
+só conta como concluída se todas as anteriores também estiverem.
+
+A assinatura (``arquivo_hash``) é o SHA-256 do tamanho, do ``mtime_ns`` e
+dos primeiros/últimos ``ASSINATURA_BYTES`` do arquivo: não relê o arquivo
+inteiro antes da importação. O SHA-256 completo do conteúdo é calculado
+pela própria leitura da importação e gravado no checkpoint ``importacao``;
+só o ``--resume`` relê o arquivo para conferi-lo antes de pular etapas.
+
+Etapas (``ETAPAS``):
+
+- ``preparacao``: schema, limpeza das tabelas e contexto do período;
+- ``importacao``: arquivo DETRAF em ``detraf_arquivo_batimento_avancado``;
+- ``matching``: candidatos, EOT de referência, classificação e perdidas em
+  ``detraf_processado_batimento_avancado`` (uma sessão só, por causa das
+  temporárias — não há ponto de retomada no meio);
+- ``resultado``: resultado materializado, view e resumo conferido;
+- ``exportacao``: CSVs.
+
+Antes de pular etapas, os contadores gravados são conferidos com as tabelas
+(linhas importadas/processadas) e o hash completo com o arquivo; se não
+baterem, as etapas afetadas são refeitas.
+Um run novo (sem ``--resume``) descarta os checkpoints anteriores, já que a
+preparação limpa as tabelas.
+"""
+
+import hashlib
+import json
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+from .log import info, ok, warn
+
+TABELA_CHECKPOINT = "detraf_checkpoint_batimento_avancado"
+ETAPAS = ("preparacao", "importacao", "matching", "resultado", "exportacao")
+ASSINATURA_BYTES = 4 * 1024 * 1024
+
+CREATE_CHECKPOINT = f"""
+CREATE TABLE IF NOT EXISTS {TABELA_CHECKPOINT} (
+    run_id VARCHAR(20) NOT NULL,
+    arquivo_hash CHAR(64) NOT NULL,
+    periodo CHAR(6) NOT NULL,
+    eot VARCHAR(10) NOT NULL,
+    etapa VARCHAR(20) NOT NULL,
+    detalhes TEXT NULL,
+    concluida_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (run_id, etapa),
+    INDEX idx_checkpoint_chave (arquivo_hash, periodo, eot, concluida_em)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+
+def assinatura_arquivo(caminho: str) -> str:
+    """SHA-256 de tamanho + ``mtime_ns`` + início e fim do arquivo (sem lê-lo inteiro)."""
+    p = Path(caminho)
+    st = p.stat()
+    h = hashlib.sha256(f"{st.st_size}:{st.st_mtime_ns}:".encode("ascii"))
+    with p.open("rb") as fh:
+        h.update(fh.read(ASSINATURA_BYTES))
+        if st.st_size > ASSINATURA_BYTES:
+            fh.seek(max(ASSINATURA_BYTES, st.st_size - ASSINATURA_BYTES))
+            h.update(fh.read(ASSINATURA_BYTES))
+    return h.hexdigest()
+
+
+def hash_conteudo(caminho: str) -> str:
+    """SHA-256 do conteúdo (descomprimido, se for o caso), como calculado na importação."""
+    from .reader import abrir_leitor
+    reader = abrir_leitor(caminho, calcular_hash=True)
+    for _ in reader.blocos():
+        pass
+    return reader.hexdigest()
+
+
+def _contar(cur, tabela: str) -> int:
+    cur.execute(f"SELECT COUNT(*) AS total FROM {tabela}")
+    row = cur.fetchone()
+    return int(row["total"] if isinstance(row, dict) else row[0])
+
+
+class Checkpoints:
+    """Etapas concluídas de um run (``run_id``) para a chave arquivo/período/EOT."""
+
+    def __init__(self, run_id: str, arquivo_hash: str, periodo: str, eot: str, concluidas: Optional[Dict[str, dict]] = None):
+        self.run_id = run_id
+        self.arquivo_hash = arquivo_hash
+        self.periodo = periodo
+        self.eot = eot
+        self.concluidas: Dict[str, dict] = concluidas or {}
+
+    @classmethod
+    def novo(cls, arquivo_hash: str, periodo: str, eot: str) -> "Checkpoints":
+        return cls(time.strftime("%Y%m%d%H%M%S"), arquivo_hash, periodo, eot)
+
+    @classmethod
+    def retomar(cls, cur, arquivo_hash: str, periodo: str, eot: str) -> Optional["Checkpoints"]:
+        """Último run com a mesma chave, com as etapas já conferidas contra as tabelas; None se não houver."""
+        cur.execute(CREATE_CHECKPOINT)
+        cur.execute(
+            f"""
+            SELECT run_id FROM {TABELA_CHECKPOINT}
+            WHERE arquivo_hash = %s AND periodo = %s AND eot = %s
+            ORDER BY concluida_em DESC, run_id DESC
+            LIMIT 1
+            """,
+            (arquivo_hash, periodo, eot),
+        )
+        row = cur.fetchone()
+        if not row:
+            return None
+        run_id = row["run_id"] if isinstance(row, dict) else row[0]
+        cur.execute(f"SELECT etapa, detalhes FROM {TABELA_CHECKPOINT} WHERE run_id = %s", (run_id,))
+        concluidas = {}
+        for r in cur.fetchall() or []:
+            etapa, detalhes = (r["etapa"], r["detalhes"]) if isinstance(r, dict) else (r[0], r[1])
+            try:
+                concluidas[etapa] = json.loads(detalhes) if detalhes else {}
+            except ValueError:
+                concluidas[etapa] = {}
+        ck = cls(run_id, arquivo_hash, periodo, eot, concluidas)
+        ck._conferir(cur)
+        return ck
+
+    def _conferir(self, cur) -> None:
+        """Descarta as etapas cujos contadores não batem mais com as tabelas (e todas as seguintes)."""
+        esperado = []
+        if self.concluida("importacao"):
+            esperado.append(("importacao", "detraf_arquivo_batimento_avancado", self.detalhes("importacao").get("inseridos")))
+        if self.concluida("matching"):
+            m = self.detalhes("matching")
+            if m.get("pares") is not None and m.get("perdidos") is not None:
+                esperado.append(("matching", "detraf_processado_batimento_avancado", m["pares"] + m["perdidos"]))
+        for etapa, tabela, total in esperado:
+            try:
+                atual = _contar(cur, tabela)
+            except Exception as ex:
+                atual = f"indisponível ({ex})"
+            if total is None or atual != total:
+                warn(f"Checkpoint '{etapa}' do run {self.run_id} não confere com {tabela} ({atual} x {total}); refazendo a partir dela.")
+                self.invalidar_desde(etapa)
+                return
+
+    def concluida(self, etapa: str) -> bool:
+        """Etapa concluída e todas as anteriores também (retomada só avança em ordem)."""
+        for e in ETAPAS:
+            if e not in self.concluidas:
+                return False
+            if e == etapa:
+                return True
+        return False
+
+    def proxima(self) -> Optional[str]:
+        """Primeira etapa ainda por fazer (None: run completo)."""
+        for e in ETAPAS:
+            if not self.concluida(e):
+                return e
+        return None
+
+    def detalhes(self, etapa: str) -> dict:
+        return self.concluidas.get(etapa) or {}
+
+    def invalidar_desde(self, etapa: str) -> None:
+        for e in ETAPAS[ETAPAS.index(etapa):]:
+            self.concluidas.pop(e, None)
+
+    def registrar(self, etapa: str, **detalhes) -> None:
+        """Grava a etapa como concluída; falhas viram aviso (o run segue sem checkpoint)."""
+        from .db import get_connection
+        self.concluidas[etapa] = detalhes
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                cur.execute(CREATE_CHECKPOINT)
+                if etapa == ETAPAS[0]:
+                    # Preparação limpou as tabelas: checkpoints de outros runs não valem mais
+                    cur.execute(f"DELETE FROM {TABELA_CHECKPOINT} WHERE run_id <> %s", (self.run_id,))
+                cur.execute(
+                    f"""
+                    INSERT INTO {TABELA_CHECKPOINT} (run_id, arquivo_hash, periodo, eot, etapa, detalhes)
+                    VALUES (%s, %s, %s, %s, %s, %s)
+                    ON DUPLICATE KEY UPDATE detalhes = VALUES(detalhes), concluida_em = CURRENT_TIMESTAMP
+                    """,
+                    (self.run_id, self.arquivo_hash, self.periodo, self.eot, etapa, json.dumps(detalhes, default=str)),
+                )
+        except Exception as ex:
+            warn(f"Não foi possível gravar o checkpoint '{etapa}': {ex}")
+
+    def pular(self, etapa: str) -> bool:
+        """True (e avisa) se a etapa já foi concluída neste run."""
+        if self.concluida(etapa):
+            ok(f"Etapa '{etapa}' já concluída no run {self.run_id}; pulando.")
+            return True
+        return False
+
+    def resumo(self) -> str:
+        feitas = [e for e in ETAPAS if self.concluida(e)]
+        return f"run {self.run_id}: concluídas [{', '.join(feitas) or '-'}] | próxima: {self.proxima() or '-'}"
+
+
+def abrir_checkpoints(arquivo: str, periodo: str, eot: str, retomar: bool) -> Checkpoints:
+    """Checkpoints do run atual: o último run com a mesma chave (``retomar``) ou um novo."""
+    from .db import get_connection
+    assinatura = assinatura_arquivo(arquivo)
+    if retomar:
+        try:
+            with get_connection() as conn, conn.cursor() as cur:
+                ck = Checkpoints.retomar(cur, assinatura, periodo, eot)
+        except Exception as ex:
+            warn(f"Checkpoints indisponíveis ({ex}); iniciando um run novo.")
+            ck = None
+        if ck is None:
+            warn("Nenhum run anterior com o mesmo arquivo/período/EOT; iniciando um run novo.")
+        elif ck.proxima() in (None, *ETAPAS[2:]):
+            esperado = ck.detalhes("importacao").get("sha256")
+            if esperado:
+                # Só na retomada: confere o conteúdo inteiro com o hash gravado pela importação
+                t0 = time.perf_counter()
+                atual = hash_conteudo(arquivo)
+                info(f"Hash do arquivo conferido: {atual[:16]}… ({time.perf_counter() - t0:.1f}s)")
+                if atual != esperado:
+                    warn(f"Conteúdo do arquivo difere do importado no run {ck.run_id}; recomeçando do zero.")
+                    return Checkpoints.novo(assinatura, periodo, eot)
+            ok(f"Retomando {ck.resumo()}")
+            return ck
+        else:
+            # Parou na preparação/importação: a importação parcial não é reaproveitável
+            warn(f"Run {ck.run_id} parou antes do fim da importação; recomeçando do zero.")
+    return Checkpoints.novo(assinatura, periodo, eot)
@@ -0,0 +1,449 @@
+from __future__ import annotations
+"""Classificação dos pares casados (Conferência/Erro) e observações.
+
+Dois caminhos com as mesmas regras:
+
+- ``classificar_python``: laço linha a linha sobre ``tmp_conf`` (caminho
+  original), com EOT de referência servido pelo ``EotResolver``;
+- ``classificar_sql``: as referências dos números distintos são gravadas em
+  tabelas de trabalho (``tmp_refa_*``/``tmp_refb_*``) e status/observação
+  saem de um único ``INSERT ... SELECT`` sobre ``tmp_conf``.
+
+``verificar_paridade`` recalcula o caminho Python em memória e compara com o
+que o caminho SQL gravou (``detraf run --classify sql --verify-parity``);
+com divergências o matching levanta ``ParidadeDivergente``.
+
+``gravar_referencias`` completa o processado com o EOT de referência de cada
+lado e sua origem (``numeros_portados``/``cadup``), lidos depois pelo
+``detalhado_*.csv`` sem novas consultas.
+"""
+
+from typing import Dict, List, Optional, Tuple
+
+from .log import info, ok, warn
+from .match_bisect import COLUNAS_CONF
+
+MODOS_CLASSIFICACAO = ("python", "sql")
+STAGE_BATCH = 1000
+
+class ParidadeDivergente(RuntimeError):
+    """Classificação SQL difere do caminho Python (``--verify-parity``)."""
+
+
+# Posição de cada coluna de ``tmp_conf`` (linhas lidas como tupla)
+_POSICAO_CONF = {c.strip(): i for i, c in enumerate(COLUNAS_CONF.split(","))}
+
+
+def _fmt_janela(port) -> str:
+    return port.strftime('%Y-%m-%d %H:%M:%S') if getattr(port, 'strftime', None) else (str(port) if port is not None else '')
+
+
+def classificar_python(rows, resolver, ref_ini, ref_fim, contadores: Optional[Dict[str, int]] = None) -> Tuple[List[tuple], List[dict]]:
+    """Classifica as linhas de ``tmp_conf`` em Python.
+
+    Retorna ``(ins, outdated)``: tuplas ``(detraf_id, cdr_id, status, observacao)``
+    e a lista de números desatualizados no CDR. ``contadores`` (se informado)
+    acumula ``recuperacao``: linhas marcadas com RECUPERACAO_DE_CONTA.
+    """
+    ins = []
+    outdated_seen = set()
+    outdated = []  # {'numero','eot_cdr','eot_correto','data_janela'}
+    for r in rows:
+        # acesso por chave ou índice
+        get = (lambda k: r[k]) if isinstance(r, dict) else (lambda k: r[_POSICAO_CONF[k]])
+        detraf_id = get('detraf_id'); cdr_id = get('cdr_id')
+        detraf_dt = get('detraf_dt'); disp = get('disposition')
+        eot_bat_a = get('eot_de_a'); eot_bat_b = get('eot_de_b')
+        cdr_src = str(get('cdr_src')); cdr_dst = str(get('cdr_dst'))
+        cdr_eot_a = (str(get('cdr_eot_a')) if get('cdr_eot_a') is not None else None)
+        cdr_eot_b = (str(get('cdr_eot_b')) if get('cdr_eot_b') is not None else None)
+        calldate = get('calldate')
+
+        # EOT de referência servido do cache do resolvedor (carregado em lote)
+        eot_ref_a, origem_a, port_a = resolver.resolve(cdr_src, calldate)
+        eot_ref_b, origem_b, port_b = resolver.resolve(cdr_dst, calldate)
+        if eot_ref_a is None:
+            eot_ref_a = cdr_eot_a
+        if eot_ref_b is None:
+            eot_ref_b = cdr_eot_b
+
+        # Coleta para relatório de desatualizados (independente de Operadora vs CDR, inclui não atendidas)
+        try:
+            if (eot_ref_a is not None and eot_ref_a != cdr_eot_a
+                and (port_a is None or (calldate and port_a <= calldate))):
+                key = (cdr_src, cdr_eot_a, eot_ref_a)
+                if key not in outdated_seen:
+                    outdated_seen.add(key)
+                    outdated.append({
+                        'numero': cdr_src,
+                        'eot_cdr': cdr_eot_a or '',
+                        'eot_correto': eot_ref_a or '',
+                        'data_janela': port_a.strftime('%Y-%m-%d %H:%M:%S') if getattr(port_a, 'strftime', None) else (str(port_a) if port_a is not None else ''),
+                    })
+            if (eot_ref_b is not None and eot_ref_b != cdr_eot_b
+                and (port_b is None or (calldate and port_b <= calldate))):
+                key = (cdr_dst, cdr_eot_b, eot_ref_b)
+                if key not in outdated_seen:
+                    outdated_seen.add(key)
+                    outdated.append({
+                        'numero': cdr_dst,
+                        'eot_cdr': cdr_eot_b or '',
+                        'eot_correto': eot_ref_b or '',
+                        'data_janela': port_b.strftime('%Y-%m-%d %H:%M:%S') if getattr(port_b, 'strftime', None) else (str(port_b) if port_b is not None else ''),
+                    })
+        except Exception:
+            # Não interrompe coleta por problemas pontuais de tipos
+            pass
+
+        # Portabilidade mais recente (independente da data) para contextualizar observação
+        np_a_eot, np_a_dt = resolver.portabilidade(cdr_src)
+        np_b_eot, np_b_dt = resolver.portabilidade(cdr_dst)
+
+        answered = (disp is None) or (str(disp).upper() == 'ANSWERED')
+        eot_ok = ( (eot_ref_a == eot_bat_a) and (eot_ref_b == eot_bat_b) )
+        status = 'Conferência' if (answered and eot_ok) else 'Erro'
+
+        obs_parts = []
+        if not answered:
+            obs_parts.append(f"CDR nao atendido (disposition={str(disp).upper()})")
+        # Só valida EOT quando a chamada foi atendida
+        if answered:
+            # Lado A: primeiro foco em Operadora vs CDR; depois nota adicional sobre nossa base
+            if eot_bat_a != cdr_eot_a:
+                # Caso especial: referência (NP/CADUP) difere do CDR no período → CDR desatualizado
+                if (eot_ref_a is not None and eot_ref_a != cdr_eot_a
+                    and (port_a is None or (detraf_dt and port_a <= detraf_dt))):
+                    when = ''
+                    if port_a:
+                        try:
+                            when = f" (portado em {port_a.strftime('%Y-%m-%d')})"
+                        except Exception:
+                            when = f" (portado em {port_a})"
+                    fonte = 'Números Portados' if (origem_a == 'numeros_portados') else 'CADUP'
+                    obs_parts.append(f"CDR desatualizado no período da chamada. EOT do CDR={cdr_eot_a or 'NULL'}; {fonte}={eot_ref_a}{when}")
+                    # Coleta para relatório de desatualizados (sem distinção A/B)
+                    key = (cdr_src, cdr_eot_a, eot_ref_a)
+                    if key not in outdated_seen:
+                        outdated_seen.add(key)
+                        outdated.append({
+                            'numero': cdr_src,
+                            'eot_cdr': cdr_eot_a or '',
+                            'eot_correto': eot_ref_a or '',
+                            'data_janela': port_a.strftime('%Y-%m-%d %H:%M:%S') if getattr(port_a, 'strftime', None) else (str(port_a) if port_a is not None else ''),
+                        })
+                else:
+                    # Mensagem padrão, sem listar todas as fontes
+                    obs_parts.append(f"EOT_A divergente entre operadora={eot_bat_a or 'NULL'} e CDR={cdr_eot_a or 'NULL'}")
+            else:
+                # Operadora e CDR batem; se nossa base diverge, informar (com 'desde' quando disponível)
+                try:
+                    if np_a_eot and np_a_eot != cdr_eot_a:
+                        if np_a_dt and detraf_dt and np_a_dt <= detraf_dt:
+                            when = np_a_dt.strftime('%Y-%m-%d') if hasattr(np_a_dt, 'strftime') else str(np_a_dt)
+                            obs_parts.append(f"EOT_A: Operadora e CDR concordam (= {cdr_eot_a}), porém nossa base (numeros_portados) indica {np_a_eot} desde {when}")
+                        elif np_a_dt is None:
+                            obs_parts.append(f"EOT_A: Operadora e CDR concordam (= {cdr_eot_a}), porém nossa base (numeros_portados) indica {np_a_eot}")
+                except Exception:
+                    pass
+            # Lado B
+            if eot_bat_b != cdr_eot_b:
+                # Caso especial: referência (NP/CADUP) difere do CDR no período → CDR desatualizado
+                if (eot_ref_b is not None and eot_ref_b != cdr_eot_b
+                    and (port_b is None or (detraf_dt and port_b <= detraf_dt))):
+                    when = ''
+                    if port_b:
+                        try:
+                            when = f" (portado em {port_b.strftime('%Y-%m-%d')})"
+                        except Exception:
+                            when = f" (portado em {port_b})"
+                    fonte = 'Números Portados' if (origem_b == 'numeros_portados') else 'CADUP'
+                    obs_parts.append(f"CDR desatualizado no período da chamada. EOT do CDR={cdr_eot_b or 'NULL'}; {fonte}={eot_ref_b}{when}")
+                    key = (cdr_dst, cdr_eot_b, eot_ref_b)
+                    if key not in outdated_seen:
+                        outdated_seen.add(key)
+                        outdated.append({
+                            'numero': cdr_dst,
+                            'eot_cdr': cdr_eot_b or '',
+                            'eot_correto': eot_ref_b or '',
+                            'data_janela': port_b.strftime('%Y-%m-%d %H:%M:%S') if getattr(port_b, 'strftime', None) else (str(port_b) if port_b is not None else ''),
+                        })
+                else:
+                    obs_parts.append(f"EOT_B divergente entre operadora={eot_bat_b or 'NULL'} e CDR={cdr_eot_b or 'NULL'}")
+            else:
+                try:
+                    if np_b_eot and np_b_eot != cdr_eot_b:
+                        if np_b_dt and detraf_dt and np_b_dt <= detraf_dt:
+                            when = np_b_dt.strftime('%Y-%m-%d') if hasattr(np_b_dt, 'strftime') else str(np_b_dt)
+                            obs_parts.append(f"EOT_B: Operadora e CDR concordam (= {cdr_eot_b}), porém nossa base (numeros_portados) indica {np_b_eot} desde {when}")
+                        elif np_b_dt is None:
+                            obs_parts.append(f"EOT_B: Operadora e CDR concordam (= {cdr_eot_b}), porém nossa base (numeros_portados) indica {np_b_eot}")
+                except Exception:
+                    pass
+        if ref_ini and ref_fim:
+            try:
+                if detraf_dt < ref_ini or detraf_dt > ref_fim:
+                    obs_parts.append('RECUPERACAO_DE_CONTA')
+                    if contadores is not None:
+                        contadores['recuperacao'] = contadores.get('recuperacao', 0) + 1
+            except Exception:
+                pass
+
+        observacao = ' | '.join([p for p in obs_parts if p]) or None
+        ins.append((detraf_id, cdr_id, status, observacao))
+
+    return ins, outdated
+
+
+# --- caminho SQL ---
+
+def _sql_lado(lado: str) -> str:
+    """Trecho da observação de um lado (A/B) para pares atendidos."""
+    L = lado.upper()
+    return f"""
+             CASE
+               WHEN NOT (eot_de_{lado} <=> cdr_eot_{lado}) THEN
+                 CASE
+                   WHEN ref_{lado}_res IS NOT NULL AND NOT (ref_{lado}_res <=> cdr_eot_{lado})
+                        AND (port_{lado} IS NULL OR port_{lado} <= detraf_dt)
+                     THEN CONCAT('CDR desatualizado no período da chamada. EOT do CDR=', COALESCE(NULLIF(cdr_eot_{lado}, ''), 'NULL'), '; ',
+                                 CASE WHEN origem_{lado} = 'numeros_portados' THEN 'Números Portados' ELSE 'CADUP' END,
+                                 '=', ref_{lado}_res,
+                                 CASE WHEN port_{lado} IS NOT NULL THEN CONCAT(' (portado em ', DATE_FORMAT(port_{lado}, '%%Y-%%m-%%d'), ')') ELSE '' END)
+                   ELSE CONCAT('EOT_{L} divergente entre operadora=', COALESCE(NULLIF(eot_de_{lado}, ''), 'NULL'),
+                               ' e CDR=', COALESCE(NULLIF(cdr_eot_{lado}, ''), 'NULL'))
+                 END
+               WHEN np_{lado}_eot IS NOT NULL AND np_{lado}_eot <> '' AND NOT (np_{lado}_eot <=> cdr_eot_{lado}) THEN
+                 CASE
+                   WHEN np_{lado}_dt IS NOT NULL AND np_{lado}_dt <= detraf_dt
+                     THEN CONCAT('EOT_{L}: Operadora e CDR concordam (= ', IFNULL(cdr_eot_{lado}, 'None'),
+                                 '), porém nossa base (numeros_portados) indica ', np_{lado}_eot,
+                                 ' desde ', DATE_FORMAT(np_{lado}_dt, '%%Y-%%m-%%d'))
+                   WHEN np_{lado}_dt IS NULL
+                     THEN CONCAT('EOT_{L}: Operadora e CDR concordam (= ', IFNULL(cdr_eot_{lado}, 'None'),
+                                 '), porém nossa base (numeros_portados) indica ', np_{lado}_eot)
+                 END
+             END"""
+
+
+_SQL_CLASSIFICAR = """
+INSERT INTO detraf_processado_batimento_avancado (detraf_id, cdr_id, status, observacao)
+SELECT detraf_id, cdr_id,
+       CASE WHEN answered AND (ref_a <=> eot_de_a) AND (ref_b <=> eot_de_b) THEN 'Conferência' ELSE 'Erro' END AS status,
+       NULLIF(CONCAT_WS(' | ',
+           CASE WHEN NOT answered THEN CONCAT('CDR nao atendido (disposition=', UPPER(disposition), ')') END,
+           CASE WHEN answered THEN {lado_a} END,
+           CASE WHEN answered THEN {lado_b} END,
+           CASE WHEN (detraf_dt < %s OR detraf_dt > %s) THEN 'RECUPERACAO_DE_CONTA' END
+       ), '') AS observacao
+FROM (
+    SELECT c.detraf_id, c.cdr_id, c.detraf_dt, c.eot_de_a, c.eot_de_b,
+           c.cdr_eot_a, c.cdr_eot_b, c.disposition,
+           (c.disposition IS NULL OR UPPER(c.disposition) = 'ANSWERED') AS answered,
+           ra.ref_eot AS ref_a_res, COALESCE(ra.ref_eot, c.cdr_eot_a) AS ref_a,
+           ra.ref_origem AS origem_a, ra.ref_port AS port_a, ra.np_eot AS np_a_eot, ra.np_dt AS np_a_dt,
+           rb.ref_eot AS ref_b_res, COALESCE(rb.ref_eot, c.cdr_eot_b) AS ref_b,
+           rb.ref_origem AS origem_b, rb.ref_port AS port_b, rb.np_eot AS np_b_eot, rb.np_dt AS np_b_dt
+    FROM {tmp_conf} c
+    LEFT JOIN {tmp_refa} ra ON ra.numero = c.cdr_src
+    LEFT JOIN {tmp_refb} rb ON rb.numero = c.cdr_dst
+) x
+"""
+
+# Desatualizados (por lado): referência resolvida difere do CDR e a portabilidade
+# já valia na chamada (calldate) ou, para atendidas divergentes da operadora, no DETRAF.
+_SQL_DESATUALIZADOS = """
+SELECT DISTINCT c.cdr_{col} AS numero, c.cdr_eot_{lado} AS eot_cdr, r.ref_eot AS eot_correto, r.ref_port AS data_janela
+FROM {tmp_conf} c
+JOIN {tmp_ref} r ON r.numero = c.cdr_{col}
+WHERE r.ref_eot IS NOT NULL
+  AND NOT (r.ref_eot <=> c.cdr_eot_{lado})
+  AND (r.ref_port IS NULL
+       OR r.ref_port <= c.calldate
+       OR ((c.disposition IS NULL OR UPPER(c.disposition) = 'ANSWERED')
+           AND NOT (c.eot_de_{lado} <=> c.cdr_eot_{lado})
+           AND r.ref_port <= c.detraf_dt))
+ORDER BY numero
+"""
+
+
+def _distintos(cur, tmp_conf: str, col: str) -> List[str]:
+    cur.execute(f"SELECT DISTINCT {col} AS numero FROM {tmp_conf}")
+    out = []
+    for row in cur.fetchall() or []:
+        v = row["numero"] if isinstance(row, dict) else row[0]
+        out.append(str(v))
+    return out
+
+
+def _stage_refs(cur, tabela: str, numeros: List[str], resolver) -> None:
+    """Grava (numero, referência, portabilidade) dos números distintos em ``tabela``."""
+    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {tabela}")
+    cur.execute(f"""
+        CREATE TEMPORARY TABLE {tabela} (
+            numero VARCHAR(32) NOT NULL PRIMARY KEY,
+            ref_eot VARCHAR(32) NULL,
+            ref_origem VARCHAR(20) NULL,
+            ref_port DATETIME NULL,
+            np_eot VARCHAR(32) NULL,
+            np_dt DATETIME NULL
+        )
+    """)
+    linhas = []
+    for numero in numeros:
+        eot_ref, origem, port = resolver.resolve(numero)
+        np_eot, np_dt = resolver.portabilidade(numero)
+        linhas.append((numero, eot_ref, origem, port, np_eot, np_dt))
+    sql = f"INSERT INTO {tabela} (numero, ref_eot, ref_origem, ref_port, np_eot, np_dt) VALUES (%s,%s,%s,%s,%s,%s)"
+    for i in range(0, len(linhas), STAGE_BATCH):
+        cur.executemany(sql, linhas[i:i + STAGE_BATCH])
+
+
+def classificar_sql(
+    cur, tmp_conf: str, resolver, ref_ini, ref_fim, runid: str, contadores: Optional[Dict[str, int]] = None,
+) -> Tuple[int, List[dict]]:
+    """Classifica ``tmp_conf`` com ``INSERT ... SELECT``. Retorna (linhas inseridas, desatualizados).
+
+    ``contadores`` (se informado) acumula ``recuperacao`` com o mesmo critério de
+    data usado na observação.
+    """
+    tmp_refa = f"tmp_refa_{runid}"
+    tmp_refb = f"tmp_refb_{runid}"
+    srcs = _distintos(cur, tmp_conf, "cdr_src")
+    dsts = _distintos(cur, tmp_conf, "cdr_dst")
+    resolver.carregar(srcs + dsts)
+    # Duas tabelas: o MySQL não reabre a mesma TEMPORARY duas vezes na mesma consulta
+    _stage_refs(cur, tmp_refa, srcs, resolver)
+    _stage_refs(cur, tmp_refb, dsts, resolver)
+    info(f"Referências de EOT preparadas: {len(srcs)} origens | {len(dsts)} destinos distintos")
+
+    ctx = (ref_ini, ref_fim) if (ref_ini and ref_fim) else (None, None)
+    cur.execute(
+        _SQL_CLASSIFICAR.format(lado_a=_sql_lado("a"), lado_b=_sql_lado("b"), tmp_conf=tmp_conf, tmp_refa=tmp_refa, tmp_refb=tmp_refb),
+        ctx,
+    )
+    inseridas = cur.rowcount or 0
+    if contadores is not None and ctx[0] is not None:
+        cur.execute(
+            f"SELECT COUNT(*) AS total FROM {tmp_conf} WHERE detraf_dt < %s OR detraf_dt > %s",
+            ctx,
+        )
+        row = cur.fetchone()
+        contadores['recuperacao'] = contadores.get('recuperacao', 0) + int(row["total"] if isinstance(row, dict) else row[0])
+
+    outdated: List[dict] = []
+    vistos = set()
+    for lado, col, tabela in (("a", "src", tmp_refa), ("b", "dst", tmp_refb)):
+        cur.execute(_SQL_DESATUALIZADOS.format(col=col, lado=lado, tmp_conf=tmp_conf, tmp_ref=tabela))
+        for row in cur.fetchall() or []:
+            if isinstance(row, dict):
+                numero, eot_cdr, eot_correto, port = row["numero"], row["eot_cdr"], row["eot_correto"], row["data_janela"]
+            else:
+                numero, eot_cdr, eot_correto, port = row
+            key = (numero, eot_cdr, eot_correto)
+            if key in vistos:
+                continue
+            vistos.add(key)
+            outdated.append({
+                'numero': numero,
+                'eot_cdr': eot_cdr or '',
+                'eot_correto': eot_correto or '',
+                'data_janela': _fmt_janela(port),
+            })
+    for tabela in (tmp_refa, tmp_refb):
+        cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {tabela}")
+    return inseridas, outdated
+
+
+_SQL_REF_LINHAS = """
+SELECT c.detraf_id, c.cdr_src, c.cdr_dst, d.a_num, d.b_num
+FROM {tmp_conf} c
+JOIN {tmp_detraf} d ON d.id = c.detraf_id
+"""
+
+_SQL_REF_UPDATE = """
+UPDATE detraf_processado_batimento_avancado p
+JOIN {tmp_ref} r ON r.detraf_id = p.detraf_id
+SET p.ref_eot_a = r.ref_eot_a, p.ref_eot_b = r.ref_eot_b,
+    p.ref_origem_a = r.ref_origem_a, p.ref_origem_b = r.ref_origem_b
+WHERE p.cdr_id IS NOT NULL
+"""
+
+
+def _referencia(resolver, numero, numero_detraf) -> Tuple[Optional[str], Optional[str]]:
+    """(eot, origem) do lado: ``resolve`` pelo número do CDR; sem EOT, CADUP pelo número do DETRAF."""
+    eot, origem, _ = resolver.resolve(str(numero)) if numero is not None else (None, None, None)
+    if not eot and numero_detraf:
+        eot, origem = resolver.cadup(str(numero_detraf))
+    return (eot, origem) if eot else (None, None)
+
+
+def gravar_referencias(cur, tmp_conf: str, tmp_detraf: str, resolver, runid: str) -> int:
+    """Grava ``ref_eot_a/b`` e ``ref_origem_a/b`` dos pares casados no processado.
+
+    Mesma regra que o detalhado aplicava na exportação; os números já estão no
+    cache do ``resolver`` após a classificação. Retorna as linhas com referência.
+    """
+    tmp_ref = f"tmp_ref_{runid}"
+    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {tmp_ref}")
+    cur.execute(f"""
+        CREATE TEMPORARY TABLE {tmp_ref} (
+            detraf_id BIGINT NOT NULL PRIMARY KEY,
+            ref_eot_a VARCHAR(32) NULL,
+            ref_eot_b VARCHAR(32) NULL,
+            ref_origem_a VARCHAR(20) NULL,
+            ref_origem_b VARCHAR(20) NULL
+        )
+    """)
+    cur.execute(_SQL_REF_LINHAS.format(tmp_conf=tmp_conf, tmp_detraf=tmp_detraf))
+    linhas = []
+    for row in cur.fetchall() or []:
+        if isinstance(row, dict):
+            detraf_id, src, dst, a_num, b_num = row["detraf_id"], row["cdr_src"], row["cdr_dst"], row["a_num"], row["b_num"]
+        else:
+            detraf_id, src, dst, a_num, b_num = row
+        eot_a, origem_a = _referencia(resolver, src, a_num)
+        eot_b, origem_b = _referencia(resolver, dst, b_num)
+        if eot_a or eot_b:
+            linhas.append((detraf_id, eot_a, eot_b, origem_a, origem_b))
+    sql = f"INSERT INTO {tmp_ref} (detraf_id, ref_eot_a, ref_eot_b, ref_origem_a, ref_origem_b) VALUES (%s,%s,%s,%s,%s)"
+    for i in range(0, len(linhas), STAGE_BATCH):
+        cur.executemany(sql, linhas[i:i + STAGE_BATCH])
+    if linhas:
+        cur.execute(_SQL_REF_UPDATE.format(tmp_ref=tmp_ref))
+    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {tmp_ref}")
+    ok(f"EOT de referência gravado no processado ({len(linhas)} pares com referência)")
+    return len(linhas)
+
+
+def verificar_paridade(cur, tmp_conf: str, resolver, ref_ini, ref_fim, outdated_sql: List[dict], amostras: int = 5) -> int:
+    """Compara o que o caminho SQL gravou com o caminho Python. Retorna o nº de divergências."""
+    cur.execute(f"SELECT {COLUNAS_CONF} FROM {tmp_conf}")
+    rows = cur.fetchall() or []
+    esperado, outdated_py = classificar_python(rows, resolver, ref_ini, ref_fim)
+    cur.execute(f"""
+        SELECT p.detraf_id, p.cdr_id, p.status, p.observacao
+        FROM detraf_processado_batimento_avancado p
+        JOIN {tmp_conf} c ON c.detraf_id = p.detraf_id AND c.cdr_id = p.cdr_id
+    """)
+    gravado: Dict[int, tuple] = {}
+    for row in cur.fetchall() or []:
+        t = (row["detraf_id"], row["cdr_id"], row["status"], row["observacao"]) if isinstance(row, dict) else tuple(row)
+        gravado[int(t[0])] = t
+    divergencias = 0
+    for t in esperado:
+        g = gravado.pop(int(t[0]), None)
+        if g is None or (g[2], g[3]) != (t[2], t[3]):
+            divergencias += 1
+            if divergencias <= amostras:
+                warn(f"Paridade: detraf_id={t[0]} python=({t[2]!r}, {t[3]!r}) sql={(g[2], g[3]) if g else None!r}")
+    divergencias += len(gravado)
+    chave = lambda d: (d['numero'], d['eot_cdr'], d['eot_correto'], d['data_janela'])
+    dif_outdated = {chave(d) for d in outdated_py} ^ {chave(d) for d in outdated_sql}
+    if dif_outdated:
+        warn(f"Paridade: {len(dif_outdated)} diferenças na lista de desatualizados")
+    total = divergencias + len(dif_outdated)
+    if total:
+        warn(f"Paridade SQL x Python: {total} divergências em {len(esperado)} linhas")
+    else:
+        ok(f"Paridade SQL x Python: {len(esperado)} linhas idênticas")
+    return total
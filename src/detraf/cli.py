@@ -9,8 +9,11 @@ from calendar import monthrange
 
 CONFIG_PATH = Path.home() / ".detraf_cli.json"
 from .env import CONFIGS_DIR
-from .normalizer import _resolve_eot  # para obter EOT de referência (numeros_portados/cadup)
-from .normalizer import _lookup_eot_cadup  # fallback direto para CADUP
+from .checkpoint import abrir_checkpoints
+from .classificacao import ParidadeDivergente
+from .db import PERFIL, POOL, get_connection
+from .perf import RELATORIO, etapa, imprimir_relatorio, salvar_relatorio
+from .resultado import TABELA_RESULTADO, TABELA_RESUMO, ResumoDivergente, linhas_por_status
 LAYOUT_YAML = str((CONFIGS_DIR / "detraf_layout.yaml").resolve())
 
 # ---------- util ----------
@@ -63,17 +66,7 @@ def month_window_yyyymm(yyyymm: str) -> tuple[str, str]:
 
 def truncate_tables_fallback() -> None:
     # Cria/garante as tabelas do batimento e limpa para novo processamento
-    import pymysql
-    params = dict(
-        host=os.getenv("DB_HOST","localhost"),
-        port=int(os.getenv("DB_PORT","3306")),
-        user=os.getenv("DB_USER","root"),
-        password=os.getenv("DB_PASSWORD",""),
-        database=os.getenv("DB_NAME",""),
-        autocommit=True,
-        cursorclass=pymysql.cursors.DictCursor,
-    )
-    conn = pymysql.connect(**params)
+    conn = get_connection()
     try:
         with conn.cursor() as cur:
             cur.execute(
@@ -93,7 +86,10 @@ def truncate_tables_fallback() -> None:
                     cnl_de_b VARCHAR(10),
                     area_local_de_b VARCHAR(10),
                     data_hora DATETIME,
-                    INDEX idx_detraf_data_hora (data_hora)
+                    a_num VARCHAR(32),
+                    b_num VARCHAR(32),
+                    INDEX idx_detraf_data_hora (data_hora),
+                    INDEX idx_detraf_match (a_num, b_num, data_hora)
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """
             )
@@ -105,6 +101,10 @@ def truncate_tables_fallback() -> None:
                     cdr_id BIGINT NULL,
                     status VARCHAR(20) NOT NULL,
                     observacao VARCHAR(255) NULL,
+                    ref_eot_a VARCHAR(32) NULL,
+                    ref_eot_b VARCHAR(32) NULL,
+                    ref_origem_a VARCHAR(20) NULL,
+                    ref_origem_b VARCHAR(20) NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
                     INDEX idx_detraf_id (detraf_id),
                     INDEX idx_cdr_id (cdr_id)
@@ -133,6 +133,12 @@ def truncate_tables_fallback() -> None:
                 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
                 """
             )
+            # Resultado materializado do batimento (lido pela view e pelos relatórios)
+            from .resultado import garantir_resultado
+            garantir_resultado(cur)
+            # Tabelas criadas por versões anteriores: adiciona colunas/índices novos
+            from .schema import atualizar_schema_avancado
+            atualizar_schema_avancado(cur)
             cur.execute(
                 """
                 INSERT IGNORE INTO codigo_erro_batimento_avancado (codigo, descricao, ativo) VALUES
@@ -150,25 +156,19 @@ def truncate_tables_fallback() -> None:
                 cur.execute("TRUNCATE TABLE detraf_context_batimento_avancado"); truncated.append("detraf_context_batimento_avancado")
             except Exception:
                 pass
+            for tabela in (TABELA_RESULTADO, TABELA_RESUMO):
+                try:
+                    cur.execute(f"TRUNCATE TABLE {tabela}"); truncated.append(tabela)
+                except Exception:
+                    pass
             ok(f"Truncadas: {', '.join(truncated)}")
             cur.execute("TRUNCATE TABLE detraf_context_batimento_avancado")
     finally:
         conn.close()
 
 def db_select_1() -> bool:
-    import pymysql
     try:
-        params = dict(
-            host=os.getenv("DB_HOST","localhost"),
-            port=int(os.getenv("DB_PORT","3306")),
-            user=os.getenv("DB_USER","root"),
-            # Correção: usar a mesma chave de senha usada no restante do projeto
-            password=os.getenv("DB_PASSWORD",""),
-            database=os.getenv("DB_NAME",""),
-            autocommit=True,
-            cursorclass=pymysql.cursors.DictCursor,
-        )
-        conn = pymysql.connect(**params)
+        conn = get_connection()
         try:
             with conn.cursor() as cur:
                 cur.execute("SELECT 1")
@@ -191,8 +191,33 @@ def cmd_db_check(_args: argparse.Namespace) -> int:
     err("Falha na conexão ao banco.")
     return 1
 
-def _export_csvs(periodo: str) -> None:
-    """Gera CSVs (batimento, detalhado, sintético) em build/.
+# Colunas dos relatórios lidas de detraf_resultado_batimento_avancado (mesmos nomes da view)
+_COLS_BATIMENTO = """
+    status AS STATUS,
+    diferenca_tempo,
+    DATE_FORMAT(data_hora, '%%Y-%%m-%%d %%H:%%i:%%s') AS Data_hora_batimento,
+    origem,
+    destino,
+    eot_a_batimento AS EOT_A_Batimento,
+    eot_b_batimento AS EOT_B_Batimento
+"""
+_COLS_DETALHADO = _COLS_BATIMENTO + """,
+    cdr_id AS id_cdr,
+    cdr_eot_a AS cdr_eot_A,
+    cdr_eot_b AS cdr_eot_B,
+    ref_eot_a AS ref_eot_A,
+    ref_eot_b AS ref_eot_B,
+    ref_origem_a AS ref_origem_A,
+    ref_origem_b AS ref_origem_B,
+    codigo_erro,
+    observacao
+"""
+
+# Linhas por bloco na exportação em streaming (memória limitada ao bloco atual)
+EXPORT_CHUNK = 5_000
+
+def _export_csvs(periodo: str) -> int:
+    """Gera CSVs (batimento, detalhado, sintético) em build/. Retorna as linhas do resultado exportadas.
 
     - batimento_<ts>.csv: colunas essenciais para cliente
     - detalhado_<ts>.csv: visão com campos técnicos e motivo
@@ -208,133 +233,78 @@ def _export_csvs(periodo: str) -> None:
     f_det = out_dir / f"detalhado_{ts}.csv"
     f_sin = out_dir / f"sintetico_{ts}.csv"
 
-    params = dict(
-        host=os.getenv("DB_HOST","localhost"),
-        port=int(os.getenv("DB_PORT","3306")),
-        user=os.getenv("DB_USER","root"),
-        password=os.getenv("DB_PASSWORD",""),
-        database=os.getenv("DB_NAME",""),
-        autocommit=True,
-        cursorclass=pymysql.cursors.DictCursor,
-    )
-    conn = pymysql.connect(**params)
+    # ss: leituras em streaming (SSDictCursor); cur: totais do sintético (após os streams)
+    conn = get_connection()
     try:
-        with conn.cursor() as cur:
+        with conn.cursor(pymysql.cursors.SSDictCursor) as ss, conn.cursor() as cur:
             # Batimento
-            cur.execute(
-                """
-                SELECT STATUS,
-                       diferenca_tempo,
-                       Data_hora_batimento,
-                       `origem batimento` AS origem,
-                       `destino batimento` AS destino,
-                       EOT_A_Batimento,
-                       EOT_B_Batimento
-                FROM detraf_batimento_avancado_vw
-                ORDER BY FIELD(STATUS,'Conferência','Erro','Perdido'), Data_hora_batimento, codigo_erro
-                """
-            )
-            rows = cur.fetchall()
-            if rows:
-                with f_bat.open("w", newline="", encoding="utf-8") as fh:
-                    w = csv.DictWriter(fh, fieldnames=list(rows[0].keys()))
-                    w.writeheader(); w.writerows(rows)
-                ok(f"CSV gerado: {f_bat} ({len(rows)} linhas)")
-
-            # Detalhado
-            cur.execute(
-                """
-                SELECT STATUS,
-                       diferenca_tempo,
-                       Data_hora_batimento,
-                       `origem batimento` AS origem,
-                       `destino batimento` AS destino,
-                       EOT_A_Batimento,
-                       EOT_B_Batimento,
-                       id_cdr,
-                       cdr_eot_A,
-                       cdr_eot_B,
-                       codigo_erro,
-                       observacao
-                FROM detraf_batimento_avancado_vw
-                ORDER BY FIELD(STATUS,'Conferência','Erro','Perdido'), Data_hora_batimento, codigo_erro
-                """
-            )
-            rows = cur.fetchall()
-            # Enriquecer com EOT de referência (numeros_portados/cadup) por lado A/B
-            if rows:
-                # Mapa de CDR para reduzir roundtrips (id -> (calldate, src, dst))
-                ids = [r["id_cdr"] for r in rows if r.get("id_cdr")]
-                cdr_map = {}
-                if ids:
-                    # fatiar para evitar IN muito grande
-                    for i in range(0, len(ids), 1000):
-                        chunk = ids[i:i+1000]
-                        fmt = ",".join(["%s"] * len(chunk))
-                        cur.execute(f"SELECT id, calldate, src, dst FROM cdr WHERE id IN ({fmt})", tuple(chunk))
-                        for rr in cur.fetchall():
-                            cid = rr["id"] if isinstance(rr, dict) else rr[0]
-                            calld = rr["calldate"] if isinstance(rr, dict) else rr[1]
-                            srcn = rr["src"] if isinstance(rr, dict) else rr[2]
-                            dstn = rr["dst"] if isinstance(rr, dict) else rr[3]
-                            cdr_map[int(cid)] = (calld, str(srcn), str(dstn))
-
-                # Computa ref_eot_A/B por linha
-                for r in rows:
-                    rid = r.get("id_cdr")
-                    ref_a = None; ref_b = None
-                    if rid and int(rid) in cdr_map:
-                        calld, srcn, dstn = cdr_map[int(rid)]
-                        ref_a, _, _ = _resolve_eot(cur, srcn, calld)
-                        ref_b, _, _ = _resolve_eot(cur, dstn, calld)
-                        # Fallback direto: se ainda não veio, tenta CADUP puro
-                        # Fallback CADUP usando os números do batimento (mais confiáveis para origem/destino)
-                        if not ref_a and r.get("origem"):
-                            ref_a, _ = _lookup_eot_cadup(cur, str(r.get("origem")))
-                        if not ref_b and r.get("destino"):
-                            ref_b, _ = _lookup_eot_cadup(cur, str(r.get("destino")))
-                    r["ref_eot_A"] = ref_a
-                    r["ref_eot_B"] = ref_b
-
-                with f_det.open("w", newline="", encoding="utf-8") as fh:
-                    # Ordem explícita de colunas
-                    fieldnames = [
-                        "STATUS","diferenca_tempo","Data_hora_batimento","origem","destino",
-                        "EOT_A_Batimento","EOT_B_Batimento","id_cdr","cdr_eot_A","cdr_eot_B",
-                        "ref_eot_A","ref_eot_B","codigo_erro","observacao"
-                    ]
-                    w = csv.DictWriter(fh, fieldnames=fieldnames)
-                    w.writeheader(); w.writerows(rows)
-                ok(f"CSV gerado: {f_det} ({len(rows)} linhas)")
+            total = 0
+            fh = None
+            try:
+                for r in linhas_por_status(ss, _COLS_BATIMENTO, EXPORT_CHUNK):
+                    if fh is None:
+                        fh = f_bat.open("w", newline="", encoding="utf-8")
+                        w = csv.DictWriter(fh, fieldnames=list(r.keys()))
+                        w.writeheader()
+                    w.writerow(r)
+                    total += 1
+            finally:
+                if fh is not None:
+                    fh.close()
+            if total:
+                ok(f"CSV gerado: {f_bat} ({total} linhas)")
+            exportadas = total
+
+            # Detalhado: EOT de referência (numeros_portados/cadup) e origem já gravados no matching
+            total = 0
+            fh = None
+            try:
+                for r in linhas_por_status(ss, _COLS_DETALHADO, EXPORT_CHUNK):
+                    if fh is None:
+                        fh = f_det.open("w", newline="", encoding="utf-8")
+                        # Ordem explícita de colunas
+                        fieldnames = [
+                            "STATUS","diferenca_tempo","Data_hora_batimento","origem","destino",
+                            "EOT_A_Batimento","EOT_B_Batimento","id_cdr","cdr_eot_A","cdr_eot_B",
+                            "ref_eot_A","ref_eot_B","ref_origem_A","ref_origem_B","codigo_erro","observacao"
+                        ]
+                        w = csv.DictWriter(fh, fieldnames=fieldnames)
+                        w.writeheader()
+                    w.writerow(r)
+                    total += 1
+            finally:
+                if fh is not None:
+                    fh.close()
+            if total:
+                ok(f"CSV gerado: {f_det} ({total} linhas)")
 
             # Sintético (organizado conforme solicitado)
             sintetico_rows: list[dict] = []
 
-            # Totais por categoria
+            # Totais lidos do resumo gravado no matching (detraf_resumo_batimento_avancado)
             cur.execute(
-                """
-                SELECT STATUS AS categoria, COUNT(*) AS total
-                FROM detraf_batimento_avancado_vw
-                GROUP BY STATUS
+                f"""
+                SELECT status AS categoria, SUM(total) AS total
+                FROM {TABELA_RESUMO}
+                GROUP BY status
                 """
             )
             cat_totais = {r["categoria"]: r["total"] for r in cur.fetchall()}
 
             # Total de erros
-            cur.execute("SELECT COUNT(*) AS total FROM detraf_batimento_avancado_vw WHERE STATUS='Erro'")
-            erros_total = int((cur.fetchone() or {}).get("total", 0))
+            erros_total = int(cat_totais.get("Erro", 0))
 
             # Erros por código (inclui códigos sem ocorrência = 0)
             cur.execute(
-                """
+                f"""
                 SELECT ce.codigo AS codigo_erro,
                        ce.descricao AS descricao,
                        COALESCE(cnt.total, 0) AS total
                 FROM codigo_erro_batimento_avancado ce
                 LEFT JOIN (
-                    SELECT codigo_erro, COUNT(*) AS total
-                    FROM detraf_batimento_avancado_vw
-                    WHERE STATUS = 'Erro'
+                    SELECT codigo_erro, SUM(total) AS total
+                    FROM {TABELA_RESUMO}
+                    WHERE status = 'Erro'
                     GROUP BY codigo_erro
                 ) cnt ON cnt.codigo_erro = ce.codigo
                 ORDER BY ce.codigo
@@ -343,13 +313,7 @@ def _export_csvs(periodo: str) -> None:
             erros = cur.fetchall()
 
             # Recuperação de conta (flag na observação)
-            cur.execute(
-                """
-                SELECT COUNT(*) AS total
-                FROM detraf_batimento_avancado_vw
-                WHERE observacao LIKE '%RECUPERACAO_DE_CONTA%'
-                """
-            )
+            cur.execute(f"SELECT COALESCE(SUM(total), 0) AS total FROM {TABELA_RESUMO} WHERE recuperacao_de_conta = 1")
             rec_count = int((cur.fetchone() or {}).get("total", 0))
 
             # Helper para capitalizar a primeira letra
@@ -399,6 +363,7 @@ def _export_csvs(periodo: str) -> None:
                 ok(f"CSV gerado: {f_sin} ({len(sintetico_rows)} linhas)")
     finally:
         conn.close()
+    return exportadas
 
 def cmd_db_config(_args: argparse.Namespace) -> int:
     print("\n-- CONFIGURAÇÃO DO BANCO")
@@ -439,10 +404,12 @@ def cmd_config(_args: argparse.Namespace) -> int:
     ok("Configuração básica concluída.")
     return 0
 
-def cmd_run(args: argparse.Namespace) -> int:
+def _cmd_run(args: argparse.Namespace) -> int:
     # 1) DB obrigatoriamente configurado (env ou cfg); senão encerra
     ensure_db_env_or_fail()
-    if not db_select_1():
+    with etapa("conexao"):
+        conectado = db_select_1()
+    if not conectado:
         err("Falha na conexão ao banco.")
         return 1
     ok("Conexão OK (SELECT 1 -> 1)")
@@ -453,9 +420,10 @@ def cmd_run(args: argparse.Namespace) -> int:
         # configurar durante a execução
         _ = cmd_config(args)
         cfg = load_cfg()
-    periodo = cfg.get("periodo")
-    eot = cfg.get("eot")
-    arquivo = cfg.get("arquivo")
+    # periodo/eot/arquivo no próprio args: definidos pelo ``detraf bench`` (cenário sintético)
+    periodo = getattr(args, "periodo", None) or cfg.get("periodo")
+    eot = getattr(args, "eot", None) or cfg.get("eot")
+    arquivo = getattr(args, "arquivo", None) or cfg.get("arquivo")
     if not (periodo and eot and arquivo):
         err("Variáveis ausentes. Rode: detraf config  ou use: detraf run --config")
         return 1
@@ -470,90 +438,435 @@ def cmd_run(args: argparse.Namespace) -> int:
     ok(f"janela_referencia_fim = {janela_fim}")
     ok("Regra: importar todas as linhas; fora do mês = RECUPERAÇÃO DE CONTA.")
 
-    # 4) Preparação de banco (truncate)
-    try:
-        # se existir util do projeto, usa; senão, fallback
-        try:
-            from .processing import truncate_tables  # type: ignore
-            truncate_tables()
-        except Exception:
-            truncate_tables_fallback()
-        # Logs de truncates são emitidos dentro do helper
-        # Salva contexto do período para a etapa de matching (usado pela view e classificações)
+    # 4) Checkpoints do run (chave: assinatura do arquivo + período + EOT); com --resume, retoma o último
+    if not Path(arquivo).is_file():
+        err(f"Arquivo DETRAF não encontrado: {arquivo}")
+        return 1
+    with etapa("checkpoint"):
+        ck = abrir_checkpoints(arquivo, periodo, eot, retomar=getattr(args, "resume", False))
+    if ck.proxima() is None:
+        ok(f"Run {ck.run_id} já concluído para este arquivo/período/EOT. Para regerar os CSVs: detraf report")
+        return 0
+    retomando = ck.concluida("importacao")
+
+    # 5) Preparação de banco (truncate)
+    if not ck.pular("preparacao"):
+        with etapa("preparacao"):
+            try:
+                # se existir util do projeto, usa; senão, fallback
+                try:
+                    from .processing import truncate_tables  # type: ignore
+                    truncate_tables()
+                except Exception:
+                    truncate_tables_fallback()
+                # Logs de truncates são emitidos dentro do helper
+                # Salva contexto do período para a etapa de matching (usado pela view e classificações)
+                try:
+                    with get_connection() as conn, conn.cursor() as cur:
+                        cur.execute(
+                            """
+                            CREATE TABLE IF NOT EXISTS detraf_context_batimento_avancado (
+                                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                                periodo CHAR(6) NOT NULL,
+                                ref_ini DATETIME NOT NULL,
+                                ref_fim DATETIME NOT NULL,
+                                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                            ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+                            """
+                        )
+                        cur.execute("TRUNCATE TABLE detraf_context_batimento_avancado")
+                        cur.execute(
+                            "INSERT INTO detraf_context_batimento_avancado (periodo, ref_ini, ref_fim) VALUES (%s,%s,%s)",
+                            (periodo, janela_ini, janela_fim),
+                        )
+                    ok("Contexto do período gravado.")
+                except Exception as ex:
+                    err(f"Falha ao salvar contexto do período: {ex}")
+                    return 1
+                ok("Preparação concluída.")
+            except Exception as ex:
+                err(f"Falha ao preparar o banco: {ex}")
+                return 1
+        ck.registrar("preparacao")
+
+    # 6) Importação DETRAF
+    if not ck.pular("importacao"):
+        ok("Iniciando importação do arquivo...")
         try:
-            import pymysql
-            params = dict(
-                host=os.getenv("DB_HOST","localhost"),
-                port=int(os.getenv("DB_PORT","3306")),
-                user=os.getenv("DB_USER","root"),
-                password=os.getenv("DB_PASSWORD",""),
-                database=os.getenv("DB_NAME",""),
-                autocommit=True,
-                cursorclass=pymysql.cursors.DictCursor,
-            )
-            conn = pymysql.connect(**params)
-            with conn.cursor() as cur:
-                cur.execute(
-                    """
-                    CREATE TABLE IF NOT EXISTS detraf_context_batimento_avancado (
-                        id BIGINT AUTO_INCREMENT PRIMARY KEY,
-                        periodo CHAR(6) NOT NULL,
-                        ref_ini DATETIME NOT NULL,
-                        ref_fim DATETIME NOT NULL,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
-                    """
-                )
-                cur.execute("TRUNCATE TABLE detraf_context_batimento_avancado")
-                cur.execute(
-                    "INSERT INTO detraf_context_batimento_avancado (periodo, ref_ini, ref_fim) VALUES (%s,%s,%s)",
-                    (periodo, janela_ini, janela_fim),
-                )
-            ok("Contexto do período gravado.")
+            from .import_detraf import importar_arquivo_txt
         except Exception as ex:
-            err(f"Falha ao salvar contexto do período: {ex}")
+            err(f"Falha ao carregar importação: {ex}")
             return 1
-        ok("Preparação concluída.")
+
+        with etapa("importacao") as e:
+            try:
+                resumo = importar_arquivo_txt(arquivo, periodo, eot, layout_path=LAYOUT_YAML, modo=args.import_mode, workers=args.workers)
+            except Exception as ex:
+                err(f"Falha na importação do arquivo: {ex}")
+                raise
+            e.linhas = resumo.get("inseridos")
+        if resumo.get("linhas_por_segundo") is not None:
+            ok(
+                f"Resumo importação: modo={resumo.get('modo')} | workers={resumo.get('workers', 1)} | inseridos={resumo['inseridos']} | "
+                f"duracao={resumo.get('duracao')}s | {resumo['linhas_por_segundo']:,.0f} linhas/s"
+            )
+        ck.registrar("importacao", inseridos=resumo.get("inseridos"), sha256=resumo.get("sha256"))
+        ok("Importação concluída.")
+
+    # 7) Matching, resultado (materialização/view/resumo) e exportação — delega ao projeto se existirem
+    try:
+        from .processing import processar_match  # type: ignore
+        from .resultado import finalizar_resultado
+    except Exception:
+        # Se o projeto não tiver essas rotinas, apenas finalizar.
+        ok("Pós-importação não encontrada no módulo. Fim da execução.")
+        return 0
+    try:
+        if not ck.pular("matching"):
+            if retomando:
+                # Matching interrompido pode ter deixado linhas gravadas (autocommit); recomeça limpo
+                with get_connection() as conn, conn.cursor() as cur:
+                    cur.execute("TRUNCATE TABLE detraf_processado_batimento_avancado")
+            ok("Iniciando matching...")
+            with etapa("matching"):
+                contagem = processar_match(
+                    rebuild_cdr=args.rebuild_cdr,
+                    engine=args.match_engine,
+                    shard=args.shard,
+                    match_workers=args.match_workers,
+                    rebuild_np=args.rebuild_np,
+                    classify=args.classify,
+                    verify_parity=args.verify_parity,
+                    cache_dir=getattr(args, "cache_dir", None),
+                    materializar=False,
+                )
+            if contagem is None:
+                err("Matching não concluído (veja os avisos acima). Corrija e rode: detraf run --resume")
+                return 1
+            ck.registrar("matching", **contagem)
+            ok("Matching concluído.")
+        if not ck.pular("resultado"):
+            m = ck.detalhes("matching")
+            with etapa("resultado") as e:
+                with get_connection() as conn, conn.cursor() as cur:
+                    # Resultado materializado, view e totais do sintético conferidos com os contadores do matching
+                    e.linhas = finalizar_resultado(cur, m["pares"], m["perdidos"], m.get("recuperacao"))
+            ck.registrar("resultado", linhas=e.linhas)
+        with etapa("exportacao") as e:
+            e.linhas = _export_csvs(periodo)
+        ck.registrar("exportacao", linhas=e.linhas)
+        ok("Processo finalizado.")
+    except (ResumoDivergente, ParidadeDivergente) as ex:
+        err(f"Execução interrompida: {ex}")
+        return 1
     except Exception as ex:
-        err(f"Falha ao preparar o banco: {ex}")
+        err(f"Execução interrompida: {ex}")
+        ok(f"Etapas concluídas ficam registradas ({ck.resumo()}); para retomar: detraf run --resume")
         return 1
+    return 0
 
-    # 5) Importação DETRAF
-    ok("Iniciando importação do arquivo...")
+def cmd_run(args: argparse.Namespace) -> int:
+    if getattr(args, "profile_sql", False):
+        # Antes de qualquer conexão: só as conexões abertas depois disso são perfiladas
+        PERFIL.ativar(args.profile_threshold)
+        ok(f"Perfil de SQL ligado (EXPLAIN a partir de {PERFIL.limiar:g}s)")
     try:
-        from .import_detraf import importar_arquivo_txt
+        return _cmd_run(args)
+    finally:
+        # Relatório de desempenho por etapa (JSON em var/logs/ + tabela no terminal)
+        RELATORIO.extras.update({"comando": "run", "conexoes": POOL.estatisticas()})
+        imprimir_relatorio()
+        ok(POOL.resumo())
+        path = salvar_relatorio()
+        if path:
+            ok(f"Relatório de desempenho: {path}")
+        if PERFIL.ativo:
+            PERFIL.imprimir()
+            path = PERFIL.salvar()
+            if path:
+                ok(f"Perfil de SQL: {path}")
+
+def cmd_report(_args: argparse.Namespace) -> int:
+    """Regera os CSVs a partir do resultado materializado, sem refazer importação/matching."""
+    ensure_db_env_or_fail()
+    cfg = load_cfg()
+    periodo = cfg.get("periodo")
+    if not periodo:
+        err("Período ausente. Rode: detraf config")
+        return 1
+    import pymysql
+    try:
+        conn = get_connection(cursorclass=pymysql.cursors.Cursor)
+        try:
+            with conn.cursor() as cur:
+                cur.execute(f"SELECT COUNT(*) FROM {TABELA_RESULTADO}")
+                total = int(cur.fetchone()[0])
+        finally:
+            conn.close()
     except Exception as ex:
-        err(f"Falha ao carregar importação: {ex}")
+        err(f"Resultado do batimento indisponível ({TABELA_RESULTADO}): {ex}")
+        return 1
+    if not total:
+        err(f"{TABELA_RESULTADO} está vazia. Rode: detraf run")
         return 1
+    ok(f"Resultado materializado: {total} linhas (periodo = {periodo})")
+    _export_csvs(periodo)
+    ok(POOL.resumo())
+    return 0
 
+def cmd_bench(args: argparse.Namespace) -> int:
+    """Gera o cenário sintético, carrega em um banco de benchmark, roda o pipeline e grava a baseline."""
+    import time
+    from . import __version__, bench
+    from .db import get_conn_params
     try:
-        _ = importar_arquivo_txt(arquivo, periodo, eot, layout_path=LAYOUT_YAML)
-    except Exception as ex:
-        err(f"Falha na importação do arquivo: {ex}")
-        raise
+        cenario = bench.Cenario(
+            linhas=args.rows,
+            periodo=args.period,
+            perda=args.loss_rate,
+            erro=args.error_rate,
+            codigos=[int(c) for c in args.error_codes.split(",") if c.strip()],
+            portabilidade=args.port_rate,
+            ruido=args.noise_rate,
+            semente=args.seed,
+        )
+    except ValueError as ex:
+        err(f"Cenário inválido: {ex}")
+        return 1
+    baseline = None
+    if args.compare:
+        try:
+            baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        except Exception as ex:
+            err(f"Baseline inválida ({args.compare}): {ex}")
+            return 1
+
+    with etapa("geracao") as e:
+        manifest = bench.gerar_cenario(cenario)
+        e.linhas = cenario.linhas
+    if args.generate_only:
+        ok(f"Cenário pronto: {manifest['pasta']}")
+        return 0
 
-    # 6) Próximas etapas (normalização/comparação) — delega ao projeto se existirem
+    ensure_db_env_or_fail()
+    banco = args.database or bench.BANCO_PADRAO
+    if banco == get_conn_params()["database"]:
+        err(f"O banco de benchmark não pode ser o banco configurado ({banco}). Use --database.")
+        return 1
+    if args.profile_sql:
+        PERFIL.ativar(args.profile_threshold)
+
+    pasta_run = Path(manifest["pasta"]) / f"run_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    db_anterior = os.environ.get("DB_NAME")
+    cwd = Path.cwd()
+    rc = 1
+    segundos_pipeline = None
     try:
-        from .processing import processar_match  # type: ignore
-        ok("Importação concluída. Iniciando matching...")
-        processar_match()
-        ok("Matching concluído.")
-        _export_csvs(periodo)
-        ok("Processo finalizado.")
-    except Exception:
-        # Se o projeto não tiver essas rotinas, apenas finalizar.
-        ok("Pós-importação não encontrada no módulo. Fim da execução.")
-    return 0
+        with etapa("carga_bases") as e:
+            e.linhas = sum(bench.preparar_banco(banco, manifest).values())
+        # Daqui em diante o pipeline inteiro enxerga só o banco de benchmark
+        os.environ["DB_NAME"] = banco
+        pasta_run.mkdir(parents=True, exist_ok=True)
+        os.chdir(pasta_run)  # CSVs (build/) ficam junto do cenário
+        run_args = argparse.Namespace(**vars(args))
+        run_args.config = False
+        run_args.rebuild_cdr = True  # partida a frio: mesma carga em todo bench
+        run_args.rebuild_np = True
+        run_args.verify_parity = False
+        run_args.periodo = cenario.periodo
+        run_args.eot = cenario.eot
+        run_args.arquivo = str(Path(manifest["pasta"]) / manifest["arquivos"]["detraf"])
+        run_args.cache_dir = pasta_run / "cache"
+        t0 = time.perf_counter()
+        rc = _cmd_run(run_args)
+        segundos_pipeline = time.perf_counter() - t0
+    except Exception as ex:
+        err(f"Falha no benchmark: {ex}")
+    finally:
+        os.chdir(cwd)
+        if db_anterior is None:
+            os.environ.pop("DB_NAME", None)
+        else:
+            os.environ["DB_NAME"] = db_anterior
+
+    obtido, divergencias = None, []
+    if rc == 0:
+        try:
+            obtido, divergencias = bench.conferir(banco, manifest["esperado"])
+        except Exception as ex:
+            divergencias = [f"resumo indisponível: {ex}"]
+    imprimir_relatorio()
+    relatorio = RELATORIO.como_dict()
+    dados = {
+        "versao": __version__,
+        "git": bench.revisao_git(),
+        "inicio": relatorio["inicio"],
+        "banco": banco,
+        "cenario": cenario.como_dict(),
+        "opcoes": {
+            k: getattr(args, k)
+            for k in ("import_mode", "workers", "match_engine", "classify", "shard", "match_workers")
+        },
+        "sucesso": rc == 0,
+        "esperado": manifest["esperado"],
+        "obtido": obtido,
+        "divergencias": divergencias,
+        "segundos_pipeline": round(segundos_pipeline, 3) if segundos_pipeline is not None else None,
+        "linhas_por_segundo": round(cenario.linhas / segundos_pipeline, 1) if segundos_pipeline else None,
+        "sql_total": relatorio["sql_total"],
+        "round_trips_total": relatorio["round_trips_total"],
+        "pico_rss_mb": relatorio["pico_rss_mb"],
+        "conexoes": POOL.estatisticas(),
+        "etapas": relatorio["etapas"],
+    }
+    path = bench.salvar_resultado(dados)
+    ok(f"Resultado do benchmark: {path}")
+    if PERFIL.ativo:
+        PERFIL.imprimir()
+        perfil = PERFIL.salvar()
+        if perfil:
+            ok(f"Perfil de SQL: {perfil}")
+
+    if rc != 0:
+        err("Pipeline do benchmark falhou; tempos registrados apenas até a falha.")
+        return 1
+    for d in divergencias:
+        err(f"Resultado diverge do cenário: {d}")
+    if not divergencias:
+        ok("Resultado confere com os totais esperados do cenário.")
+    if baseline is not None:
+        regressoes = bench.comparar(dados, baseline, args.tolerance)
+        for r in regressoes:
+            err(f"Regressão: {r}")
+        if regressoes:
+            return 1
+    return 1 if divergencias else 0
+
+def cmd_microbench(args: argparse.Namespace) -> int:
+    """Micro-benchmarks das funções por linha (parse/normalização), sem banco."""
+    from . import microbench
+    if args.inputs < 1 or args.repeat < 1:
+        err("--inputs e --repeat devem ser >= 1.")
+        return 1
+    baseline = None
+    if args.compare:
+        try:
+            baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        except Exception as ex:
+            err(f"Baseline inválida ({args.compare}): {ex}")
+            return 1
+    dados = microbench.executar(args.inputs, args.repeat, args.seed, args.filter)
+    if not dados["casos"]:
+        err(f"Nenhum caso corresponde ao filtro: {args.filter}")
+        return 1
+    regressoes = microbench.imprimir(dados, baseline, args.tolerance)
+    path = microbench.salvar(dados)
+    ok(f"Resultado dos micro-benchmarks: {path}")
+    for r in regressoes:
+        err(f"Regressão: {r}")
+    return 1 if regressoes else 0
 
 # ---------- parser ----------
+def _add_pipeline_args(p: argparse.ArgumentParser) -> None:
+    """Opções do pipeline comuns a ``run`` e ``bench``."""
+    p.add_argument(
+        "--import-mode", choices=["auto", "load-data", "executemany"], default="auto",
+        help="Gravação da importação: auto (LOAD DATA LOCAL INFILE, com fallback), load-data (sem fallback) ou executemany (padrão: auto)",
+    )
+    p.add_argument(
+        "--workers", type=int, default=1,
+        help="Processos de parse do arquivo DETRAF (1 = sequencial; 0 = todos os núcleos)",
+    )
+    p.add_argument(
+        "--match-engine", choices=["sql", "python"], default="sql",
+        help="Motor de matching: sql (ROW_NUMBER no banco) ou python (bisect em memória) (padrão: sql)",
+    )
+    p.add_argument(
+        "--classify", choices=["python", "sql"], default="python",
+        help="Classificação Conferência/Erro: python (linha a linha) ou sql (INSERT ... SELECT) (padrão: python)",
+    )
+    p.add_argument(
+        "--shard", choices=["none", "day", "hour"], default="none",
+        help="Divide o matching em fatias de tempo casadas em paralelo (padrão: none)",
+    )
+    p.add_argument(
+        "--match-workers", type=int, default=4,
+        help="Conexões simultâneas no matching fatiado (padrão: 4)",
+    )
+    p.add_argument(
+        "--profile-sql", action="store_true",
+        help="Registra duração/linhas de cada comando SQL e grava o ranking em var/logs/sql_<ts>.json",
+    )
+    p.add_argument(
+        "--profile-threshold", type=float, default=None, metavar="SEG",
+        help="Com --profile-sql, captura o EXPLAIN dos comandos a partir deste tempo (padrão: 1.0s)",
+    )
+
 def build_parser() -> argparse.ArgumentParser:
     p = argparse.ArgumentParser(prog="detraf", description="Ferramentas de importação e batimento DETRAF")
     sp = p.add_subparsers(dest="cmd", metavar="<comando>")
 
     run = sp.add_parser("run", help="Executa a importação e o batimento completo")
     run.add_argument("--config", action="store_true", help="Configurar variáveis (período/EOT/arquivo) durante a execução")
+    run.add_argument(
+        "--rebuild-cdr", action="store_true",
+        help="Recarrega do zero a cópia normalizada do CDR (cdr_batimento_avancado)",
+    )
+    run.add_argument(
+        "--rebuild-np", action="store_true",
+        help="Refaz do zero o snapshot local de numeros_portados (var/cache)",
+    )
+    run.add_argument(
+        "--verify-parity", action="store_true",
+        help="Com --classify sql, recalcula a classificação em Python; divergências encerram o run com erro",
+    )
+    run.add_argument(
+        "--resume", action="store_true",
+        help="Retoma o último run do mesmo arquivo/período/EOT, pulando as etapas já concluídas",
+    )
+    _add_pipeline_args(run)
     run.set_defaults(func=cmd_run)
 
+    bench = sp.add_parser("bench", help="Benchmark ponta a ponta com dados sintéticos em um banco separado")
+    bench.add_argument("--rows", type=int, default=100_000, help="Linhas do DETRAF sintético (padrão: 100000)")
+    bench.add_argument("--period", default="202501", metavar="YYYYMM", help="Período do cenário (padrão: 202501)")
+    bench.add_argument("--loss-rate", type=float, default=0.10, help="Fração de linhas sem CDR / Perdido (padrão: 0.10)")
+    bench.add_argument("--error-rate", type=float, default=0.10, help="Fração das linhas casadas com erro (padrão: 0.10)")
+    bench.add_argument(
+        "--error-codes", default="1,2,3,5",
+        help="Códigos sorteados entre as linhas com erro (padrão: 1,2,3,5)",
+    )
+    bench.add_argument("--port-rate", type=float, default=0.05, help="Fração dos números com portabilidade (padrão: 0.05)")
+    bench.add_argument("--noise-rate", type=float, default=0.20, help="Linhas extras no CDR por linha do DETRAF (padrão: 0.20)")
+    bench.add_argument("--seed", type=int, default=42, help="Semente do gerador (padrão: 42)")
+    bench.add_argument(
+        "--database", default=None,
+        help="Banco de benchmark, criado se preciso (padrão: detraf_bench); nunca o banco configurado",
+    )
+    bench.add_argument("--generate-only", action="store_true", help="Apenas gera os arquivos do cenário (sem banco)")
+    bench.add_argument("--compare", metavar="JSON", help="Compara com uma baseline (var/bench/bench_<ts>.json)")
+    bench.add_argument(
+        "--tolerance", type=float, default=0.10,
+        help="Piora tolerada por etapa na comparação (padrão: 0.10 = 10%%)",
+    )
+    _add_pipeline_args(bench)
+    bench.set_defaults(func=cmd_bench)
+
+    micro = sp.add_parser("microbench", help="Micro-benchmarks do parse/normalização por linha (sem banco)")
+    micro.add_argument("--inputs", type=int, default=20_000, help="Entradas geradas por caso (padrão: 20000)")
+    micro.add_argument("--repeat", type=int, default=5, help="Passadas por caso; vale a mais rápida (padrão: 5)")
+    micro.add_argument("--seed", type=int, default=42, help="Semente do gerador de entradas (padrão: 42)")
+    micro.add_argument("--filter", default=None, help="Roda apenas os casos cujo nome contém o texto")
+    micro.add_argument("--compare", metavar="JSON", help="Compara com uma baseline (var/bench/micro_<ts>.json)")
+    micro.add_argument(
+        "--tolerance", type=float, default=0.15,
+        help="Piora tolerada em ns/op na comparação (padrão: 0.15 = 15%%)",
+    )
+    micro.set_defaults(func=cmd_microbench)
+
+    rep = sp.add_parser("report", help="Regera os CSVs a partir do último batimento (sem reprocessar)")
+    rep.set_defaults(func=cmd_report)
+
     cfg = sp.add_parser("config", help="Configura período, EOT e caminho do arquivo DETRAF")
     cfg.set_defaults(func=cmd_config)
 
@@ -571,7 +884,10 @@ def main(argv=None) -> int:
     if not hasattr(args, "func"):
         parser.print_help()
         return 2
-    return args.func(args)
+    try:
+        return args.func(args)
+    finally:
+        POOL.fechar()
 
 def app() -> int:
     return main()
@@ -1,9 +1,46 @@
 
 from __future__ import annotations
+"""Conexões com o banco.
+
+``get_connection`` entrega conexões de um pool do processo (``POOL``): ao
+``close()`` (ou ao sair do ``with``) a conexão volta para o pool e é
+reaproveitada pela próxima etapa, evitando um novo handshake — relevante em
+bancos remotos via VPN. Conexões ociosas há mais de ``PING_APOS_SEG`` passam
+por ``ping`` antes do reuso (substituídas por uma nova se o servidor as
+derrubou), e toda sessão nova executa ``SESSION_INIT`` (``DB_SESSION_INIT``
+no ambiente/.env substitui o padrão).
+
+As conexões abertas aqui são instrumentadas por ``perf.instrumentar``
+(comandos SQL e round trips por etapa do relatório de desempenho).
+
+Com o perfil de SQL ligado (``PERFIL.ativar()``, ``detraf run --profile-sql``)
+os cursores dessas conexões registram cada ``execute``/``executemany``
+(duração, linhas, fingerprint do comando); comandos acima do limiar têm o
+``EXPLAIN`` capturado e ``PERFIL.salvar()`` grava o ranking em
+``var/logs/sql_<ts>.json``.
+"""
+
+import json
 import os
+import re
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
 import pymysql
 from .env import load_env
-from .log import ok, err
+from .log import info, ok, err, warn
+from .perf import LOGS_DIR, instrumentar
+
+# Ajustes de sessão aplicados em toda conexão nova (e a cada reconexão)
+SESSION_INIT = "SET SESSION net_read_timeout = 600, net_write_timeout = 600"
+POOL_MAX_OCIOSAS = 8
+PING_APOS_SEG = 30.0
+# Perfil de SQL: comandos a partir deste tempo têm o EXPLAIN capturado
+PERFIL_LIMIAR_SEG = 1.0
+PERFIL_TOP = 10
 
 def is_db_configured() -> bool:
     env = load_env()
@@ -23,25 +60,393 @@ def get_conn_params() -> dict:
     user = os.environ.get("DB_USER", env.get("DB_USER", ""))
     password = os.environ.get("DB_PASSWORD", env.get("DB_PASSWORD", ""))
     database = os.environ.get("DB_NAME", env.get("DB_NAME", ""))
+    init = os.environ.get("DB_SESSION_INIT", env.get("DB_SESSION_INIT", SESSION_INIT))
     return {
         "host": host,
         "port": int(port),
         "user": user,
         "password": password,
         "database": database,
+        "charset": "utf8mb4",
+        "init_command": init or None,
         "autocommit": True,
         "cursorclass": pymysql.cursors.DictCursor,
     }
 
 
-def get_connection():
-    """Conveniência para ``pymysql.connect`` usando ``get_conn_params``."""
-    return pymysql.connect(**get_conn_params())
+# Opções que valem por uso (aplicadas a cada retirada); as demais definem a sessão
+_POR_USO = ("autocommit", "cursorclass")
+
+
+class _ConexaoPool:
+    """Conexão emprestada do pool: delega tudo à ``pymysql`` e devolve no ``close()``."""
+
+    def __init__(self, pool: "ConnectionPool", chave: tuple, conn):
+        self._pool = pool
+        self._chave = chave
+        self._conn = conn
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self) -> None:
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool._devolver(self._chave, conn)
+
+    @property
+    def open(self) -> bool:
+        return self._conn is not None and self._conn.open
+
+
+class ConnectionPool:
+    """Pool de conexões do processo, separado pelos parâmetros de sessão.
+
+    Contadores: ``abertas`` (handshakes), ``reutilizadas`` (retiradas servidas
+    por conexão ociosa), ``reconexoes`` (ociosas que falharam no ping e foram
+    substituídas) e
+    ``descartadas`` (conexões fechadas por falha ou excesso de ociosas).
+    """
+
+    def __init__(self, max_ociosas: int = POOL_MAX_OCIOSAS, ping_apos: float = PING_APOS_SEG):
+        self.max_ociosas = max_ociosas
+        self.ping_apos = ping_apos
+        self._ociosas: Dict[tuple, List[Tuple[object, float]]] = {}
+        self._lock = threading.Lock()
+        self.abertas = 0
+        self.reutilizadas = 0
+        self.reconexoes = 0
+        self.descartadas = 0
+
+    def obter(self, **overrides) -> _ConexaoPool:
+        params = get_conn_params()
+        params.update(overrides)
+        sessao = {k: v for k, v in params.items() if k not in _POR_USO}
+        chave = tuple(sorted((k, repr(v)) for k, v in sessao.items()))
+        while True:
+            with self._lock:
+                fila = self._ociosas.get(chave)
+                item = fila.pop() if fila else None
+            if item is None:
+                conn = instrumentar(pymysql.connect(**params))
+                if PERFIL.ativo:
+                    PERFIL.instrumentar(conn)
+                with self._lock:
+                    self.abertas += 1
+                return _ConexaoPool(self, chave, conn)
+            conn, desde = item
+            if time.monotonic() - desde >= self.ping_apos:
+                try:
+                    conn.ping(reconnect=False)
+                except Exception:
+                    # Sessão derrubada pelo servidor (timeout/VPN): descarta e segue para outra/nova
+                    self._fechar(conn)
+                    with self._lock:
+                        self.reconexoes += 1
+                    continue
+            conn.cursorclass = params["cursorclass"]
+            conn.autocommit(params["autocommit"])
+            with self._lock:
+                self.reutilizadas += 1
+            return _ConexaoPool(self, chave, conn)
+
+    def _devolver(self, chave: tuple, conn) -> None:
+        resultado = getattr(conn, "_result", None)
+        if not conn.open or (resultado is not None and getattr(resultado, "unbuffered_active", False)):
+            # Stream (SSCursor) não consumido ou conexão caída: não volta ao pool
+            self._fechar(conn)
+            return
+        try:
+            if not conn.get_autocommit():
+                conn.rollback()
+        except Exception:
+            self._fechar(conn)
+            return
+        with self._lock:
+            fila = self._ociosas.setdefault(chave, [])
+            if len(fila) < self.max_ociosas:
+                fila.append((conn, time.monotonic()))
+                return
+        self._fechar(conn)
+
+    def _fechar(self, conn) -> None:
+        with self._lock:
+            self.descartadas += 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def fechar(self) -> None:
+        """Fecha as conexões ociosas (fim do processo)."""
+        with self._lock:
+            filas, self._ociosas = self._ociosas, {}
+        for fila in filas.values():
+            for conn, _ in fila:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+    def estatisticas(self) -> Dict[str, int]:
+        return {
+            "abertas": self.abertas,
+            "reutilizadas": self.reutilizadas,
+            "reconexoes": self.reconexoes,
+            "descartadas": self.descartadas,
+        }
+
+    def resumo(self) -> str:
+        return (
+            f"Conexões ao banco: {self.abertas} abertas | {self.reutilizadas} reutilizadas"
+            f" | {self.reconexoes} reconexões | {self.descartadas} descartadas"
+        )
+
+
+# ---------- perfil de SQL ----------
+_RE_COMENTARIO = re.compile(r"/\*.*?\*/|--[^\n]*", re.S)
+_RE_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.)*\"")
+_RE_NUMERO = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_RE_SUFIXO_RUN = re.compile(r"(?<=[A-Za-z])_\d+\b")  # tmp_conf_<runid>, fatias _<n>
+_RE_LISTA = re.compile(r"\(\s*\?(?:\s*,\s*\?)*\s*\)")
+_RE_LISTAS = re.compile(r"\(\.\.\.\)(?:\s*,\s*\(\.\.\.\))+")
+_RE_EXPLICAVEL = re.compile(r"^\s*(SELECT|WITH|INSERT|REPLACE|UPDATE|DELETE)\b", re.I)
+_RE_CREATE_SELECT = re.compile(r"^\s*CREATE\b[^;]*?\b(SELECT\b.*)$", re.I | re.S)
+
+
+def fingerprint(sql) -> str:
+    """Forma normalizada do comando: literais e ``%s`` viram ``?``, listas
+    ``IN (...)``/``VALUES (...)`` colapsam e o sufixo de run das temporárias vira ``_N``."""
+    if isinstance(sql, (bytes, bytearray)):
+        sql = bytes(sql).decode("utf-8", "replace")
+    s = _RE_COMENTARIO.sub(" ", sql)
+    s = _RE_STRING.sub("?", s)
+    s = s.replace("%s", "?")
+    s = _RE_NUMERO.sub("?", s)
+    s = _RE_SUFIXO_RUN.sub("_N", s)
+    s = " ".join(s.split())
+    s = _RE_LISTA.sub("(...)", s)
+    s = _RE_LISTAS.sub("(...)", s)
+    return s
+
+
+def _sql_explain(sql) -> Optional[str]:
+    """Comando a passar para ``EXPLAIN`` (DML direto; ``CREATE ... SELECT`` pelo SELECT)."""
+    if not isinstance(sql, str):
+        return None
+    if _RE_EXPLICAVEL.match(sql):
+        return sql
+    m = _RE_CREATE_SELECT.match(sql)
+    return m.group(1) if m else None
+
+
+def _json_valor(v):
+    return v if v is None or isinstance(v, (str, int, float, bool)) else str(v)
+
+
+class _Comando:
+    def __init__(self, fingerprint: str, exemplo: str):
+        self.fingerprint = fingerprint
+        self.exemplo = exemplo
+        self.execucoes = 0
+        self.segundos = 0.0
+        self.max_segundos = 0.0
+        self.linhas = 0
+        self.erros = 0
+        self.explain: Optional[List[dict]] = None
+
+    def como_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "execucoes": self.execucoes,
+            "segundos": round(self.segundos, 4),
+            "media_segundos": round(self.segundos / self.execucoes, 4) if self.execucoes else None,
+            "max_segundos": round(self.max_segundos, 4),
+            "linhas": self.linhas,
+            "erros": self.erros,
+            "exemplo": self.exemplo,
+            "explain": self.explain,
+        }
+
+
+class PerfilSQL:
+    """Perfil por comando SQL (opt-in) dos cursores das conexões do pool.
+
+    Cada ``execute``/``executemany`` soma duração, linhas (``rowcount``) e
+    erros ao fingerprint do comando; os lotes internos do ``executemany``
+    contam como uma execução. Na primeira vez que um fingerprint passa de
+    ``limiar`` segundos, o ``EXPLAIN`` roda na mesma conexão (enxerga as
+    temporárias da sessão). Cursores de servidor (``SSCursor``) medem só o
+    tempo até a primeira linha e não têm ``EXPLAIN`` (a conexão está ocupada
+    com o streaming).
+    """
+
+    def __init__(self, limiar: float = PERFIL_LIMIAR_SEG):
+        self.ativo = False
+        self.limiar = limiar
+        self.inicio = datetime.now()
+        self.comandos: Dict[str, _Comando] = {}
+        self._lock = threading.Lock()
+
+    def ativar(self, limiar: Optional[float] = None) -> None:
+        """Liga o perfil; vale para as conexões abertas a partir daqui."""
+        if limiar is not None:
+            self.limiar = limiar
+        self.ativo = True
+        self.inicio = datetime.now()
+
+    def instrumentar(self, conn):
+        """Faz ``conn.cursor()`` devolver cursores perfilados."""
+        cursor = conn.cursor
+
+        def _cursor(cursor_cls=None):
+            cur = cursor(cursor_cls)
+            self._perfilar(cur, cursor)
+            return cur
+
+        conn.cursor = _cursor
+        return conn
+
+    def _perfilar(self, cur, cursor_factory) -> None:
+        execute = cur.execute
+        executemany = cur.executemany
+        em_lote = [False]
+        servidor = isinstance(cur, pymysql.cursors.SSCursor)
+
+        def _execute(query, args=None):
+            if em_lote[0]:
+                return execute(query, args)
+            t0 = time.perf_counter()
+            falhou = True
+            try:
+                r = execute(query, args)
+                falhou = False
+                return r
+            finally:
+                self._registrar(cur, cursor_factory, query, args, time.perf_counter() - t0, falhou, servidor)
+
+        def _executemany(query, args):
+            t0 = time.perf_counter()
+            falhou = True
+            em_lote[0] = True
+            try:
+                r = executemany(query, args)
+                falhou = False
+                return r
+            finally:
+                em_lote[0] = False
+                # EXPLAIN não se aplica a lotes (um comando por conjunto de argumentos)
+                self._registrar(cur, None, query, None, time.perf_counter() - t0, falhou, servidor)
+
+        cur.execute = _execute
+        cur.executemany = _executemany
+
+    def _registrar(self, cur, cursor_factory, query, args, segundos: float, falhou: bool, servidor: bool) -> None:
+        try:
+            fp = fingerprint(query)
+        except Exception:
+            return
+        linhas = None if (servidor or falhou) else cur.rowcount
+        with self._lock:
+            c = self.comandos.get(fp)
+            if c is None:
+                exemplo = query if isinstance(query, str) else "<bytes>"
+                c = self.comandos[fp] = _Comando(fp, " ".join(exemplo.split())[:2000])
+            c.execucoes += 1
+            c.segundos += segundos
+            c.max_segundos = max(c.max_segundos, segundos)
+            if linhas is not None and linhas >= 0:
+                c.linhas += linhas
+            if falhou:
+                c.erros += 1
+            precisa_explain = (
+                not falhou and not servidor and cursor_factory is not None
+                and segundos >= self.limiar and c.explain is None
+            )
+            if precisa_explain:
+                c.explain = []  # reserva: um EXPLAIN por fingerprint
+        if precisa_explain:
+            c.explain = self._explain(cursor_factory, query, args)
+
+    @staticmethod
+    def _explain(cursor_factory, query, args) -> List[dict]:
+        sql = _sql_explain(query)
+        if sql is None:
+            return [{"explain": "não aplicável ao comando"}]
+        try:
+            with cursor_factory(pymysql.cursors.DictCursor) as cur:
+                cur.execute("EXPLAIN " + sql, args)
+                return [{k: _json_valor(v) for k, v in row.items()} for row in cur.fetchall() or []]
+        except Exception as ex:
+            return [{"explain": f"falhou: {ex}"}]
+
+    def ranking(self) -> List[_Comando]:
+        """Comandos em ordem decrescente de tempo total."""
+        with self._lock:
+            return sorted(self.comandos.values(), key=lambda c: c.segundos, reverse=True)
+
+    def salvar(self, pasta: Path = LOGS_DIR) -> Optional[Path]:
+        try:
+            ranking = self.ranking()
+            total = sum(c.segundos for c in ranking)
+            dados = {
+                "inicio": self.inicio.strftime("%Y-%m-%d %H:%M:%S"),
+                "limiar_explain_segundos": self.limiar,
+                "comandos_distintos": len(ranking),
+                "execucoes": sum(c.execucoes for c in ranking),
+                "segundos_total": round(total, 3),
+                "ranking": [
+                    {"posicao": i, "percentual": round(100 * c.segundos / total, 1) if total else None, **c.como_dict()}
+                    for i, c in enumerate(ranking, 1)
+                ],
+            }
+            pasta.mkdir(parents=True, exist_ok=True)
+            path = pasta / f"sql_{self.inicio.strftime('%Y%m%d_%H%M%S')}.json"
+            path.write_text(json.dumps(dados, ensure_ascii=False, indent=2), encoding="utf-8")
+            return path
+        except Exception as ex:
+            warn(f"Não foi possível gravar o perfil de SQL: {ex}")
+            return None
+
+    def imprimir(self, top: int = PERFIL_TOP) -> None:
+        ranking = self.ranking()
+        if not ranking:
+            return
+        total = sum(c.segundos for c in ranking)
+        info(f"Comandos SQL mais lentos (top {min(top, len(ranking))} de {len(ranking)} por tempo total):")
+        for i, c in enumerate(ranking[:top], 1):
+            pct = 100 * c.segundos / total if total else 0.0
+            marca = " [EXPLAIN]" if c.explain else ""
+            texto = c.fingerprint if len(c.fingerprint) <= 100 else c.fingerprint[:97] + "..."
+            print(
+                f"{i:>3}. {c.segundos:>9.2f}s {pct:>5.1f}% | {c.execucoes:>6}x | máx {c.max_segundos:.2f}s"
+                f" | {c.linhas} linhas{marca}\n     {texto}"
+            )
+
+
+PERFIL = PerfilSQL()
+POOL = ConnectionPool()
+
+
+def get_connection(**overrides):
+    """Conexão do pool com os parâmetros de ``get_conn_params``.
+
+    ``overrides`` permite ajustar opções pontuais (ex.: ``local_infile=True``).
+    ``close()``/saída do ``with`` devolvem a conexão ao pool.
+    """
+    return POOL.obter(**overrides)
+
 
 
-def get_conn():
+def get_conn(**overrides):
     """Factory compatível com ``import_detraf_fw`` (nome legado)."""
-    return get_connection()
+    return get_connection(**overrides)
 
 def test_connection() -> bool:
     try:
@@ -14,14 +14,24 @@ def _parse_env_line(line: str):
     key, _, val = line.strip().partition("=")
     return key.strip(), val.strip()
 
+# Último .env lido: (mtime, valores); relido só quando o arquivo muda
+_CACHE: Optional[tuple] = None
+
 def load_env() -> Dict[str, str]:
+    global _CACHE
+    try:
+        mtime = ENV_PATH.stat().st_mtime_ns
+    except OSError:
+        return {}
+    if _CACHE is not None and _CACHE[0] == mtime:
+        return dict(_CACHE[1])
     d: Dict[str, str] = {}
-    if ENV_PATH.exists():
-        for line in ENV_PATH.read_text(encoding="utf-8").splitlines():
-            k, v = _parse_env_line(line)
-            if k:
-                d[k] = v
-    return d
+    for line in ENV_PATH.read_text(encoding="utf-8").splitlines():
+        k, v = _parse_env_line(line)
+        if k:
+            d[k] = v
+    _CACHE = (mtime, d)
+    return dict(d)
 
 def save_env(updated: Dict[str, str]) -> None:
     CONFIGS_DIR.mkdir(parents=True, exist_ok=True)
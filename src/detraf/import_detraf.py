@@ -15,24 +15,22 @@ def _warn(msg: str) -> None:
 def _err(msg: str) -> None:
     print(f"{_ts()} ERRO {msg}")
 
-def _count_lines(p: Path) -> int:
-    # Contagem simples e eficiente
-    total = 0
-    with p.open("rb") as fh:
-        for _ in fh:
-            total += 1
-    return total
-
-def importar_arquivo_txt(caminho: str, periodo: str, eot: str, layout_path: str = LAYOUT_DEFAULT) -> dict:
+def importar_arquivo_txt(caminho: str, periodo: str, eot: str, layout_path: str = LAYOUT_DEFAULT, modo: str = "auto", workers: int = 1) -> dict:
     """
     Importa o arquivo DETRAF (layout fixo) para a tabela
     detraf_arquivo_batimento_avancado via rotina fixowidth.
+    ``modo`` escolhe a gravação: 'auto' (LOAD DATA LOCAL INFILE quando o
+    servidor permite, senão executemany), 'load-data' (falha se o servidor
+    não aceitar LOCAL INFILE) ou 'executemany'.
+    ``workers`` > 1 ativa o parse paralelo (0 = todos os núcleos).
+    Arquivos gzip/bz2/xz/zip são detectados e descomprimidos em streaming.
     Retorna um resumo no formato:
       {
         "total": int,
         "inseridos": int,
         "ignorados_inconsistentes": int,
         "duracao": float (opcional),
+        "linhas_por_segundo": float (opcional),
         ...
       }
     """
@@ -44,7 +42,10 @@ def importar_arquivo_txt(caminho: str, periodo: str, eot: str, layout_path: str
     if not ly.exists() or not ly.is_file():
         raise FileNotFoundError(f"Layout não encontrado: {layout_path}")
 
-    total = _count_lines(p)
+    from .reader import detectar_compressao
+    compressao = detectar_compressao(p)
+    if compressao:
+        _ok(f"Arquivo comprimido detectado ({compressao}); importando sem descompactar em disco.")
 
     # Importer oficial (fixowidth)
     from .import_detraf_fw import importar_fixowidth_para_detraf
@@ -52,14 +53,14 @@ def importar_arquivo_txt(caminho: str, periodo: str, eot: str, layout_path: str
     # Tenta com (caminho, layout, periodo, eot); se não for suportado, faz fallback (caminho, layout)
     resumo: dict
     try:
-        resumo = importar_fixowidth_para_detraf(str(p), str(ly), periodo, eot)  # assinatura nova
+        resumo = importar_fixowidth_para_detraf(str(p), str(ly), periodo, eot, modo=modo, workers=workers)  # assinatura nova
     except TypeError:
         _warn("Rotina fixowidth não aceita periodo/eot; usando assinatura antiga (caminho, layout).")
         resumo = importar_fixowidth_para_detraf(str(p), str(ly))  # assinatura antiga
 
-    # Normaliza chaves do resumo
+    # Normaliza chaves do resumo (o total de linhas vem da própria passada de leitura)
     if "total" not in resumo:
-        resumo["total"] = total
+        resumo["total"] = resumo.get("lidas", 0)
     # compatibilidade com possíveis nomes
     inseridos = (
         resumo.get("inseridos")
@@ -76,5 +77,6 @@ def importar_arquivo_txt(caminho: str, periodo: str, eot: str, layout_path: str
         or 0
     )
     resumo["ignorados_inconsistentes"] = int(ignorados)
+    resumo.setdefault("compressao", compressao)
 
     return resumo
@@ -1,6 +1,7 @@
 from __future__ import annotations
 from pathlib import Path
 from typing import List, Dict, Any, Tuple
+import os
 import time
 import yaml
 import re
@@ -24,22 +25,35 @@ def _err(msg: str) -> None:
 # ----------------------------------------------------------------------
 # DB
 # ----------------------------------------------------------------------
-def _get_conn_cursor():
+def _get_conn_cursor(**overrides):
     """
     Tenta obter conexão com detraf.db.get_conn() ou detraf.db.get_connection().
+    ``overrides`` é repassado à factory (ex.: ``local_infile=True``).
     Retorna (conn, cur).
     """
     from . import db as dbmod  # import lazy
     conn = None
     if hasattr(dbmod, "get_conn"):
-        conn = dbmod.get_conn()
+        conn = dbmod.get_conn(**overrides)
     elif hasattr(dbmod, "get_connection"):
-        conn = dbmod.get_connection()
+        conn = dbmod.get_connection(**overrides)
     if conn is None:
         raise RuntimeError("Não foi possível obter conexão (get_conn/get_connection ausentes).")
     cur = conn.cursor()
     return conn, cur
 
+def _local_infile_enabled(cur) -> bool:
+    """Indica se o servidor aceita ``LOAD DATA LOCAL INFILE`` (variável ``local_infile``)."""
+    try:
+        cur.execute("SHOW VARIABLES LIKE 'local_infile'")
+        row = cur.fetchone()
+    except Exception:
+        return False
+    if not row:
+        return False
+    val = row["Value"] if isinstance(row, dict) else row[1]
+    return str(val).upper() in ("ON", "1")
+
 # ----------------------------------------------------------------------
 # Layout
 # ----------------------------------------------------------------------
@@ -70,13 +84,6 @@ def _load_layout(layout_path: str) -> List[Dict[str, Any]]:
 # ----------------------------------------------------------------------
 # Helpers de parse/validação
 # ----------------------------------------------------------------------
-def _count_lines(path: Path) -> int:
-    total = 0
-    with path.open("rb") as fh:
-        for _ in fh:
-            total += 1
-    return total
-
 def _slice_fields(line: str, fields: List[Dict[str, Any]]) -> Dict[str, str]:
     rec: Dict[str, str] = {}
     for f in fields:
@@ -105,12 +112,54 @@ def _is_valid_time6(s: str) -> bool:
     s = s or ""
     return len(s) == 6 and s.isdigit() and s[:2] < "24" and s[2:4] < "60" and s[4:6] < "60"
 
+# Cache de datas YYYYMMDD já validadas (um arquivo tem poucas datas distintas)
+_DATAS_VALIDAS: Dict[str, bool] = {}
+
+def _data_hora(data_str: str | None, hora_str: str | None) -> str | None:
+    """Calcula ``data_hora`` no cliente ('YYYY-MM-DD HH:MM:SS').
+
+    Equivale a ``STR_TO_DATE(CONCAT(data, ' ', hora), '%Y%m%d %H%i%s')``:
+    retorna None quando a data/hora é ausente ou inválida (ex.: 20250231).
+    """
+    if not data_str or not hora_str:
+        return None
+    ok_data = _DATAS_VALIDAS.get(data_str)
+    if ok_data is None:
+        try:
+            datetime(int(data_str[:4]), int(data_str[4:6]), int(data_str[6:8]))
+            ok_data = True
+        except ValueError:
+            ok_data = False
+        _DATAS_VALIDAS[data_str] = ok_data
+    if not ok_data:
+        return None
+    return f"{data_str[:4]}-{data_str[4:6]}-{data_str[6:8]} {hora_str[:2]}:{hora_str[2:4]}:{hora_str[4:6]}"
+
 # ----------------------------------------------------------------------
 # Progresso
 # ----------------------------------------------------------------------
-def _progress(curr: int, total: int, started_at: float, every: int = 0) -> None:
-    """Log de progresso silencioso (simplificado). Mantido para compatibilidade."""
-    return
+_ultimo_pct = 0
+
+def _progress(curr: int, total: int, started_at: float, every: int = 10) -> None:
+    """
+    Log de progresso por bytes lidos: emite uma linha a cada ``every``% do
+    arquivo. ``curr == 0`` reinicia o acompanhamento.
+    """
+    global _ultimo_pct
+    if curr <= 0:
+        _ultimo_pct = 0
+        return
+    if total <= 0:
+        return
+    pct = min(100, curr * 100 // total)
+    marco = pct - pct % every
+    if marco <= _ultimo_pct:
+        return
+    _ultimo_pct = marco
+    elapsed = time.perf_counter() - started_at
+    mb = curr / (1024 * 1024)
+    rate = mb / elapsed if elapsed > 0 else 0.0
+    _ok(f"Importação {marco}% | {mb:,.1f}/{total / (1024 * 1024):,.1f} MB | {rate:,.1f} MB/s")
 
 # ----------------------------------------------------------------------
 # INSERT SQL (colunas compatíveis com o schema do projeto)
@@ -121,19 +170,356 @@ INSERT INTO detraf_arquivo_batimento_avancado (
     eot, sequencial, assinante_a_numero, eot_de_a, cnl_de_a, area_local_de_a,
     data_da_chamada, hora_de_atendimento,
     assinante_b_numero, eot_de_b, cnl_de_b, area_local_de_b,
+    a_num, b_num,
     data_hora
 ) VALUES (
     %s, %s, %s, %s, %s, %s,
     %s, %s,
     %s, %s, %s, %s,
+    %s, %s,
     STR_TO_DATE(CONCAT(%s, ' ', %s), '%%Y%%m%%d %%H%%i%%s')
 )
 """
 
+# ----------------------------------------------------------------------
+# LOAD DATA LOCAL INFILE (data_hora já calculada no cliente)
+#  - Arquivo temporário TSV; NULL representado por \N
+# ----------------------------------------------------------------------
+_SQL_LOAD_DATA = """
+LOAD DATA LOCAL INFILE %s
+INTO TABLE detraf_arquivo_batimento_avancado
+CHARACTER SET utf8mb4
+FIELDS TERMINATED BY '\\t' ESCAPED BY '\\\\'
+LINES TERMINATED BY '\\n'
+(
+    eot, sequencial, assinante_a_numero, eot_de_a, cnl_de_a, area_local_de_a,
+    data_da_chamada, hora_de_atendimento,
+    assinante_b_numero, eot_de_b, cnl_de_b, area_local_de_b,
+    a_num, b_num,
+    data_hora
+)
+"""
+
+_TSV_ESCAPE = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r", "\0": "\\0"})
+
+def _tsv_value(v: Any) -> str:
+    if v is None:
+        return "\\N"
+    return str(v).translate(_TSV_ESCAPE)
+
+def _tsv_line(row: Tuple[Any, ...]) -> str:
+    """Linha TSV para o LOAD DATA (troca data_str/hora_str por data_hora)."""
+    *cols, data_str, hora_str = row
+    cols.append(_data_hora(data_str, hora_str))
+    return "\t".join([_tsv_value(v) for v in cols]) + "\n"
+
+MODOS_IMPORTACAO = ("auto", "load-data", "executemany")
+
+# ----------------------------------------------------------------------
+# Parser compilado do layout (hot path por linha)
+#  - Lê a linha em bytes e fatia apenas as colunas usadas no INSERT
+#  - Remove não dígitos com bytes.translate (tabela pré-computada)
+#  - Retorna tupla pronta para o writer
+#  - Cache por hash do arquivo de layout
+# ----------------------------------------------------------------------
+_NAO_DIGITOS = bytes(c for c in range(256) if not 48 <= c <= 57)
+
+_PARSER_CACHE: Dict[str, Any] = {}
+
+def _build_parser(fields: List[Dict[str, Any]]):
+    """
+    Gera ``parse(line: bytes, eot_ctx: str) -> tuple`` com as colunas do
+    INSERT: (eot, sequencial, ..., area_local_de_b, a_num, b_num, data_str, hora_str).
+    ``a_num``/``b_num`` são os números já normalizados para o matching
+    (mesma regra de corte 12/13 dígitos aplicada antes em SQL).
+    Campos ausentes no layout resultam em string vazia (como ``rec.get(..., "")``).
+    """
+    pos = {f["name"]: slice(f["slice_start"], f["slice_start"] + f["length"]) for f in fields}
+    vazio = slice(0, 0)
+    s_seq = pos.get("sequencial", vazio)
+    s_a = pos.get("assinante_a", vazio)
+    s_eot_a = pos.get("eot_de_a", vazio)
+    s_cnl_a = pos.get("cnl_de_a", vazio)
+    s_area_a = pos.get("area_local_de_a", vazio)
+    s_data = pos.get("data_da_chamada", vazio)
+    s_hora = pos.get("hora_de_atendimento", vazio)
+    s_b = pos.get("assinante_b", vazio)
+    s_eot_b = pos.get("eot_de_b", vazio)
+    s_cnl_b = pos.get("cnl_de_b", vazio)
+    s_area_b = pos.get("area_local_de_b", vazio)
+    nd = _NAO_DIGITOS
+    valid_date8 = _is_valid_date8
+    valid_time6 = _is_valid_time6
+
+    def _num(raw: bytes) -> str:
+        # Equivalente a _strip_csp_prefix(_clean_num(...))
+        d = raw.translate(None, nd)
+        if len(d) in (12, 13):
+            d = d[2:]
+        return d.decode("ascii")
+
+    def parse(line: bytes, eot_ctx: str) -> Tuple[Any, ...]:
+        seq = line[s_seq].translate(None, nd)
+        data = line[s_data].strip().decode("utf-8", "replace")
+        hora = line[s_hora].strip().decode("utf-8", "replace")
+        a = _num(line[s_a])
+        b = _num(line[s_b])
+        return (
+            eot_ctx,
+            int(seq) if seq else None,
+            a,
+            line[s_eot_a].strip().decode("utf-8", "replace"),
+            line[s_cnl_a].strip().decode("utf-8", "replace"),
+            line[s_area_a].strip().decode("utf-8", "replace"),
+            data,
+            hora,
+            b,
+            line[s_eot_b].strip().decode("utf-8", "replace"),
+            line[s_cnl_b].strip().decode("utf-8", "replace"),
+            line[s_area_b].strip().decode("utf-8", "replace"),
+            # Normalização para matching (a view/matching liam isso via REGEXP_REPLACE)
+            a[2:] if len(a) in (12, 13) else a,
+            b[2:] if len(b) in (12, 13) else b,
+            # Sanitização de data/hora: inválidos viram None (NULL no banco)
+            data if valid_date8(data) else None,
+            hora if valid_time6(hora) else None,
+        )
+
+    return parse
+
+def _compile_layout(layout_path: str):
+    """Carrega o layout via ``_load_layout`` e devolve o parser compilado (cache por hash do YAML)."""
+    import hashlib
+    p = Path(layout_path)
+    if not p.exists() or not p.is_file():
+        raise FileNotFoundError(f"Layout não encontrado: {layout_path}")
+    key = hashlib.sha1(p.read_bytes()).hexdigest()
+    parser = _PARSER_CACHE.get(key)
+    if parser is None:
+        parser = _build_parser(_load_layout(layout_path))
+        _PARSER_CACHE[key] = parser
+    return parser
+
+# ----------------------------------------------------------------------
+# Gravação: executemany (fallback) ou LOAD DATA LOCAL INFILE (bulk)
+# ----------------------------------------------------------------------
+class _ExecutemanyWriter:
+    """Envia lotes de ``BATCH_SIZE`` linhas via ``executemany`` (STR_TO_DATE no servidor)."""
+
+    modo = "executemany"
+    formato_bloco = "rows"
+    BATCH_SIZE = 1000
+
+    def __init__(self, conn, cur):
+        self.conn = conn
+        self.cur = cur
+        self.batch: List[Tuple[Any, ...]] = []
+        self.inseridos = 0
+
+    def write(self, row: Tuple[Any, ...]) -> None:
+        self.batch.append(row)
+        if len(self.batch) >= self.BATCH_SIZE:
+            self.flush()
+
+    def write_block(self, rows: List[Tuple[Any, ...]], n: int) -> None:
+        """Recebe um bloco já parseado (modo paralelo), mantendo lotes de ``BATCH_SIZE``."""
+        for i in range(0, n, self.BATCH_SIZE):
+            self.batch.extend(rows[i:i + self.BATCH_SIZE])
+            if len(self.batch) >= self.BATCH_SIZE:
+                self.flush()
+
+    def flush(self) -> None:
+        if self.batch:
+            self.cur.executemany(_SQL_INSERT, self.batch)
+            # Contabiliza pelo que enviamos (independe de rowcount)
+            self.inseridos += len(self.batch)
+            self.batch.clear()
+
+    def close(self) -> None:
+        self.flush()
+
+    def abort(self) -> None:
+        self.batch.clear()
+
+
+class _LoadDataWriter:
+    """
+    Grava as linhas num TSV temporário (data_hora calculada no cliente) e
+    carrega com ``LOAD DATA LOCAL INFILE`` a cada ``BULK_ROWS`` linhas,
+    limitando o espaço em disco do temporário.
+    """
+
+    modo = "load-data"
+    formato_bloco = "tsv"
+    BULK_ROWS = 500_000
+
+    def __init__(self, conn, cur):
+        import tempfile
+        from .env import ROOT
+        self.conn = conn
+        self.cur = cur
+        tmp_dir = ROOT / "var" / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, name = tempfile.mkstemp(prefix="detraf_load_", suffix=".tsv", dir=str(tmp_dir))
+        self.path = Path(name)
+        self.fh = open(fd, "w", encoding="utf-8", newline="\n")
+        self.pendentes = 0
+        self.inseridos = 0
+
+    def write(self, row: Tuple[Any, ...]) -> None:
+        self.fh.write(_tsv_line(row))
+        self.pendentes += 1
+        if self.pendentes >= self.BULK_ROWS:
+            self.flush()
+
+    def write_block(self, text: str, n: int) -> None:
+        """Recebe um bloco TSV já formatado pelos workers (modo paralelo)."""
+        self.fh.write(text)
+        self.pendentes += n
+        if self.pendentes >= self.BULK_ROWS:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.pendentes:
+            return
+        self.fh.flush()
+        self.cur.execute(_SQL_LOAD_DATA, (str(self.path),))
+        self.inseridos += self.pendentes
+        self.pendentes = 0
+        self.fh.seek(0)
+        self.fh.truncate()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+        finally:
+            self.abort()
+
+    def abort(self) -> None:
+        if not self.fh.closed:
+            self.fh.close()
+        try:
+            self.path.unlink()
+        except OSError:
+            pass
+
+
+def _open_writer(modo: str):
+    """
+    Abre conexão e escolhe o writer conforme ``modo``:
+    - 'executemany': sempre lotes via executemany
+    - 'auto': LOAD DATA LOCAL INFILE se o servidor permitir
+      (``local_infile=ON``); senão, fallback para executemany.
+    - 'load-data': exige LOAD DATA LOCAL INFILE; com ``local_infile=OFF``
+      levanta ``RuntimeError`` em vez de trocar de modo.
+    """
+    if modo not in MODOS_IMPORTACAO:
+        raise ValueError(f"Modo de importação inválido: {modo} (use {', '.join(MODOS_IMPORTACAO)})")
+    if modo != "executemany":
+        conn, cur = _get_conn_cursor(local_infile=True)
+        if _local_infile_enabled(cur):
+            return _LoadDataWriter(conn, cur)
+        if modo == "load-data":
+            try:
+                cur.close()
+            finally:
+                conn.close()
+            raise RuntimeError(
+                "Servidor com local_infile desabilitado: --import-mode load-data não pode ser usado "
+                "(habilite local_infile ou use --import-mode auto/executemany)."
+            )
+        _warn("Servidor com local_infile desabilitado; usando executemany.")
+        return _ExecutemanyWriter(conn, cur)
+    conn, cur = _get_conn_cursor()
+    return _ExecutemanyWriter(conn, cur)
+
+# ----------------------------------------------------------------------
+# Parse paralelo (faixas de bytes alinhadas em quebra de linha)
+# ----------------------------------------------------------------------
+RANGE_BYTES = 16 * 1024 * 1024
+
+def _split_ranges(path: Path, range_bytes: int = RANGE_BYTES) -> List[Tuple[int, int]]:
+    """
+    Divide o arquivo em faixas [inicio, fim) de ~``range_bytes`` cujo fim
+    coincide com o byte seguinte a uma quebra de linha (ou EOF), na ordem do arquivo.
+    """
+    size = path.stat().st_size
+    ranges: List[Tuple[int, int]] = []
+    with path.open("rb") as fh:
+        inicio = 0
+        while inicio < size:
+            fim = inicio + range_bytes
+            if fim >= size:
+                fim = size
+            else:
+                fh.seek(fim)
+                resto = fh.readline()
+                fim += len(resto)
+            ranges.append((inicio, fim))
+            inicio = fim
+    return ranges
+
+def _parse_range(caminho: str, layout_path: str, inicio: int, fim: int, eot_ctx: str, formato: str) -> Tuple[int, Any]:
+    """
+    Worker: parseia as linhas da faixa e devolve (n_linhas, bloco), onde o
+    bloco é uma lista de tuplas ('rows') ou texto TSV pronto ('tsv').
+    """
+    parse = _compile_layout(layout_path)
+    with open(caminho, "rb") as fh:
+        fh.seek(inicio)
+        data = fh.read(fim - inicio)
+    lines = data.split(b"\n")
+    if lines and lines[-1] == b"":
+        lines.pop()
+    rows = [parse(line, eot_ctx) for line in lines]
+    if formato == "tsv":
+        return len(rows), "".join([_tsv_line(r) for r in rows])
+    return len(rows), rows
+
+def _importar_paralelo(p: Path, layout_path: str, eot_ctx: str, writer, workers: int, t0: float) -> int:
+    """
+    Distribui as faixas entre ``workers`` processos e grava os blocos no
+    processo pai estritamente na ordem do arquivo (ids/sequencial
+    determinísticos). Mantém no máximo ``2 * workers`` faixas em voo para
+    limitar memória.
+    """
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    ranges = _split_ranges(p)
+    total_bytes = ranges[-1][1] if ranges else 0
+    lidas = 0
+    pendentes: deque = deque()
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        it = iter(ranges)
+        for inicio, fim in it:
+            pendentes.append(ex.submit(_parse_range, str(p), layout_path, inicio, fim, eot_ctx, writer.formato_bloco))
+            if len(pendentes) >= 2 * workers:
+                break
+        feitas = 0
+        while pendentes:
+            n, bloco = pendentes.popleft().result()
+            fim = ranges[feitas][1]
+            feitas += 1
+            nxt = next(it, None)
+            if nxt is not None:
+                pendentes.append(ex.submit(_parse_range, str(p), layout_path, nxt[0], nxt[1], eot_ctx, writer.formato_bloco))
+            writer.write_block(bloco, n)
+            lidas += n
+            _progress(fim, total_bytes, t0)
+    return lidas
+
 # ----------------------------------------------------------------------
 # Função principal
 # ----------------------------------------------------------------------
-def importar_fixowidth_para_detraf(caminho: str, layout_path: str, periodo: str | None = None, eot: str | None = None) -> Dict[str, Any]:
+def importar_fixowidth_para_detraf(
+    caminho: str,
+    layout_path: str,
+    periodo: str | None = None,
+    eot: str | None = None,
+    modo: str = "auto",
+    workers: int = 1,
+) -> Dict[str, Any]:
     """
     Importa arquivo texto de layout fixo para a tabela
     'detraf_arquivo_batimento_avancado'.
@@ -141,93 +527,87 @@ def importar_fixowidth_para_detraf(caminho: str, layout_path: str, periodo: str
     - layout_path: YAML com o layout
     - periodo: 'YYYYMM' para filtro (opcional, recomendado)
     - eot: código EOT de contexto a ser gravado na coluna eot (opcional)
-    Retorna: dict(total, lidas, inseridos, ignorados_inconsistentes)
+    - modo: 'auto' (LOAD DATA se disponível), 'load-data' (obrigatório) ou 'executemany'
+    - workers: processos de parse (1 = sequencial; 0 = todos os núcleos)
+    Retorna: dict(total, lidas, inseridos, ignorados_inconsistentes, modo,
+    duracao, linhas_por_segundo, sha256). ``sha256`` (conteúdo do arquivo)
+    vem da leitura sequencial; no parse paralelo é None.
     """
     p = Path(caminho)
     if not p.exists() or not p.is_file():
         raise FileNotFoundError(f"Arquivo não encontrado: {caminho}")
 
-    fields = _load_layout(layout_path)
-    total = _count_lines(p)
-    _ok(f"Arquivo encontrado: {p.name} | {total} linhas detectadas")
+    from .reader import abrir_leitor
 
-    conn, cur = _get_conn_cursor()
+    parse = _compile_layout(layout_path)
+    # SHA-256 do conteúdo calculado na própria passada (checkpoint da importação)
+    reader = abrir_leitor(p, calcular_hash=True)
+    _ok(f"Arquivo encontrado: {p.name} | {reader.bytes_total / (1024 * 1024):,.1f} MB"
+        + (f" ({reader.compressao}, descompressão em streaming)" if reader.compressao else ""))
+
+    writer = _open_writer(modo)
+    conn = writer.conn
 
-    # Batch control
-    BATCH_SIZE = 1000
-    batch: List[Tuple[Any, ...]] = []
-    inseridos = 0
     lidas = 0
     ignorados = 0
+    eot_ctx = (eot or "AUTO").strip() or "AUTO"
+    if not workers or workers < 0:
+        workers = os.cpu_count() or 1
+    if workers > 1 and reader.compressao:
+        # Faixas de bytes exigem acesso aleatório; o stream comprimido é sequencial
+        _warn(f"Parse paralelo indisponível para arquivo {reader.compressao}; usando 1 processo.")
+        workers = 1
 
     t0 = time.perf_counter()
-    with p.open("r", encoding="utf-8") as fh:
-        for line in fh:
-            lidas += 1
-            rec = _slice_fields(line.rstrip("\n"), fields)
-
-            # Campos conforme YAML padrão do projeto
-            sequencial_raw = _clean_num(rec.get("sequencial", ""))
-            try:
-                sequencial = int(sequencial_raw) if sequencial_raw else None
-            except Exception:
-                sequencial = None
-
-            assinante_a_numero = _strip_csp_prefix(_clean_num(rec.get("assinante_a", "")))
-            eot_de_a = _clean(rec.get("eot_de_a", ""))
-            cnl_de_a = _clean(rec.get("cnl_de_a", ""))
-            area_local_de_a = _clean(rec.get("area_local_de_a", ""))
-            data_da_chamada = _clean(rec.get("data_da_chamada", ""))
-            hora_de_atendimento = _clean(rec.get("hora_de_atendimento", ""))
-            assinante_b_numero = _strip_csp_prefix(_clean_num(rec.get("assinante_b", "")))
-            eot_de_b = _clean(rec.get("eot_de_b", ""))
-            cnl_de_b = _clean(rec.get("cnl_de_b", ""))
-            area_local_de_b = _clean(rec.get("area_local_de_b", ""))
-
-            # Não filtra por período: todas as linhas são importadas.
-            # A classificação "Recuperação de conta" é feita na etapa de matching
-            # com base no mês de referência salvo em contexto.
-
-            # Sanitização de data/hora: STR_TO_DATE lida com NULL/strings inválidas
-            data_str = data_da_chamada if _is_valid_date8(data_da_chamada) else None
-            hora_str = hora_de_atendimento if _is_valid_time6(hora_de_atendimento) else None
-
-            eot_ctx = (eot or "AUTO").strip() or "AUTO"
-
-            row = (
-                eot_ctx, sequencial, assinante_a_numero, eot_de_a, cnl_de_a, area_local_de_a,
-                data_da_chamada, hora_de_atendimento,
-                assinante_b_numero, eot_de_b, cnl_de_b, area_local_de_b,
-                data_str, hora_str,
-            )
-            batch.append(row)
-
-            if len(batch) >= BATCH_SIZE:
-                cur.executemany(_SQL_INSERT, batch)
-                # Contabiliza pelo que enviamos (independe de rowcount)
-                inseridos += len(batch)
-                batch.clear()
-
-            _progress(lidas, total, t0)  # progresso por linha
-
-    # Flush final
-    if batch:
-        cur.executemany(_SQL_INSERT, batch)
-        inseridos += len(batch)
-        batch.clear()
+    _progress(0, reader.bytes_total, t0)
+    try:
+        # Não filtra por período: todas as linhas são importadas.
+        # A classificação "Recuperação de conta" é feita na etapa de matching
+        # com base no mês de referência salvo em contexto.
+        if workers > 1:
+            _ok(f"Parse paralelo: {workers} processos")
+            lidas = _importar_paralelo(p, layout_path, eot_ctx, writer, workers, t0)
+        else:
+            # Passada única: linhas, total e progresso (por offset de bytes) vêm da mesma leitura
+            # (mmap para texto; bytes comprimidos lidos para gzip/bz2/xz/zip)
+            write = writer.write
+            for bloco in reader.blocos():
+                for line in bloco:
+                    write(parse(line, eot_ctx))
+                lidas += len(bloco)
+                _progress(reader.bytes_lidos, reader.bytes_total, t0)
+
+        # Flush final
+        writer.close()
+    except Exception:
+        writer.abort()
+        raise
+    inseridos = writer.inseridos
 
-    # Commit (caso autocommit esteja off)
+    # Commit (caso autocommit esteja off) e devolve a conexão ao pool
     try:
         conn.commit()
     except Exception:
         pass
+    finally:
+        conn.close()
 
-    _progress(total, total, t0)  # garante barra completa
+    _progress(reader.bytes_total, reader.bytes_total, t0)  # garante 100%
+    total = lidas
+    duracao = time.perf_counter() - t0
+    rps = inseridos / duracao if duracao > 0 else 0.0
+    _ok(f"Importação ({writer.modo}): {inseridos} linhas em {duracao:.1f}s ({rps:,.0f} linhas/s)")
 
     resumo = {
         "total": int(total),
         "lidas": int(lidas),
         "inseridos": int(inseridos),
         "ignorados_inconsistentes": int(ignorados),
+        "modo": writer.modo,
+        "workers": int(workers),
+        "duracao": round(duracao, 3),
+        "linhas_por_segundo": round(rps, 1),
+        # Faixas paralelas são lidas pelos workers: o leitor não viu o arquivo inteiro
+        "sha256": reader.hexdigest() if workers == 1 else None,
     }
     return resumo
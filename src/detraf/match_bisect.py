@@ -0,0 +1,139 @@
+from __future__ import annotations
+"""Motor de matching em memória (alternativa à consulta ``ROW_NUMBER`` no banco).
+
+Lê a janela do DETRAF e a janela do CDR uma única vez, agrupa as chamadas do
+CDR por ``(src, dst)`` em listas ordenadas por ``calldate`` e escolhe, para cada
+linha do DETRAF, a chamada mais próxima via ``bisect``.
+
+A regra é a mesma do motor SQL:
+
+- candidatos com ``src = a_num`` e ``dst = b_num``;
+- ``ABS(TIMESTAMPDIFF(MINUTE, data_hora, calldate)) <= 5`` (|Δ| <= 359s);
+- RN=1 por ``ABS(diff_sec)`` com desempate por ``cdr.id``.
+
+As linhas resultantes têm o mesmo formato de ``tmp_conf``.
+"""
+
+from bisect import bisect_left
+from datetime import datetime
+from typing import Dict, Iterable, List, Tuple
+
+import pymysql
+
+from .log import info, ok
+from .normalizer import CDR_SHADOW
+
+# Tolerância em segundos equivalente a ABS(TIMESTAMPDIFF(MINUTE, ...)) <= 5
+TOLERANCIA_SEG = 359
+# Folga aplicada à janela do CDR (cobre a tolerância nas bordas)
+FOLGA_MIN = 6
+INSERT_BATCH = 1000
+FETCH_BATCH = 10_000
+
+# Colunas de ``tmp_conf`` (gravadas aqui, lidas pela classificação/paridade)
+COLUNAS_CONF = (
+    "detraf_id, cdr_id, diff_sec, detraf_dt, eot_de_a, eot_de_b, "
+    "cdr_eot_a, cdr_eot_b, cdr_src, cdr_dst, disposition, calldate"
+)
+
+
+def _segundos(dt: datetime) -> int:
+    """Segundos absolutos de um DATETIME (sem fuso; mesma base do TIMESTAMPDIFF)."""
+    return dt.toordinal() * 86400 + dt.hour * 3600 + dt.minute * 60 + dt.second
+
+
+def casar(detraf: Iterable[tuple], cdr: Iterable[tuple]) -> List[tuple]:
+    """Casa linhas do DETRAF com o CDR em memória.
+
+    ``detraf``: tuplas ``(id, data_hora, eot_de_a, eot_de_b, a_num, b_num)``.
+    ``cdr``: tuplas ``(id, calldate, src, dst, EOT_A, EOT_B, disposition)``.
+    Retorna tuplas no formato de ``tmp_conf`` (apenas linhas com match).
+    """
+    detraf = [d for d in detraf if d[1] is not None and d[4] is not None and d[5] is not None]
+    chaves = {(d[4], d[5]) for d in detraf}
+
+    # (src, dst) -> lista ordenada de (segundos, id, linha)
+    grupos: Dict[Tuple[str, str], list] = {}
+    for c in cdr:
+        if c[1] is None:
+            continue
+        k = (c[2], c[3])
+        if k in chaves:
+            grupos.setdefault(k, []).append((_segundos(c[1]), c[0], c))
+    tempos: Dict[Tuple[str, str], List[int]] = {}
+    for k, lst in grupos.items():
+        lst.sort(key=lambda x: (x[0], x[1]))
+        tempos[k] = [x[0] for x in lst]
+
+    out = []
+    for d_id, d_dt, eot_a, eot_b, a_num, b_num in detraf:
+        lst = grupos.get((a_num, b_num))
+        if not lst:
+            continue
+        t = _segundos(d_dt)
+        ts = tempos[(a_num, b_num)]
+        i = bisect_left(ts, t - TOLERANCIA_SEG)
+        melhor = None
+        melhor_chave = None
+        n = len(lst)
+        while i < n and ts[i] <= t + TOLERANCIA_SEG:
+            seg, c_id, c = lst[i]
+            chave = (abs(seg - t), c_id)
+            if melhor_chave is None or chave < melhor_chave:
+                melhor, melhor_chave = (seg - t, c), chave
+            i += 1
+        if melhor is None:
+            continue
+        diff, c = melhor
+        out.append((d_id, c[0], diff, d_dt, eot_a, eot_b, c[4], c[5], c[2], c[3], c[6], c[1]))
+    return out
+
+
+def _ler(conn, sql: str, args) -> Iterable[tuple]:
+    """Lê em streaming (cursor sem buffer no cliente), em fatias de ``FETCH_BATCH``."""
+    with conn.cursor(pymysql.cursors.SSCursor) as cur:
+        cur.execute(sql, args)
+        while True:
+            rows = cur.fetchmany(FETCH_BATCH)
+            if not rows:
+                break
+            yield from rows
+
+
+def ler_janela(conn, tabela_detraf: str, min_dt, max_dt, fim_inclusivo: bool = True) -> Tuple[list, Iterable[tuple]]:
+    """Retorna (linhas do DETRAF, gerador das linhas do CDR) para a janela informada.
+
+    Com ``fim_inclusivo=False`` a janela do DETRAF é ``[min_dt, max_dt)`` (fatias).
+    """
+    op_fim = "<=" if fim_inclusivo else "<"
+    detraf = list(_ler(
+        conn,
+        f"SELECT id, data_hora, eot_de_a, eot_de_b, a_num, b_num FROM {tabela_detraf} "
+        f"WHERE data_hora >= %s AND data_hora {op_fim} %s",
+        (min_dt, max_dt),
+    ))
+    cdr = _ler(
+        conn,
+        f"SELECT id, calldate, src, dst, EOT_A, EOT_B, disposition FROM {CDR_SHADOW} "
+        f"WHERE calldate BETWEEN %s - INTERVAL {FOLGA_MIN} MINUTE AND %s + INTERVAL {FOLGA_MIN} MINUTE",
+        (min_dt, max_dt),
+    )
+    return detraf, cdr
+
+
+def gravar_conf(cur, tmp_conf: str, linhas: List[tuple]) -> None:
+    """Grava as linhas casadas em ``tmp_conf`` em lotes."""
+    sql = f"INSERT INTO {tmp_conf} ({COLUNAS_CONF}) VALUES ({', '.join(['%s'] * 12)})"
+    for i in range(0, len(linhas), INSERT_BATCH):
+        cur.executemany(sql, linhas[i:i + INSERT_BATCH])
+
+
+def match_python(conn, tmp_detraf: str, tmp_conf: str, min_dt, max_dt) -> int:
+    """Executa o motor em memória e preenche ``tmp_conf``. Retorna o total casado."""
+    detraf, cdr = ler_janela(conn, tmp_detraf, min_dt, max_dt)
+    info(f"Motor python: {len(detraf)} linhas DETRAF na janela")
+    linhas = casar(detraf, cdr)
+    with conn.cursor() as cur:
+        gravar_conf(cur, tmp_conf, linhas)
+    ok(f"Motor python: {len(linhas)} pares casados (RN=1)")
+    return len(linhas)
@@ -0,0 +1,101 @@
+from __future__ import annotations
+"""Matching fatiado por tempo (dia/hora) em conexões paralelas.
+
+A janela ``min_dt → max_dt`` do DETRAF é dividida em fatias semiabertas
+``[ini, fim)``. Cada linha do DETRAF pertence a exatamente uma fatia; o lado
+do CDR não é cortado na borda (a sondagem por bucket / a folga de ±6 min do
+motor python alcança chamadas fora da fatia), então o resultado é o mesmo da
+janela inteira.
+
+Cada fatia roda em sua própria conexão (pool limitado de threads) e lê as
+tabelas persistentes (``detraf_arquivo_batimento_avancado`` e a sombra do
+CDR), já que tabelas temporárias são visíveis apenas na sessão que as criou.
+As linhas casadas voltam ao processo principal e são gravadas em ``tmp_conf``.
+"""
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from typing import List, Tuple
+
+import pymysql
+
+from .db import get_connection
+from .log import info, ok
+from .match_bisect import casar, gravar_conf, ler_janela
+from .normalizer import CDR_SHADOW, SQL_BUCKET, SQL_BUCKET_VIZINHOS
+
+FATIAMENTOS = ("none", "day", "hour")
+TABELA_DETRAF = "detraf_arquivo_batimento_avancado"
+
+_SQL_FATIA = f"""
+SELECT detraf_id, cdr_id, diff_sec, detraf_dt,
+       eot_de_a, eot_de_b, cdr_eot_a, cdr_eot_b,
+       cdr_src, cdr_dst, disposition, calldate
+FROM (
+    SELECT d.id AS detraf_id, c.id AS cdr_id,
+           TIMESTAMPDIFF(SECOND, d.data_hora, c.calldate) AS diff_sec,
+           d.data_hora AS detraf_dt,
+           d.eot_de_a, d.eot_de_b,
+           c.EOT_A AS cdr_eot_a, c.EOT_B AS cdr_eot_b,
+           c.src AS cdr_src, c.dst AS cdr_dst,
+           c.disposition, c.calldate,
+           ROW_NUMBER() OVER (PARTITION BY d.id ORDER BY ABS(TIMESTAMPDIFF(SECOND, d.data_hora, c.calldate)), c.id) AS rn
+    FROM {TABELA_DETRAF} d
+    JOIN {SQL_BUCKET_VIZINHOS} o
+    JOIN {CDR_SHADOW} c
+      ON c.src = d.a_num
+     AND c.dst = d.b_num
+     AND c.bucket = {SQL_BUCKET.format(col="d.data_hora")} + o.k
+    WHERE d.data_hora >= %s AND d.data_hora < %s
+      AND ABS(TIMESTAMPDIFF(MINUTE, d.data_hora, c.calldate)) <= 5
+) ranked
+WHERE rn = 1
+"""
+
+
+def fatiar_janela(min_dt: datetime, max_dt: datetime, shard: str) -> List[Tuple[datetime, datetime]]:
+    """Divide ``[min_dt, max_dt]`` em fatias ``[ini, fim)`` alinhadas ao dia ou à hora."""
+    if shard == "day":
+        passo = timedelta(days=1)
+        ini = min_dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif shard == "hour":
+        passo = timedelta(hours=1)
+        ini = min_dt.replace(minute=0, second=0, microsecond=0)
+    else:
+        raise ValueError(f"Fatiamento inválido: {shard} (use: day, hour)")
+    fatias = []
+    while ini <= max_dt:
+        fatias.append((ini, ini + passo))
+        ini += passo
+    return fatias
+
+
+def _match_fatia(ini: datetime, fim: datetime, engine: str) -> list:
+    """Casa uma fatia em conexão própria e devolve as linhas no formato de ``tmp_conf``."""
+    with get_connection(cursorclass=pymysql.cursors.Cursor) as conn:
+        if engine == "python":
+            detraf, cdr = ler_janela(conn, TABELA_DETRAF, ini, fim, fim_inclusivo=False)
+            return casar(detraf, cdr)
+        with conn.cursor() as cur:
+            cur.execute(_SQL_FATIA, (ini, fim))
+            return list(cur.fetchall())
+
+
+def match_fatiado(cur, tmp_conf: str, min_dt, max_dt, shard: str, workers: int, engine: str = "sql") -> int:
+    """Executa o matching por fatias em até ``workers`` conexões e grava ``tmp_conf``."""
+    fatias = fatiar_janela(min_dt, max_dt, shard)
+    workers = max(1, min(int(workers or 1), len(fatias)))
+    info(f"Matching fatiado: {len(fatias)} fatias ({shard}) | {workers} conexões | motor={engine}")
+    total = 0
+    feitas = 0
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = {ex.submit(_match_fatia, ini, fim, engine): ini for ini, fim in fatias}
+        for fut in as_completed(futs):
+            linhas = fut.result()
+            gravar_conf(cur, tmp_conf, linhas)
+            total += len(linhas)
+            feitas += 1
+            if feitas % max(1, len(fatias) // 10) == 0 or feitas == len(fatias):
+                info(f"Fatias concluídas: {feitas}/{len(fatias)} | pares casados: {total}")
+    ok(f"Matching fatiado concluído: {total} pares casados (RN=1)")
+    return total
@@ -0,0 +1,219 @@
+from __future__ import annotations
+"""Micro-benchmarks das funções por linha (``detraf microbench``), sem banco.
+
+Mede as funções chamadas por linha do arquivo/CDR — parse do layout fixo
+(``_slice_fields``, ``_clean_num``, ``_strip_csp_prefix``, validação de
+data/hora e o parser compilado usado na importação) e normalização de
+números (``_normalizar_numero``, ``_national_number``,
+``_split_number_for_cadup``) — sobre entradas geradas como as do
+``detraf bench`` (mesmo layout, formatos de número do CDR, uma fração de
+campos inválidos).
+
+Para cada caso:
+
+- ``ns_op``: menor tempo entre ``repeticoes`` passadas sobre as entradas,
+  por chamada, descontado o custo do laço/chamada vazia;
+- ``alocacoes_op``/``bytes_op``: blocos e bytes que continuam vivos após a
+  chamada (o valor devolvido), via ``tracemalloc``;
+- ``pico_bytes_op``: pico de memória durante a passada, por chamada.
+
+O resultado vai para ``var/bench/micro_<ts>.json``; ``comparar`` aponta os
+casos que ficaram mais lentos que a baseline além da tolerância.
+"""
+
+import json
+import random
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from .bench import BENCH_DIR, LAYOUT_PADRAO, Cenario, _Gerador, _Linha, revisao_git
+from .log import info, warn
+
+ENTRADAS_PADRAO = 20_000
+REPETICOES_PADRAO = 5
+# Casos abaixo disso não entram no veredito de regressão (ruído do relógio)
+MIN_NS_COMPARACAO = 50.0
+
+
+class Caso:
+    def __init__(self, nome: str, funcao: Callable, entradas: List[tuple]):
+        self.nome = nome
+        self.funcao = funcao
+        self.entradas = entradas
+
+
+def _entradas(n: int, semente: int, layout_path: Path):
+    """Linhas do DETRAF e números no formato do CDR, com ~5% de campos inválidos."""
+    g = _Gerador(Cenario(linhas=n, semente=semente))
+    rng = random.Random(semente + 1)
+    linha = _Linha(layout_path)
+    inicio = datetime(2025, 1, 1)
+    linhas: List[str] = []
+    cdr: List[Tuple[str, str]] = []
+    for i in range(1, n + 1):
+        quando = inicio + timedelta(seconds=rng.randrange(31 * 86_400))
+        a, eot_a = g.numero()
+        b, eot_b = g.numero()
+        reg = g.registro_detraf(i, quando, a, eot_a, b, eot_b, rng.randint(5, 1_800))
+        if rng.random() < 0.05:
+            reg[rng.choice(("data_da_chamada", "hora_de_atendimento"))] = rng.choice(("00000000", "", "99999999", "246060"))
+        linhas.append(linha.montar(reg))
+        src, dst = g.formato_cdr(a), g.formato_cdr(b)
+        r = rng.random()
+        if r < 0.03:
+            src = a[2:]  # local sem DDD (completa pelo ddd_ref)
+        elif r < 0.05:
+            dst = "0800" + dst[-7:]
+        elif r < 0.06:
+            dst = "ANONIMO"
+        cdr.append((src, dst))
+    return linhas, cdr
+
+
+def casos(n: int = ENTRADAS_PADRAO, semente: int = 42, layout_path: Path = LAYOUT_PADRAO) -> List[Caso]:
+    from .import_detraf_fw import (
+        _clean_num, _compile_layout, _is_valid_date8, _is_valid_time6, _load_layout, _slice_fields, _strip_csp_prefix,
+    )
+    from .normalizer import _national_number, _normalizar_numero, _split_number_for_cadup
+
+    linhas, cdr = _entradas(n, semente, layout_path)
+    campos = _load_layout(str(layout_path))
+    registros = [_slice_fields(l, campos) for l in linhas]
+    numeros_brutos = [r["assinante_a"] for r in registros[: n // 2]] + [r["assinante_b"] for r in registros[n // 2:]]
+    limpos = [_clean_num(x) for x in numeros_brutos]
+    parse = _compile_layout(str(layout_path))
+    nacionais = [_strip_csp_prefix(x) for x in limpos]
+    return [
+        Caso("_slice_fields", _slice_fields, [(l, campos) for l in linhas]),
+        Caso("_clean_num", _clean_num, [(x,) for x in numeros_brutos]),
+        Caso("_strip_csp_prefix", _strip_csp_prefix, [(x,) for x in limpos]),
+        Caso("_is_valid_date8", _is_valid_date8, [(r["data_da_chamada"].strip(),) for r in registros]),
+        Caso("_is_valid_time6", _is_valid_time6, [(r["hora_de_atendimento"].strip(),) for r in registros]),
+        Caso("parse_linha (compilado)", parse, [(l.encode("ascii"), "101") for l in linhas]),
+        Caso("_normalizar_numero (src)", _normalizar_numero, [(src, None) for src, _ in cdr]),
+        Caso(
+            "_normalizar_numero (dst)",
+            lambda numero, ddd: _normalizar_numero(numero, ddd, is_dst=True),
+            [(dst, (_normalizar_numero(src) or "11")[:2]) for src, dst in cdr],
+        ),
+        Caso("_national_number", _national_number, [(src,) for src, _ in cdr]),
+        Caso("_split_number_for_cadup", _split_number_for_cadup, [(x,) for x in nacionais]),
+    ]
+
+
+def _vazio(*_args):
+    return None
+
+
+def _passada(funcao: Callable, entradas: Sequence[tuple]) -> int:
+    t0 = time.perf_counter_ns()
+    for args in entradas:
+        funcao(*args)
+    return time.perf_counter_ns() - t0
+
+
+def _memoria(funcao: Callable, entradas: Sequence[tuple]) -> Tuple[float, float, float]:
+    """(blocos retidos/op, bytes retidos/op, pico de bytes/op) com os resultados mantidos vivos."""
+    n = len(entradas)
+    resultados = [None] * n
+    tracemalloc.start()
+    try:
+        antes = tracemalloc.take_snapshot()
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for i, args in enumerate(entradas):
+            resultados[i] = funcao(*args)
+        _, pico = tracemalloc.get_traced_memory()
+        depois = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    filtro = [tracemalloc.Filter(False, tracemalloc.__file__)]
+    diff = depois.filter_traces(filtro).compare_to(antes.filter_traces(filtro), "filename")
+    blocos = sum(max(s.count_diff, 0) for s in diff)
+    tamanho = sum(max(s.size_diff, 0) for s in diff)
+    del resultados
+    return blocos / n, tamanho / n, max(pico - base, 0) / n
+
+
+def medir(caso: Caso, repeticoes: int = REPETICOES_PADRAO) -> dict:
+    n = len(caso.entradas)
+    _passada(caso.funcao, caso.entradas)  # aquecimento (caches internos, ex.: datas já validadas)
+    melhor = min(_passada(caso.funcao, caso.entradas) for _ in range(repeticoes))
+    vazio = min(_passada(_vazio, caso.entradas) for _ in range(repeticoes))
+    blocos, tamanho, pico = _memoria(caso.funcao, caso.entradas)
+    return {
+        "caso": caso.nome,
+        "entradas": n,
+        "ns_op": round(max(melhor - vazio, 0) / n, 1),
+        "ns_op_bruto": round(melhor / n, 1),
+        "alocacoes_op": round(blocos, 3),
+        "bytes_op": round(tamanho, 1),
+        "pico_bytes_op": round(pico, 1),
+    }
+
+
+def executar(
+    n: int = ENTRADAS_PADRAO,
+    repeticoes: int = REPETICOES_PADRAO,
+    semente: int = 42,
+    filtro: Optional[str] = None,
+) -> dict:
+    """Roda os casos (opcionalmente só os que contêm ``filtro`` no nome) e devolve o resultado."""
+    t0 = time.perf_counter()
+    todos = casos(n, semente)
+    info(f"Entradas geradas: {n} por caso ({time.perf_counter() - t0:.1f}s)")
+    resultados = []
+    for caso in todos:
+        if filtro and filtro not in caso.nome:
+            continue
+        resultados.append(medir(caso, repeticoes))
+    from . import __version__
+    return {
+        "versao": __version__,
+        "git": revisao_git(),
+        "inicio": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "entradas": n,
+        "repeticoes": repeticoes,
+        "semente": semente,
+        "casos": resultados,
+    }
+
+
+def salvar(dados: dict, pasta: Path = BENCH_DIR) -> Path:
+    pasta.mkdir(parents=True, exist_ok=True)
+    path = pasta / f"micro_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
+    path.write_text(json.dumps(dados, ensure_ascii=False, indent=2), encoding="utf-8")
+    return path
+
+
+def imprimir(dados: dict, baseline: Optional[dict] = None, tolerancia: float = 0.15) -> List[str]:
+    """Tabela dos casos (com a variação sobre a baseline, se houver); devolve as regressões."""
+    base: Dict[str, dict] = {c["caso"]: c for c in (baseline or {}).get("casos", [])}
+    if baseline is not None and (baseline.get("entradas"), baseline.get("semente")) != (dados["entradas"], dados["semente"]):
+        warn("Baseline medida com outras entradas/semente; a comparação é apenas indicativa.")
+    regressoes = []
+    largura = max([len(c["caso"]) for c in dados["casos"]] + [4]) + 2
+    cab = f"{'caso':<{largura}}{'ns/op':>10}{'aloc/op':>9}{'bytes/op':>10}{'pico/op':>10}" + (f"{'base ns':>10}{'variação':>10}" if base else "")
+    print("─" * len(cab))
+    print(cab)
+    print("─" * len(cab))
+    for c in dados["casos"]:
+        linha = (
+            f"{c['caso']:<{largura}}{c['ns_op']:>10.1f}{c['alocacoes_op']:>9.2f}"
+            f"{c['bytes_op']:>10.1f}{c['pico_bytes_op']:>10.1f}"
+        )
+        b = base.get(c["caso"])
+        if b is not None:
+            var = (c["ns_op"] - b["ns_op"]) / b["ns_op"] if b["ns_op"] > 0 else 0.0
+            pior = b["ns_op"] >= MIN_NS_COMPARACAO and var > tolerancia
+            if pior:
+                regressoes.append(f"{c['caso']}: {b['ns_op']:.1f} → {c['ns_op']:.1f} ns/op ({var:+.0%})")
+            linha += f"{b['ns_op']:>10.1f}{var:>+10.0%}" + ("  (regressão)" if pior else "")
+        elif base:
+            linha += f"{'-':>10}{'novo':>10}"
+        print(linha)
+    print("─" * len(cab))
+    return regressoes
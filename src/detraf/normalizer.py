@@ -167,8 +167,10 @@ def _normalizar_numero(numero: str, ddd_ref: Optional[str] = None, *, is_dst: bo
 def criar_tmp_detraf(cur, tmp_name: str, min_dt, max_dt) -> None:
     """Cria tabela temporária do DETRAF com números normalizados.
 
-    Remove caracteres não numéricos de ``assinante_a_numero`` e
-    ``assinante_b_numero`` para facilitar o batimento com o CDR.
+    ``a_num``/``b_num`` já são gravados normalizados pelo importador
+    (apenas dígitos, corte de 12/13 dígitos), então aqui não há
+    ``REGEXP_REPLACE`` por linha. ``bucket`` é o bucket de tempo
+    (``BUCKET_SEG``) usado no JOIN de candidatos.
     """
     cur.execute(
         f"""
@@ -177,20 +179,9 @@ def criar_tmp_detraf(cur, tmp_name: str, min_dt, max_dt) -> None:
                data_hora,
                eot_de_a,
                eot_de_b,
-               (
-                 CASE
-                   WHEN LENGTH(REGEXP_REPLACE(assinante_a_numero, '[^0-9]', '')) IN (12,13)
-                        THEN SUBSTRING(REGEXP_REPLACE(assinante_a_numero, '[^0-9]', ''), 3)
-                   ELSE REGEXP_REPLACE(assinante_a_numero, '[^0-9]', '')
-                 END
-               ) AS a_num,
-               (
-                 CASE
-                   WHEN LENGTH(REGEXP_REPLACE(assinante_b_numero, '[^0-9]', '')) IN (12,13)
-                        THEN SUBSTRING(REGEXP_REPLACE(assinante_b_numero, '[^0-9]', ''), 3)
-                   ELSE REGEXP_REPLACE(assinante_b_numero, '[^0-9]', '')
-                 END
-               ) AS b_num
+               a_num,
+               b_num,
+               {SQL_BUCKET.format(col="data_hora")} AS bucket
         FROM detraf_arquivo_batimento_avancado
         WHERE data_hora BETWEEN %s AND %s
         """,
@@ -199,66 +190,156 @@ def criar_tmp_detraf(cur, tmp_name: str, min_dt, max_dt) -> None:
     ok(f"Tabela temporária criada: {tmp_name}")
 
 
-def criar_tmp_cdr(cur, tmp_name: str, tmp_detraf_name: str, min_dt, max_dt) -> None:
-    """Cria tabela temporária do CDR apenas para linhas candidatas a match.
+# === CDR sombra (cdr_batimento_avancado) ===
+# Cópia persistente e indexada da `cdr` com src/dst já normalizados
+# (apenas dígitos; se 12/13 dígitos, corta 2 à esquerda — mesma regra do DETRAF).
+# A normalização via REGEXP_REPLACE roda uma única vez por linha de CDR, na
+# carga incremental; o matching passa a ser um lookup no índice (src, dst, calldate).
+CDR_SHADOW = "cdr_batimento_avancado"
+CDR_SHADOW_ESTADO = "cdr_batimento_avancado_estado"
+CDR_SHADOW_ID_CHUNK = 200_000
+
+# Bucket de tempo para o JOIN de candidatos (sargável):
+# ABS(TIMESTAMPDIFF(MINUTE, d, c)) <= 5  <=>  |c - d| <= 359s (o TIMESTAMPDIFF trunca).
+# Com buckets de 360s, todo par válido cai no mesmo bucket ou em um vizinho
+# (bucket ± 1); o filtro exato roda só nesse conjunto pequeno de candidatos.
+# TO_SECONDS não depende do time_zone da sessão (ao contrário de UNIX_TIMESTAMP).
+BUCKET_SEG = 360
+SQL_BUCKET = "FLOOR(TO_SECONDS({col}) / %d)" % BUCKET_SEG
+# Deslocamentos de bucket sondados no JOIN de candidatos (bucket-1, bucket, bucket+1)
+SQL_BUCKET_VIZINHOS = "(SELECT -1 AS k UNION ALL SELECT 0 UNION ALL SELECT 1)"
+
+CREATE_CDR_SHADOW = f"""
+CREATE TABLE IF NOT EXISTS {CDR_SHADOW} (
+    id BIGINT NOT NULL PRIMARY KEY,
+    calldate DATETIME,
+    src VARCHAR(32),
+    dst VARCHAR(32),
+    EOT_A VARCHAR(32),
+    EOT_B VARCHAR(32),
+    duration INT,
+    billsec INT,
+    sentido VARCHAR(16),
+    disposition VARCHAR(32),
+    bucket INT,
+    INDEX idx_cdr_bat_match (src, dst, calldate),
+    INDEX idx_cdr_bat_bucket (src, dst, bucket),
+    INDEX idx_cdr_bat_calldate (calldate)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+CREATE_CDR_SHADOW_ESTADO = f"""
+CREATE TABLE IF NOT EXISTS {CDR_SHADOW_ESTADO} (
+    id TINYINT NOT NULL PRIMARY KEY,
+    ultimo_cdr_id BIGINT NOT NULL,
+    calldate_inicio DATETIME NOT NULL,
+    atualizado_em TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_SQL_NORM = """
+    CASE
+      WHEN LENGTH(REGEXP_REPLACE({col}, '[^0-9]', '')) IN (12,13)
+           THEN SUBSTRING(REGEXP_REPLACE({col}, '[^0-9]', ''), 3)
+      ELSE REGEXP_REPLACE({col}, '[^0-9]', '')
+    END
+"""
+
+_SQL_CDR_SHADOW_INSERT = f"""
+INSERT INTO {CDR_SHADOW} (id, calldate, src, dst, EOT_A, EOT_B, duration, billsec, sentido, disposition, bucket)
+SELECT c.id,
+       c.calldate,
+       {_SQL_NORM.format(col="c.src")} AS src,
+       {_SQL_NORM.format(col="c.dst")} AS dst,
+       c.EOT_A,
+       c.EOT_B,
+       c.duration,
+       c.billsec,
+       c.sentido,
+       c.disposition,
+       {SQL_BUCKET.format(col="c.calldate")} AS bucket
+FROM cdr c
+WHERE {{where}}
+ON DUPLICATE KEY UPDATE id = id
+"""
 
-    A seleção é feita via JOIN com a temporária do DETRAF já normalizada
-    (``tmp_detraf_name``), aplicando a mesma normalização simples de
-    números no lado do CDR (remove não numéricos; se 12/13 dígitos, corta 2 à esquerda)
-    e restringindo a ±5 minutos da data/hora do DETRAF. Para não perder
-    CDRs que iniciaram poucos minutos antes/depois do DETRAF, o filtro
-    de faixa usa (min_dt - 5m) .. (max_dt + 5m).
-    """
 
-    cur.execute(f"DROP TEMPORARY TABLE IF EXISTS {tmp_name}")
+def _garantir_cdr_shadow(cur) -> None:
+    """Cria a sombra/estado; recria a sombra se vier de um DDL anterior (sem PK/bucket)."""
     cur.execute(
-        f"""
-        CREATE TEMPORARY TABLE {tmp_name} AS
-        SELECT c.id,
-               c.calldate,
-               /* Normalização simples, compatível com tmp_detraf */
-               (
-                 CASE
-                   WHEN LENGTH(REGEXP_REPLACE(c.src, '[^0-9]', '')) IN (12,13)
-                        THEN SUBSTRING(REGEXP_REPLACE(c.src, '[^0-9]', ''), 3)
-                   ELSE REGEXP_REPLACE(c.src, '[^0-9]', '')
-                 END
-               ) AS src,
-               (
-                 CASE
-                   WHEN LENGTH(REGEXP_REPLACE(c.dst, '[^0-9]', '')) IN (12,13)
-                        THEN SUBSTRING(REGEXP_REPLACE(c.dst, '[^0-9]', ''), 3)
-                   ELSE REGEXP_REPLACE(c.dst, '[^0-9]', '')
-                 END
-               ) AS dst,
-               c.EOT_A,
-               c.EOT_B,
-               c.duration,
-               c.billsec,
-               c.sentido,
-               c.disposition
-        FROM cdr c
-        JOIN {tmp_detraf_name} d
-          ON (
-               (
-                 CASE
-                   WHEN LENGTH(REGEXP_REPLACE(c.src, '[^0-9]', '')) IN (12,13)
-                        THEN SUBSTRING(REGEXP_REPLACE(c.src, '[^0-9]', ''), 3)
-                   ELSE REGEXP_REPLACE(c.src, '[^0-9]', '')
-                 END
-               ) = d.a_num
-              AND (
-                 CASE
-                   WHEN LENGTH(REGEXP_REPLACE(c.dst, '[^0-9]', '')) IN (12,13)
-                        THEN SUBSTRING(REGEXP_REPLACE(c.dst, '[^0-9]', ''), 3)
-                   ELSE REGEXP_REPLACE(c.dst, '[^0-9]', '')
-                 END
-               ) = d.b_num
-              AND ABS(TIMESTAMPDIFF(MINUTE, d.data_hora, c.calldate)) <= 5
-          )
-        WHERE c.calldate >= %s - INTERVAL 5 MINUTE
-          AND c.calldate <= %s + INTERVAL 5 MINUTE
-        """,
-        (min_dt, max_dt),
+        "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = 'idx_cdr_bat_bucket' LIMIT 1",
+        (CDR_SHADOW,),
     )
-    ok(f"Tabela criada: {tmp_name}")
+    if cur.fetchone() is None:
+        cur.execute(f"DROP TABLE IF EXISTS {CDR_SHADOW}")
+        cur.execute(f"DROP TABLE IF EXISTS {CDR_SHADOW_ESTADO}")
+    cur.execute(CREATE_CDR_SHADOW)
+    cur.execute(CREATE_CDR_SHADOW_ESTADO)
+
+
+def reconstruir_cdr_shadow(cur) -> None:
+    """Descarta a sombra e o high-water mark; a próxima atualização recarrega do zero."""
+    _garantir_cdr_shadow(cur)
+    cur.execute(f"TRUNCATE TABLE {CDR_SHADOW}")
+    cur.execute(f"DELETE FROM {CDR_SHADOW_ESTADO}")
+    ok(f"{CDR_SHADOW} descartada para recarga completa.")
+
+
+def atualizar_cdr_shadow(cur, min_dt, max_dt) -> int:
+    """Atualiza incrementalmente ``cdr_batimento_avancado`` e retorna as linhas novas.
+
+    Estado (``cdr_batimento_avancado_estado``): ``ultimo_cdr_id`` e
+    ``calldate_inicio``. Invariante: toda linha da `cdr` com
+    ``id <= ultimo_cdr_id`` e ``calldate >= calldate_inicio`` está na sombra.
+
+    - Primeira execução: carrega a janela ``min_dt - 5min`` em diante.
+    - Execuções seguintes: carrega apenas ``id > ultimo_cdr_id`` (fatias de id) e,
+      se a janela do DETRAF começar antes de ``calldate_inicio``, completa o
+      trecho anterior (backfill por calldate).
+
+    Obs.: alterações em linhas antigas da `cdr` não são replicadas; use
+    ``reconstruir_cdr_shadow`` (``detraf run --rebuild-cdr``) nesse caso.
+    """
+    _garantir_cdr_shadow(cur)
+    cur.execute(f"SELECT ultimo_cdr_id, calldate_inicio FROM {CDR_SHADOW_ESTADO} WHERE id = 1")
+    estado = cur.fetchone()
+    cur.execute("SELECT MAX(id) AS max_id FROM cdr")
+    row = cur.fetchone()
+    max_id = int((row["max_id"] if isinstance(row, dict) else row[0]) or 0)
+    cur.execute("SELECT %s - INTERVAL 5 MINUTE AS ini", (min_dt,))
+    row = cur.fetchone()
+    janela_ini = row["ini"] if isinstance(row, dict) else row[0]
+
+    novas = 0
+    if not estado:
+        # Carga inicial: apenas a janela necessária (id até o máximo atual)
+        cur.execute(
+            _SQL_CDR_SHADOW_INSERT.format(where="c.id <= %s AND c.calldate >= %s"),
+            (max_id, janela_ini),
+        )
+        novas += cur.rowcount or 0
+        cur.execute(
+            f"INSERT INTO {CDR_SHADOW_ESTADO} (id, ultimo_cdr_id, calldate_inicio) VALUES (1, %s, %s)",
+            (max_id, janela_ini),
+        )
+    else:
+        ultimo_id = int(estado["ultimo_cdr_id"] if isinstance(estado, dict) else estado[0])
+        calldate_inicio = estado["calldate_inicio"] if isinstance(estado, dict) else estado[1]
+        # 1) Linhas novas por id (high-water mark), em fatias
+        lo = ultimo_id
+        while lo < max_id:
+            hi = min(lo + CDR_SHADOW_ID_CHUNK, max_id)
+            cur.execute(_SQL_CDR_SHADOW_INSERT.format(where="c.id > %s AND c.id <= %s"), (lo, hi))
+            novas += cur.rowcount or 0
+            cur.execute(f"UPDATE {CDR_SHADOW_ESTADO} SET ultimo_cdr_id = %s WHERE id = 1", (hi,))
+            lo = hi
+        # 2) Janela anterior ao que já foi carregado (ex.: reprocessamento de mês antigo)
+        if janela_ini < calldate_inicio:
+            cur.execute(
+                _SQL_CDR_SHADOW_INSERT.format(where="c.id <= %s AND c.calldate >= %s AND c.calldate < %s"),
+                (max(ultimo_id, max_id), janela_ini, calldate_inicio),
+            )
+            novas += cur.rowcount or 0
+            cur.execute(f"UPDATE {CDR_SHADOW_ESTADO} SET calldate_inicio = %s WHERE id = 1", (janela_ini,))
+    ok(f"{CDR_SHADOW} atualizada (+{novas} linhas; high-water id={max_id})")
+    return novas
@@ -0,0 +1,186 @@
+from __future__ import annotations
+"""Relatório de desempenho por etapa do run.
+
+Uso::
+
+    with etapa("importacao") as e:
+        resumo = importar(...)
+        e.linhas = resumo["inseridos"]
+
+Cada etapa registra tempo de parede, linhas processadas (informadas pela
+etapa), comandos SQL e round trips ao servidor (contados nas conexões do
+pool, ver ``instrumentar``) e o pico de memória (``ru_maxrss``) do processo.
+Etapas podem ser aninhadas: a etapa interna aparece como ``externa/interna``.
+
+``salvar_relatorio`` grava o JSON em ``var/logs/run_<ts>.json`` e
+``imprimir_relatorio`` mostra a tabela resumida no terminal.
+"""
+
+import json
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional
+
+try:
+    import resource  # Unix; no Windows o pico de memória fica ausente
+except ImportError:  # pragma: no cover
+    resource = None
+
+from .env import ROOT
+from .log import info, warn
+
+LOGS_DIR = ROOT / "var" / "logs"
+
+_lock = threading.Lock()
+# Totais do processo (todas as conexões instrumentadas)
+CONTADORES: Dict[str, int] = {"sql": 0, "round_trips": 0}
+
+
+def _contar(chave: str) -> None:
+    with _lock:
+        CONTADORES[chave] += 1
+
+
+def instrumentar(conn):
+    """Conta comandos SQL (``query``) e round trips (todo comando enviado) da conexão."""
+    query = conn.query
+    execute_command = conn._execute_command
+
+    def _query(sql, unbuffered=False):
+        _contar("sql")
+        return query(sql, unbuffered)
+
+    def _execute_command(command, sql):
+        _contar("round_trips")
+        return execute_command(command, sql)
+
+    conn.query = _query
+    conn._execute_command = _execute_command
+    return conn
+
+
+def pico_rss_mb() -> Optional[float]:
+    """Maior RSS do processo (e dos filhos já encerrados, ex.: parse paralelo) em MB."""
+    if resource is None:
+        return None
+    proprio = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    filhos = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    kb = max(proprio, filhos)
+    # Linux informa KB; macOS informa bytes
+    return round(kb / (1024 * 1024) if sys.platform == "darwin" else kb / 1024, 1)
+
+
+class Etapa:
+    def __init__(self, nome: str):
+        self.nome = nome
+        self.linhas: Optional[int] = None
+        self.segundos = 0.0
+        self.sql = 0
+        self.round_trips = 0
+        self.pico_rss_mb: Optional[float] = None
+        self.erro: Optional[str] = None
+
+    def como_dict(self) -> dict:
+        lps = (self.linhas / self.segundos) if (self.linhas and self.segundos > 0) else None
+        return {
+            "etapa": self.nome,
+            "segundos": round(self.segundos, 3),
+            "linhas": self.linhas,
+            "linhas_por_segundo": round(lps, 1) if lps is not None else None,
+            "sql": self.sql,
+            "round_trips": self.round_trips,
+            "pico_rss_mb": self.pico_rss_mb,
+            "erro": self.erro,
+        }
+
+
+class RelatorioRun:
+    def __init__(self):
+        self.inicio = datetime.now()
+        self.etapas: List[Etapa] = []
+        self._pilha: List[str] = []
+        self.extras: Dict[str, object] = {}
+
+    @contextmanager
+    def etapa(self, nome: str):
+        nome_completo = "/".join(self._pilha + [nome])
+        e = Etapa(nome_completo)
+        self.etapas.append(e)  # ordem de início (a externa antes das internas)
+        self._pilha.append(nome)
+        sql0, rt0 = CONTADORES["sql"], CONTADORES["round_trips"]
+        t0 = time.perf_counter()
+        try:
+            yield e
+        except BaseException as ex:
+            e.erro = f"{type(ex).__name__}: {ex}"
+            raise
+        finally:
+            e.segundos = time.perf_counter() - t0
+            e.sql = CONTADORES["sql"] - sql0
+            e.round_trips = CONTADORES["round_trips"] - rt0
+            e.pico_rss_mb = pico_rss_mb()
+            self._pilha.pop()
+
+    def como_dict(self) -> dict:
+        fim = datetime.now()
+        return {
+            "inicio": self.inicio.strftime("%Y-%m-%d %H:%M:%S"),
+            "fim": fim.strftime("%Y-%m-%d %H:%M:%S"),
+            "segundos": round((fim - self.inicio).total_seconds(), 3),
+            "sql_total": CONTADORES["sql"],
+            "round_trips_total": CONTADORES["round_trips"],
+            "pico_rss_mb": pico_rss_mb(),
+            **self.extras,
+            "etapas": [e.como_dict() for e in self.etapas],
+        }
+
+
+RELATORIO = RelatorioRun()
+
+
+def etapa(nome: str):
+    """Mede uma etapa no relatório do run atual."""
+    return RELATORIO.etapa(nome)
+
+
+def salvar_relatorio(pasta: Path = LOGS_DIR) -> Optional[Path]:
+    try:
+        pasta.mkdir(parents=True, exist_ok=True)
+        path = pasta / f"run_{RELATORIO.inicio.strftime('%Y%m%d_%H%M%S')}.json"
+        path.write_text(json.dumps(RELATORIO.como_dict(), ensure_ascii=False, indent=2), encoding="utf-8")
+        return path
+    except Exception as ex:
+        warn(f"Não foi possível gravar o relatório de desempenho: {ex}")
+        return None
+
+
+def _fmt(valor, casas: int = 0) -> str:
+    if valor is None:
+        return "-"
+    return f"{valor:,.{casas}f}"
+
+
+def imprimir_relatorio() -> None:
+    dados = RELATORIO.como_dict()
+    if not dados["etapas"]:
+        return
+    largura = max(len(e["etapa"]) for e in dados["etapas"]) + 2
+    cab = f"{'etapa':<{largura}}{'tempo(s)':>10}{'linhas':>12}{'linhas/s':>12}{'sql':>8}{'rtt':>8}{'rss(MB)':>9}"
+    print("─" * len(cab))
+    print(cab)
+    print("─" * len(cab))
+    for e in dados["etapas"]:
+        print(
+            f"{e['etapa']:<{largura}}{_fmt(e['segundos'], 2):>10}{_fmt(e['linhas']):>12}"
+            f"{_fmt(e['linhas_por_segundo']):>12}{e['sql']:>8}{e['round_trips']:>8}{_fmt(e['pico_rss_mb'], 1):>9}"
+            + ("  (falhou)" if e["erro"] else "")
+        )
+    print("─" * len(cab))
+    info(
+        f"Total: {dados['segundos']:.1f}s | {dados['sql_total']} comandos SQL | "
+        f"{dados['round_trips_total']} round trips | pico RSS {_fmt(dados['pico_rss_mb'], 1)} MB"
+    )
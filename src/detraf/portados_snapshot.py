@@ -0,0 +1,300 @@
+from __future__ import annotations
+"""Snapshot local de ``numeros_portados`` (mapeado em memória).
+
+Para cada número guarda apenas o registro mais recente por ``data_janela``
+(a mesma regra de ``ORDER BY data_janela DESC LIMIT 1``). Os arquivos ficam
+em ``var/cache/numeros_portados/``:
+
+- ``numeros.bin``: chaves ordenadas (``int64``), ``int('1' + numero)`` — o
+  ``1`` à esquerda preserva zeros iniciais;
+- ``eots.bin``: índice (``int32``) na tabela de EOTs do ``meta.json`` (-1 = NULL);
+- ``janelas.bin``: ``data_janela`` em segundos (``int64``; -1 = NULL);
+- ``meta.json``: versão, tabela de EOTs, tipo da ``data_janela``, a maior
+  ``data_janela`` da tabela no início da leitura (ponto de partida da
+  atualização incremental) e quantas linhas havia a partir dela.
+
+A carga completa lê a tabela em streaming já ordenada por
+``LENGTH(numero), numero, data_janela`` (mesma ordem das chaves inteiras), com
+memória constante. As atualizações leem apenas ``data_janela >= última`` e
+fazem um merge linear com o snapshot atual; o snapshot só é reaproveitado
+sem merge se a contagem de ``data_janela >= última`` não mudou (pega também
+linhas acrescentadas depois na mesma janela, ex.: janela carregada em dois
+lotes). A consulta é binária sobre o
+``mmap``, sem round trip ao banco. Números não numéricos não entram no
+snapshot (nunca casam com os números normalizados do batimento).
+"""
+
+import json
+import mmap
+import time
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+import pymysql
+
+from .env import ROOT
+from .log import info, ok, warn
+
+CACHE_DIR = ROOT / "var" / "cache" / "numeros_portados"
+VERSAO = 1
+FETCH_BATCH = 50_000
+WRITE_BATCH = 1_000_000
+
+_EPOCH = datetime(1970, 1, 1)
+
+_SQL_ORDENADO = """
+SELECT numero, eot, data_janela
+FROM numeros_portados
+{where}
+ORDER BY LENGTH(numero), numero, data_janela
+"""
+
+
+def _chave(numero) -> Optional[int]:
+    s = str(numero).strip() if numero is not None else ""
+    if not s.isdigit() or len(s) > 17:
+        return None
+    return int("1" + s)
+
+
+def _corte(cur, desde=None) -> Tuple[Optional[object], int]:
+    """(maior data_janela, linhas com data_janela >= ela); com ``desde``, conta a partir dele."""
+    if desde is None:
+        cur.execute("SELECT MAX(data_janela) AS ultima FROM numeros_portados")
+        row = cur.fetchone()
+        desde = (row["ultima"] if isinstance(row, dict) else row[0]) if row else None
+        if desde is None:
+            return None, 0
+    cur.execute("SELECT COUNT(*) AS total FROM numeros_portados WHERE data_janela >= %s", (desde,))
+    row = cur.fetchone()
+    return desde, int(row["total"] if isinstance(row, dict) else row[0])
+
+
+def _seg(valor) -> int:
+    if valor is None:
+        return -1
+    if isinstance(valor, datetime):
+        return int((valor - _EPOCH).total_seconds())
+    if isinstance(valor, date):
+        return (valor - _EPOCH.date()).days * 86400
+    return -1
+
+
+class _Gravador:
+    """Grava as três colunas do snapshot em blocos."""
+
+    def __init__(self, pasta: Path, eots: List[str]):
+        self.pasta = pasta
+        self.eots = eots
+        self._eot_idx = {e: i for i, e in enumerate(eots)}
+        self.fh = {n: (pasta / f"{n}.bin.tmp").open("wb") for n in ("numeros", "eots", "janelas")}
+        self.buf = {"numeros": array("q"), "eots": array("i"), "janelas": array("q")}
+        self.linhas = 0
+
+    def eot_id(self, eot) -> int:
+        if eot is None:
+            return -1
+        eot = str(eot)
+        i = self._eot_idx.get(eot)
+        if i is None:
+            i = self._eot_idx[eot] = len(self.eots)
+            self.eots.append(eot)
+        return i
+
+    def add(self, chave: int, eot_id: int, janela: int) -> None:
+        self.buf["numeros"].append(chave)
+        self.buf["eots"].append(eot_id)
+        self.buf["janelas"].append(janela)
+        self.linhas += 1
+        if len(self.buf["numeros"]) >= WRITE_BATCH:
+            self._flush()
+
+    def _flush(self) -> None:
+        for n, a in self.buf.items():
+            a.tofile(self.fh[n])
+            del a[:]
+
+    def fechar(self) -> None:
+        self._flush()
+        for n, fh in self.fh.items():
+            fh.close()
+            (self.pasta / f"{n}.bin.tmp").replace(self.pasta / f"{n}.bin")
+
+
+class PortadosSnapshot:
+    """Consulta de portabilidade servida pelo snapshot local."""
+
+    def __init__(self, pasta: Path = CACHE_DIR):
+        self.pasta = Path(pasta)
+        self.meta = json.loads((self.pasta / "meta.json").read_text(encoding="utf-8"))
+        self._fhs = []
+        self._mms = []
+        self.numeros = self._mapear("numeros", "q")
+        self.eot_ids = self._mapear("eots", "i")
+        self.janelas = self._mapear("janelas", "q")
+        self.eots: List[str] = self.meta["eots"]
+        self._tipo = self.meta.get("tipo_janela", "datetime")
+
+    def _mapear(self, nome: str, fmt: str):
+        path = self.pasta / f"{nome}.bin"
+        if path.stat().st_size == 0:
+            return array(fmt)
+        fh = path.open("rb")
+        mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self._fhs.append(fh)
+        self._mms.append(mm)
+        return memoryview(mm).cast(fmt)
+
+    def fechar(self) -> None:
+        for mv in (self.numeros, self.eot_ids, self.janelas):
+            if isinstance(mv, memoryview):
+                mv.release()
+        for mm in self._mms:
+            mm.close()
+        for fh in self._fhs:
+            fh.close()
+        self._mms = []; self._fhs = []
+
+    def __len__(self) -> int:
+        return len(self.numeros)
+
+    def _janela(self, seg: int):
+        if seg < 0:
+            return None
+        dt = _EPOCH + timedelta(seconds=seg)
+        return dt.date() if self._tipo == "date" else dt
+
+    def lookup(self, numero) -> Tuple[Optional[str], Optional[object]]:
+        """(eot, data_janela) mais recente para o número exato, ou (None, None)."""
+        k = _chave(numero)
+        if k is None:
+            return None, None
+        i = bisect_left(self.numeros, k)
+        if i >= len(self.numeros) or self.numeros[i] != k:
+            return None, None
+        e = self.eot_ids[i]
+        return (self.eots[e] if e >= 0 else None), self._janela(self.janelas[i])
+
+    def entradas(self) -> Iterator[Tuple[int, int, int]]:
+        """Percorre (chave, eot_id, janela) na ordem do snapshot."""
+        for i in range(len(self.numeros)):
+            yield self.numeros[i], self.eot_ids[i], self.janelas[i]
+
+    # --- construção / atualização ---
+    @staticmethod
+    def _ler_ordenado(cur, where: str = "", args=()) -> Iterator[Tuple[int, object, object]]:
+        """Linhas (chave, eot, data_janela) mais recentes por número, em ordem de chave."""
+        with cur.connection.cursor(pymysql.cursors.SSCursor) as ss:
+            ss.execute(_SQL_ORDENADO.format(where=where), args)
+            atual = None
+            ultima = -1
+            while True:
+                rows = ss.fetchmany(FETCH_BATCH)
+                if not rows:
+                    break
+                for numero, eot, janela in rows:
+                    k = _chave(numero)
+                    if k is None:
+                        continue
+                    if k < ultima:
+                        raise ValueError(f"numeros_portados fora da ordem esperada em '{numero}'")
+                    ultima = k
+                    # Mesma chave: a última (maior data_janela; NULL ordena primeiro) vence
+                    if atual is not None and atual[0] != k:
+                        yield atual
+                    atual = (k, eot, janela)
+            if atual is not None:
+                yield atual
+
+    @classmethod
+    def atualizar(cls, cur, pasta: Path = CACHE_DIR, reconstruir: bool = False) -> "PortadosSnapshot":
+        """Cria ou atualiza incrementalmente o snapshot e o devolve aberto."""
+        pasta = Path(pasta)
+        pasta.mkdir(parents=True, exist_ok=True)
+        anterior = None
+        if not reconstruir:
+            try:
+                anterior = cls(pasta)
+                if anterior.meta.get("versao") != VERSAO:
+                    anterior.fechar(); anterior = None
+            except Exception:
+                anterior = None
+
+        # Mesmas linhas a partir da última janela lida: o snapshot atual já vale
+        if anterior is not None and anterior.meta.get("ultima_janela"):
+            _, linhas = _corte(cur, anterior.meta["ultima_janela"])
+            if linhas == anterior.meta.get("linhas_ultima_janela"):
+                ok(f"Snapshot numeros_portados atualizado ({len(anterior)} números)")
+                return anterior
+
+        t0 = time.perf_counter()
+        # Corte antes da leitura: o que for acrescentado durante ela muda a contagem e entra na próxima
+        maior, linhas_corte = _corte(cur)
+        tipo = anterior._tipo if anterior else None
+        eots = list(anterior.eots) if anterior else []
+        g = _Gravador(pasta, eots)
+
+        def novos():
+            nonlocal tipo
+            where, args = ("", ())
+            if anterior and anterior.meta.get("ultima_janela"):
+                where, args = ("WHERE data_janela >= %s", (anterior.meta["ultima_janela"],))
+            for k, eot, janela in cls._ler_ordenado(cur, where, args):
+                if janela is not None and tipo is None:
+                    tipo = "datetime" if isinstance(janela, datetime) else "date"
+                yield k, g.eot_id(eot), _seg(janela)
+
+        if anterior is None:
+            for k, e, j in novos():
+                g.add(k, e, j)
+            lidas = g.linhas
+        else:
+            # Merge linear: snapshot atual x linhas novas (ambos ordenados por chave)
+            lidas = 0
+            velhos = anterior.entradas()
+            v = next(velhos, None)
+            for n in novos():
+                lidas += 1
+                while v is not None and v[0] < n[0]:
+                    g.add(*v); v = next(velhos, None)
+                if v is not None and v[0] == n[0]:
+                    # Mesmo número: vence a data_janela mais recente (empate → linha nova)
+                    if n[2] < v[2]:
+                        n = v
+                    v = next(velhos, None)
+                g.add(*n)
+            while v is not None:
+                g.add(*v); v = next(velhos, None)
+            anterior.fechar()
+        g.fechar()
+
+        ultima = maior.strftime("%Y-%m-%d %H:%M:%S") if hasattr(maior, "strftime") else maior
+        meta = {
+            "versao": VERSAO,
+            "eots": g.eots,
+            "tipo_janela": tipo or "datetime",
+            "ultima_janela": ultima,
+            "linhas_ultima_janela": linhas_corte,
+            "numeros": g.linhas,
+            "atualizado_em": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        tmp = pasta / "meta.json.tmp"
+        tmp.write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+        tmp.replace(pasta / "meta.json")
+        modo = "carga completa" if anterior is None else "incremental"
+        info(f"Snapshot numeros_portados ({modo}): {lidas} números lidos em {time.perf_counter() - t0:.1f}s")
+        snap = cls(pasta)
+        ok(f"Snapshot numeros_portados pronto: {len(snap)} números (última janela: {ultima})")
+        return snap
+
+
+def abrir_snapshot(cur, reconstruir: bool = False, pasta: Path = CACHE_DIR) -> Optional[PortadosSnapshot]:
+    """Atualiza e abre o snapshot; em falha devolve None (consultas SQL como antes)."""
+    try:
+        return PortadosSnapshot.atualizar(cur, pasta=pasta, reconstruir=reconstruir)
+    except Exception as ex:
+        warn(f"Snapshot de numeros_portados indisponível, usando consultas ao banco: {ex}")
+        return None
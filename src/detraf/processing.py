@@ -3,7 +3,7 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta
 from calendar import monthrange
-from typing import Tuple
+from typing import Dict, Optional, Tuple
 
 from .db import get_connection
 
@@ -123,6 +123,14 @@ def begin_processing(periodo: str, eot: str, arquivo: str) -> Tuple[str, str]:
     except Exception as ex:
         warn(f"Não foi possível verificar o schema: {ex}")
 
+    # 2b) tabelas de versões anteriores: adiciona colunas/índices novos (a_num/b_num)
+    try:
+        from .schema import atualizar_schema_avancado
+        with conn.cursor() as cur:
+            atualizar_schema_avancado(cur)
+    except Exception as ex:
+        warn(f"Não foi possível atualizar o schema: {ex}")
+
     # 3) limpeza solicitada (truncate) — só se existirem (não toca cdr/numeros_portados/cadup)
     try:
         _truncate_if_exists(conn, "detraf_arquivo_batimento_avancado")
@@ -134,21 +142,32 @@ def begin_processing(periodo: str, eot: str, arquivo: str) -> Tuple[str, str]:
     return dt_ini.strftime("%Y-%m-%d %H:%M:%S"), dt_fim.strftime("%Y-%m-%d %H:%M:%S")
 
 # === Pipeline: comparação/matching (mínimo seguro) ===
-def processar_match() -> None:
+def processar_match(**opcoes) -> Optional[Dict[str, int]]:
     """Executa o batimento real delegando ao módulo ``match_cdr``.
 
     Esta função mantém a assinatura utilizada pelo ``cli`` e simplesmente
-    encaminha a chamada para :func:`match_cdr.processar_match`. Qualquer erro
-    é capturado e exibido como aviso para não interromper o fluxo principal.
+    encaminha a chamada (e ``opcoes``) para :func:`match_cdr.processar_match`.
+    Qualquer erro é capturado e exibido como aviso para não interromper o
+    fluxo principal — exceto ``ResumoDivergente`` (totais do resumo não batem
+    com as linhas gravadas) e ``ParidadeDivergente`` (``--verify-parity`` achou
+    diferenças), repassados para a execução falhar.
+    Retorna os contadores do matching (pares/perdidos) ou None se ele não
+    foi concluído.
     """
 
     try:
         from .match_cdr import processar_match as _match
     except Exception as ex:
         warn(f"Módulo de matching indisponível: {ex}")
-        return
+        return None
 
+    from .classificacao import ParidadeDivergente
+    from .resultado import ResumoDivergente
     try:
-        _match()
+        return _match(**opcoes)
+    except (ResumoDivergente, ParidadeDivergente) as ex:
+        err(str(ex))
+        raise
     except Exception as ex:
         warn(f"Falha ao executar matching: {ex}")
+        return None
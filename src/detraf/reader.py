@@ -0,0 +1,171 @@
+from __future__ import annotations
+"""Leitura do arquivo DETRAF em passada única.
+
+O arquivo é mapeado em memória (``mmap``) e percorrido em blocos alinhados
+em quebra de linha. A mesma passada entrega as linhas ao parser e mantém o
+total de linhas, o offset de bytes já lido (para progresso) e, se pedido, o
+SHA-256 do conteúdo (``hexdigest``; usado pelos checkpoints do run, sem
+uma leitura extra do arquivo).
+
+Entregas comprimidas (gzip/bz2/xz/zip) são detectadas pelos bytes mágicos e
+descomprimidas em streaming (sem arquivo temporário, memória limitada a um
+bloco); o progresso, nesse caso, é medido em bytes comprimidos lidos.
+"""
+
+import hashlib
+import mmap
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+# Assinaturas (magic bytes) dos formatos aceitos
+_MAGICS = (
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "xz"),
+    (b"PK\x03\x04", "zip"),
+)
+
+def detectar_compressao(path: Path | str) -> Optional[str]:
+    """Retorna 'gzip', 'bz2', 'xz', 'zip' ou None (texto puro) pelos bytes iniciais."""
+    with Path(path).open("rb") as fh:
+        head = fh.read(8)
+    for magic, nome in _MAGICS:
+        if head.startswith(magic):
+            return nome
+    return None
+
+
+class MappedReader:
+    """Leitor do DETRAF via ``mmap`` (uma única leitura do arquivo).
+
+    Uso::
+
+        reader = MappedReader(path)
+        for bloco in reader.blocos():
+            for line in bloco:   # bytes, sem o '\\n'
+                ...
+        reader.linhas        # total de linhas (disponível ao final)
+        reader.bytes_lidos   # offset já percorrido (progresso)
+        reader.hexdigest()   # SHA-256 do conteúdo (com calcular_hash=True, ao final)
+    """
+
+    BLOCK_BYTES = 8 * 1024 * 1024
+    compressao = None
+
+    def __init__(self, path: Path | str, calcular_hash: bool = False):
+        self.path = Path(path)
+        self.bytes_total = self.path.stat().st_size
+        self.bytes_lidos = 0
+        self.linhas = 0
+        self.digest = hashlib.sha256() if calcular_hash else None
+
+    def blocos(self) -> Iterator[List[bytes]]:
+        """Gera listas de linhas (sem '\\n'), bloco a bloco, na ordem do arquivo."""
+        size = self.bytes_total
+        if size == 0:
+            return
+        with self.path.open("rb") as fh, mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            pos = 0
+            while pos < size:
+                end = pos + self.BLOCK_BYTES
+                if end >= size:
+                    end = size
+                else:
+                    nl = mm.rfind(b"\n", pos, end)
+                    if nl == -1:
+                        nl = mm.find(b"\n", end)
+                    end = nl + 1 if nl != -1 else size
+                dados = mm[pos:end]
+                if self.digest is not None:
+                    self.digest.update(dados)
+                lines = dados.split(b"\n")
+                if lines[-1] == b"":
+                    lines.pop()
+                self.linhas += len(lines)
+                self.bytes_lidos = end
+                yield lines
+                pos = end
+
+    def __iter__(self) -> Iterator[bytes]:
+        for bloco in self.blocos():
+            yield from bloco
+
+    def hexdigest(self) -> Optional[str]:
+        """SHA-256 do conteúdo lido (completo só após percorrer ``blocos``); None sem ``calcular_hash``."""
+        return self.digest.hexdigest() if self.digest is not None else None
+
+
+class StreamReader:
+    """Leitor em streaming para arquivos comprimidos (mesma interface do ``MappedReader``).
+
+    ``bytes_total``/``bytes_lidos`` referem-se ao arquivo comprimido; o
+    hash, ao conteúdo descomprimido.
+    """
+
+    BLOCK_BYTES = 8 * 1024 * 1024
+
+    def __init__(self, path: Path | str, compressao: str, calcular_hash: bool = False):
+        self.path = Path(path)
+        self.compressao = compressao
+        self.bytes_total = self.path.stat().st_size
+        self.bytes_lidos = 0
+        self.linhas = 0
+        self.digest = hashlib.sha256() if calcular_hash else None
+
+    def _abrir(self, raw):
+        if self.compressao == "gzip":
+            import gzip
+            return gzip.GzipFile(fileobj=raw, mode="rb")
+        if self.compressao == "bz2":
+            import bz2
+            return bz2.BZ2File(raw, mode="rb")
+        if self.compressao == "xz":
+            import lzma
+            return lzma.LZMAFile(raw, mode="rb")
+        if self.compressao == "zip":
+            import zipfile
+            zf = zipfile.ZipFile(raw)
+            membros = [m for m in zf.infolist() if not m.is_dir()]
+            if len(membros) != 1:
+                raise ValueError(f"ZIP deve conter exatamente um arquivo DETRAF (encontrados: {len(membros)})")
+            return zf.open(membros[0], "r")
+        raise ValueError(f"Compressão não suportada: {self.compressao}")
+
+    def blocos(self) -> Iterator[List[bytes]]:
+        """Gera listas de linhas (sem '\\n') descomprimindo bloco a bloco."""
+        with self.path.open("rb") as raw, self._abrir(raw) as fh:
+            resto = b""
+            while True:
+                chunk = fh.read(self.BLOCK_BYTES)
+                self.bytes_lidos = raw.tell()
+                if not chunk:
+                    break
+                if self.digest is not None:
+                    self.digest.update(chunk)
+                data = resto + chunk
+                nl = data.rfind(b"\n")
+                if nl == -1:
+                    resto = data
+                    continue
+                resto = data[nl + 1:]
+                lines = data[:nl].split(b"\n")
+                self.linhas += len(lines)
+                yield lines
+            if resto:
+                self.linhas += 1
+                yield [resto]
+        self.bytes_lidos = self.bytes_total
+
+    def __iter__(self) -> Iterator[bytes]:
+        for bloco in self.blocos():
+            yield from bloco
+
+    hexdigest = MappedReader.hexdigest
+
+
+def abrir_leitor(path: Path | str, calcular_hash: bool = False):
+    """Escolhe o leitor: ``StreamReader`` para arquivos comprimidos, ``MappedReader`` para texto."""
+    compressao = detectar_compressao(path)
+    if compressao:
+        return StreamReader(path, compressao, calcular_hash)
+    return MappedReader(path, calcular_hash)
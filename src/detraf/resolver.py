@@ -0,0 +1,174 @@
+from __future__ import annotations
+"""Resolução de EOT em lote (``numeros_portados`` / ``cadup``).
+
+Substitui as consultas por linha de ``_resolve_eot``/``_lookup_eot_*`` no
+matching: os números distintos de um lote são coletados e resolvidos com
+poucas consultas ``IN (...)``; cada linha é servida do cache.
+
+A semântica é a mesma das funções de ``normalizer``:
+
+- ``numeros_portados``: registro mais recente por ``data_janela``
+  (``ORDER BY data_janela DESC LIMIT 1``), pelo número exato informado;
+- ``resolve``: consulta ``numeros_portados`` pelo número nacional e, sem EOT
+  lá, cai para ``cadup`` (CN + prefixo + faixa de MCDU).
+
+Com um ``CadupIndex`` (``cadup_index``) as consultas ao ``cadup`` são
+servidas do índice em memória, e com um ``PortadosSnapshot``
+(``portados_snapshot``) as de ``numeros_portados`` vêm do snapshot local;
+em ambos os casos sem ir ao banco.
+"""
+
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .log import warn
+from .normalizer import _national_number, _split_number_for_cadup
+
+CHUNK = 1000
+
+_SQL_NP = """
+SELECT numero, eot, data_janela
+FROM (
+    SELECT numero, eot, data_janela,
+           ROW_NUMBER() OVER (PARTITION BY numero ORDER BY data_janela DESC) AS rn
+    FROM numeros_portados
+    WHERE numero IN ({marks})
+) t
+WHERE rn = 1
+"""
+
+_SQL_CADUP = """
+SELECT CN, prefixo, MCDU_inicial, MCDU_final, empresa_receptora
+FROM cadup
+WHERE (CN, prefixo) IN ({marks})
+"""
+
+
+def _get(row, key: str, idx: int):
+    return row[key] if isinstance(row, dict) else row[idx]
+
+
+def _cmp_mcdu(coluna, mcdu: str):
+    """Valor comparável com a coluna de MCDU, como o MySQL faria (numérico ou texto)."""
+    if isinstance(coluna, (int, Decimal)):
+        return int(mcdu)
+    return mcdu
+
+
+class EotResolver:
+    """Cache de EOT de referência preenchido por consultas em lote.
+
+    Uso::
+
+        resolver = EotResolver(cur)
+        resolver.carregar(numeros)           # poucas consultas IN (...)
+        resolver.resolve(numero)             # (eot, origem, data_janela)
+        resolver.portabilidade(numero)       # (eot, data_janela) pelo número exato
+
+    Números não carregados previamente são consultados sob demanda (e
+    guardados), então o resultado nunca depende do pré-carregamento.
+    """
+
+    def __init__(self, cur, chunk: int = CHUNK, cadup=None, portados=None):
+        self.cur = cur
+        self.chunk = chunk
+        self.cadup_index = cadup
+        self.portados = portados
+        self._np: Dict[str, Tuple[Optional[str], Optional[object]]] = {}
+        # (CN, prefixo) -> faixas na ordem devolvida pelo banco
+        self._cadup: Dict[Tuple[str, str], List[tuple]] = {}
+        self.consultas = 0
+
+    # --- carga em lote ---
+    def carregar(self, numeros: Iterable[str]) -> None:
+        """Resolve em lote os números (e seus nacionais) ainda fora do cache."""
+        chaves_np = set()
+        chaves_cadup = set()
+        for numero in numeros:
+            if numero is None:
+                continue
+            numero = str(numero)
+            if self.portados is None:
+                chaves_np.add(numero)
+                chaves_np.add(_national_number(numero))
+            if self.cadup_index is not None:
+                continue
+            tipo, cn, prefixo, _ = _split_number_for_cadup(numero)
+            if tipo:
+                chaves_cadup.add((cn, prefixo))
+        self._carregar_np([k for k in chaves_np if k not in self._np])
+        self._carregar_cadup([k for k in chaves_cadup if k not in self._cadup])
+
+    def _carregar_np(self, chaves: List[str]) -> None:
+        for i in range(0, len(chaves), self.chunk):
+            lote = chaves[i:i + self.chunk]
+            for k in lote:
+                self._np[k] = (None, None)
+            try:
+                self.cur.execute(_SQL_NP.format(marks=",".join(["%s"] * len(lote))), lote)
+                self.consultas += 1
+                for row in self.cur.fetchall() or []:
+                    numero = _get(row, "numero", 0)
+                    eot = _get(row, "eot", 1)
+                    self._np[str(numero)] = (str(eot) if eot is not None else None, _get(row, "data_janela", 2))
+            except Exception as ex:
+                warn(f"Falha ao consultar numeros_portados em lote: {ex}")
+
+    def _carregar_cadup(self, chaves: List[Tuple[str, str]]) -> None:
+        for i in range(0, len(chaves), self.chunk):
+            lote = chaves[i:i + self.chunk]
+            for k in lote:
+                self._cadup[k] = []
+            try:
+                args: list = []
+                for cn, prefixo in lote:
+                    args.extend((cn, prefixo))
+                self.cur.execute(_SQL_CADUP.format(marks=",".join(["(%s,%s)"] * len(lote))), args)
+                self.consultas += 1
+                for row in self.cur.fetchall() or []:
+                    k = (str(_get(row, "CN", 0)), str(_get(row, "prefixo", 1)))
+                    self._cadup.setdefault(k, []).append((
+                        _get(row, "MCDU_inicial", 2),
+                        _get(row, "MCDU_final", 3),
+                        _get(row, "empresa_receptora", 4),
+                    ))
+            except Exception as ex:
+                warn(f"Falha ao consultar cadup em lote: {ex}")
+
+    # --- consultas servidas do cache ---
+    def portabilidade(self, numero: str) -> Tuple[Optional[str], Optional[object]]:
+        """(eot, data_janela) mais recente em ``numeros_portados`` para o número exato."""
+        numero = str(numero)
+        if self.portados is not None:
+            return self.portados.lookup(numero)
+        if numero not in self._np:
+            self._carregar_np([numero])
+        return self._np[numero]
+
+    def cadup(self, numero: str) -> Tuple[Optional[str], str]:
+        """Equivalente a ``_lookup_eot_cadup``: (eot, 'cadup') ou (None, '')."""
+        if self.cadup_index is not None:
+            return self.cadup_index.lookup(numero)
+        tipo, cn, prefixo, mcdu = _split_number_for_cadup(numero)
+        if not tipo:
+            return None, ''
+        k = (cn, prefixo)
+        if k not in self._cadup:
+            self._carregar_cadup([k])
+        for ini, fim, eot in self._cadup[k]:
+            try:
+                if ini is not None and fim is not None and ini <= _cmp_mcdu(ini, mcdu) and fim >= _cmp_mcdu(fim, mcdu):
+                    return (str(eot) if eot is not None else None, 'cadup')
+            except Exception:
+                continue
+        return None, ''
+
+    def resolve(self, numero: str, when_dt=None) -> Tuple[Optional[str], Optional[str], Optional[object]]:
+        """Equivalente a ``_resolve_eot``: prioridade a ``numeros_portados``, depois CADUP."""
+        eot_np, data_jan = self.portabilidade(_national_number(numero))
+        if eot_np:
+            return eot_np, 'numeros_portados', data_jan
+        eot_cad, origem = self.cadup(numero)
+        if eot_cad:
+            return eot_cad, origem, None
+        return None, None, None
@@ -0,0 +1,241 @@
+from __future__ import annotations
+"""Resultado materializado do batimento (``detraf_resultado_batimento_avancado``).
+
+Ao final do matching, STATUS, ``codigo_erro``, ``diferenca_tempo``,
+origem/destino normalizados e os EOTs do CDR são calculados uma única vez
+(mesmas expressões da view original) e gravados em uma tabela indexada.
+A view ``detraf_batimento_avancado_vw`` e os relatórios passam a ler dessa
+tabela, sem reprocessar o JOIN com a `cdr` a cada consulta.
+
+No mesmo passo, os totais por status, ``codigo_erro`` e marcador de
+recuperação de conta vão para ``detraf_resumo_batimento_avancado`` (o
+sintético vira uma leitura dessa tabela) e são conferidos com os contadores
+mantidos durante o matching (pares, perdidas e marcadas com
+RECUPERACAO_DE_CONTA); divergência levanta ``ResumoDivergente``.
+"""
+
+from typing import Dict, Optional, Tuple
+
+from .log import info, ok
+
+TABELA_RESULTADO = "detraf_resultado_batimento_avancado"
+TABELA_RESUMO = "detraf_resumo_batimento_avancado"
+FETCH_BATCH = 5_000
+
+# Ordem de apresentação dos status nos relatórios (antes: ORDER BY FIELD(...))
+STATUS_ORDEM = ("Conferência", "Erro", "Perdido")
+
+CREATE_RESULTADO = f"""
+CREATE TABLE IF NOT EXISTS {TABELA_RESULTADO} (
+    id BIGINT NOT NULL PRIMARY KEY,
+    detraf_id BIGINT NOT NULL,
+    cdr_id BIGINT NULL,
+    status VARCHAR(20) NOT NULL,
+    status_ordem TINYINT NOT NULL,
+    diferenca_tempo VARCHAR(8) NULL,
+    data_hora DATETIME NULL,
+    origem VARCHAR(32) NULL,
+    destino VARCHAR(32) NULL,
+    eot_a_batimento VARCHAR(10) NULL,
+    eot_b_batimento VARCHAR(10) NULL,
+    cdr_eot_a VARCHAR(32) NULL,
+    cdr_eot_b VARCHAR(32) NULL,
+    codigo_erro TINYINT NULL,
+    recuperacao_de_conta TINYINT NOT NULL DEFAULT 0,
+    observacao VARCHAR(255) NULL,
+    ref_eot_a VARCHAR(32) NULL,
+    ref_eot_b VARCHAR(32) NULL,
+    ref_origem_a VARCHAR(20) NULL,
+    ref_origem_b VARCHAR(20) NULL,
+    INDEX idx_resultado_status (status, data_hora, codigo_erro),
+    INDEX idx_resultado_codigo (codigo_erro)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+# codigo_erro 0 = sem código (Conferência); NULL não entra na PK
+CREATE_RESUMO = f"""
+CREATE TABLE IF NOT EXISTS {TABELA_RESUMO} (
+    status VARCHAR(20) NOT NULL,
+    codigo_erro TINYINT NOT NULL DEFAULT 0,
+    recuperacao_de_conta TINYINT NOT NULL DEFAULT 0,
+    total BIGINT NOT NULL,
+    PRIMARY KEY (status, codigo_erro, recuperacao_de_conta)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4
+"""
+
+_SQL_RESUMIR = f"""
+INSERT INTO {TABELA_RESUMO} (status, codigo_erro, recuperacao_de_conta, total)
+SELECT status, COALESCE(codigo_erro, 0), recuperacao_de_conta, COUNT(*)
+FROM {TABELA_RESULTADO}
+GROUP BY status, COALESCE(codigo_erro, 0), recuperacao_de_conta
+"""
+
+
+class ResumoDivergente(RuntimeError):
+    """Totais do resumo não batem com as linhas gravadas pelo matching."""
+
+
+_SQL_MATERIALIZAR = f"""
+INSERT INTO {TABELA_RESULTADO} (
+    id, detraf_id, cdr_id, status, status_ordem, diferenca_tempo, data_hora,
+    origem, destino, eot_a_batimento, eot_b_batimento, cdr_eot_a, cdr_eot_b,
+    codigo_erro, recuperacao_de_conta, observacao,
+    ref_eot_a, ref_eot_b, ref_origem_a, ref_origem_b
+)
+SELECT id, detraf_id, cdr_id, status,
+       FIELD(status, 'Conferência', 'Erro', 'Perdido') AS status_ordem,
+       diferenca_tempo, data_hora, origem, destino,
+       eot_a_batimento, eot_b_batimento, cdr_eot_a, cdr_eot_b,
+       codigo_erro,
+       COALESCE(observacao LIKE '%RECUPERACAO_DE_CONTA%', 0) AS recuperacao_de_conta,
+       observacao,
+       ref_eot_a, ref_eot_b, ref_origem_a, ref_origem_b
+FROM (
+    SELECT dc.id, dc.detraf_id, dc.cdr_id,
+           CASE
+             WHEN dc.cdr_id IS NULL THEN 'Perdido'
+             WHEN (c.disposition IS NOT NULL AND UPPER(c.disposition) <> 'ANSWERED') THEN 'Erro'
+             WHEN ( (c.EOT_A <=> d.eot_de_a) AND (c.EOT_B <=> d.eot_de_b) ) THEN 'Conferência'
+             ELSE 'Erro'
+           END AS status,
+           CASE
+             WHEN dc.cdr_id IS NULL THEN NULL
+             ELSE CONCAT(LPAD(FLOOR(ABS(TIMESTAMPDIFF(SECOND, d.data_hora, c.calldate))/60), 2, '0'), ':', LPAD(MOD(ABS(TIMESTAMPDIFF(SECOND, d.data_hora, c.calldate)), 60), 2, '0'))
+           END AS diferenca_tempo,
+           d.data_hora,
+           d.a_num AS origem,
+           d.b_num AS destino,
+           d.eot_de_a AS eot_a_batimento,
+           d.eot_de_b AS eot_b_batimento,
+           c.EOT_A AS cdr_eot_a,
+           c.EOT_B AS cdr_eot_b,
+           CASE
+             WHEN dc.cdr_id IS NULL THEN 4
+             WHEN (c.disposition IS NOT NULL AND UPPER(c.disposition) <> 'ANSWERED') THEN 1
+             WHEN ((c.EOT_A IS NOT NULL AND d.eot_de_a IS NOT NULL AND c.EOT_A <> d.eot_de_a)
+                   AND (c.EOT_B IS NOT NULL AND d.eot_de_b IS NOT NULL AND c.EOT_B <> d.eot_de_b)) THEN 5
+             WHEN (c.EOT_A IS NOT NULL AND d.eot_de_a IS NOT NULL AND c.EOT_A <> d.eot_de_a) THEN 3
+             WHEN (c.EOT_B IS NOT NULL AND d.eot_de_b IS NOT NULL AND c.EOT_B <> d.eot_de_b) THEN 2
+             ELSE NULL
+           END AS codigo_erro,
+           dc.observacao,
+           dc.ref_eot_a, dc.ref_eot_b, dc.ref_origem_a, dc.ref_origem_b
+    FROM detraf_processado_batimento_avancado dc
+    JOIN detraf_arquivo_batimento_avancado d ON dc.detraf_id = d.id
+    LEFT JOIN cdr c ON c.id = dc.cdr_id
+) r
+"""
+
+# View mantida para consultas ad hoc; lê apenas a tabela materializada
+SQL_VIEW = f"""
+CREATE OR REPLACE VIEW detraf_batimento_avancado_vw AS
+SELECT id AS ID,
+       status AS STATUS,
+       diferenca_tempo,
+       DATE_FORMAT(data_hora, '%Y-%m-%d %H:%i:%s') AS Data_hora_batimento,
+       origem AS `origem batimento`,
+       destino AS `destino batimento`,
+       eot_a_batimento AS EOT_A_Batimento,
+       eot_b_batimento AS EOT_B_Batimento,
+       cdr_id AS id_cdr,
+       cdr_eot_a AS cdr_eot_A,
+       cdr_eot_b AS cdr_eot_B,
+       codigo_erro,
+       observacao
+FROM {TABELA_RESULTADO}
+ORDER BY status_ordem, data_hora, codigo_erro
+"""
+
+
+def garantir_resultado(cur) -> None:
+    cur.execute(CREATE_RESULTADO)
+    cur.execute(CREATE_RESUMO)
+
+
+def materializar_resultado(cur) -> int:
+    """Recalcula ``detraf_resultado_batimento_avancado`` a partir do processado. Retorna as linhas."""
+    garantir_resultado(cur)
+    cur.execute(f"TRUNCATE TABLE {TABELA_RESULTADO}")
+    cur.execute(_SQL_MATERIALIZAR)
+    total = cur.rowcount or 0
+    ok(f"Resultado materializado em {TABELA_RESULTADO} ({total} linhas)")
+    return total
+
+
+def resumir_resultado(
+    cur, pares: int, perdidos: int, recuperacao: Optional[int] = None,
+) -> Dict[Tuple[str, int, int], int]:
+    """Grava ``detraf_resumo_batimento_avancado`` (uma agregação sobre o resultado) e confere
+    com os contadores mantidos durante o matching: ``pares`` (linhas com CDR inseridas pela
+    classificação), ``perdidos`` (linhas 'Perdido' inseridas) e ``recuperacao`` (linhas
+    marcadas com RECUPERACAO_DE_CONTA; None não confere).
+
+    Retorna ``{(status, codigo_erro, recuperacao_de_conta): total}``.
+    """
+    garantir_resultado(cur)
+    cur.execute(f"TRUNCATE TABLE {TABELA_RESUMO}")
+    cur.execute(_SQL_RESUMIR)
+    cur.execute(f"SELECT status, codigo_erro, recuperacao_de_conta, total FROM {TABELA_RESUMO}")
+    resumo: Dict[Tuple[str, int, int], int] = {}
+    for row in cur.fetchall() or []:
+        if isinstance(row, dict):
+            k = (row["status"], int(row["codigo_erro"]), int(row["recuperacao_de_conta"]))
+            resumo[k] = int(row["total"])
+        else:
+            resumo[(row[0], int(row[1]), int(row[2]))] = int(row[3])
+
+    total = sum(resumo.values())
+    n_perdido = sum(v for (st, _, _), v in resumo.items() if st == "Perdido")
+    n_casadas = total - n_perdido
+    n_recup = sum(v for (_, _, rec), v in resumo.items() if rec)
+    divergencias = []
+    if n_casadas != pares:
+        divergencias.append(f"Conferência+Erro no resumo={n_casadas} x pares inseridos={pares}")
+    if n_perdido != perdidos:
+        divergencias.append(f"Perdido no resumo={n_perdido} x perdidas inseridas={perdidos}")
+    if recuperacao is not None and n_recup != recuperacao:
+        divergencias.append(f"recuperação no resumo={n_recup} x marcadas no matching={recuperacao}")
+    if divergencias:
+        raise ResumoDivergente("Resumo do batimento divergente: " + "; ".join(divergencias))
+
+    info(
+        "Resumo: " + " | ".join(
+            f"{st}={sum(v for (s2, _, _), v in resumo.items() if s2 == st)}" for st in STATUS_ORDEM
+        ) + f" | recuperação={n_recup}"
+    )
+    ok(f"Resumo gravado em {TABELA_RESUMO} ({len(resumo)} grupos, {total} linhas conferidas)")
+    return resumo
+
+
+def criar_view(cur) -> None:
+    cur.execute(SQL_VIEW)
+    ok("View detraf_batimento_avancado_vw atualizada.")
+
+
+def finalizar_resultado(cur, pares: int, perdidos: int, recuperacao: Optional[int] = None) -> int:
+    """Materializa o resultado, recria a view e grava/confere o resumo. Retorna as linhas do resultado."""
+    n_resultado = materializar_resultado(cur)
+    criar_view(cur)
+    resumir_resultado(cur, pares, perdidos, recuperacao)
+    return n_resultado
+
+
+def linhas_por_status(cur, colunas: str, lote: int = FETCH_BATCH):
+    """Linhas do resultado na ordem dos relatórios: um SELECT por status (índice
+    ``(status, data_hora, codigo_erro)``), em vez de ``ORDER BY FIELD(...)`` sobre tudo.
+
+    Lê em blocos de ``lote`` linhas; com cursor de servidor (``SSCursor``/``SSDictCursor``)
+    o resultado chega em streaming e a memória fica limitada ao bloco atual.
+    ``colunas`` vai para um SELECT parametrizado: literais com ``%`` devem vir como ``%%``.
+    """
+    for status in STATUS_ORDEM:
+        cur.execute(
+            f"SELECT {colunas} FROM {TABELA_RESULTADO} WHERE status = %s ORDER BY data_hora, codigo_erro",
+            (status,),
+        )
+        while True:
+            rows = cur.fetchmany(lote)
+            if not rows:
+                break
+            for row in rows:
+                yield row
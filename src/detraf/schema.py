@@ -27,7 +27,10 @@ CREATE TABLE detraf_arquivo_batimento_avancado (
     cnl_de_b VARCHAR(10),
     area_local_de_b VARCHAR(10),
     data_hora DATETIME,
-    INDEX idx_detraf_data_hora (data_hora)
+    a_num VARCHAR(32),
+    b_num VARCHAR(32),
+    INDEX idx_detraf_data_hora (data_hora),
+    INDEX idx_detraf_match (a_num, b_num, data_hora)
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
 """
 
@@ -38,6 +41,10 @@ CREATE TABLE detraf_processado_batimento_avancado (
     cdr_id BIGINT NULL,
     status VARCHAR(20) NOT NULL,
     observacao VARCHAR(255) NULL,
+    ref_eot_a VARCHAR(32) NULL,
+    ref_eot_b VARCHAR(32) NULL,
+    ref_origem_a VARCHAR(20) NULL,
+    ref_origem_b VARCHAR(20) NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     INDEX idx_detraf_id (detraf_id),
     INDEX idx_cdr_id (cdr_id)
@@ -62,6 +69,61 @@ INSERT IGNORE INTO codigo_erro_batimento_avancado (codigo, descricao, ativo) VAL
   (5,'EOT de A e de B do batimento nao bate com o CDR.',1);
 """
 
+# Colunas/índices adicionados após a criação original das tabelas.
+# Aplicados de forma idempotente em bancos já existentes.
+UPGRADE_COLUMNS = [
+    ("detraf_arquivo_batimento_avancado", "a_num", "ADD COLUMN a_num VARCHAR(32)"),
+    ("detraf_arquivo_batimento_avancado", "b_num", "ADD COLUMN b_num VARCHAR(32)"),
+    ("detraf_processado_batimento_avancado", "ref_eot_a", "ADD COLUMN ref_eot_a VARCHAR(32) NULL"),
+    ("detraf_processado_batimento_avancado", "ref_eot_b", "ADD COLUMN ref_eot_b VARCHAR(32) NULL"),
+    ("detraf_processado_batimento_avancado", "ref_origem_a", "ADD COLUMN ref_origem_a VARCHAR(20) NULL"),
+    ("detraf_processado_batimento_avancado", "ref_origem_b", "ADD COLUMN ref_origem_b VARCHAR(20) NULL"),
+    ("detraf_resultado_batimento_avancado", "ref_eot_a", "ADD COLUMN ref_eot_a VARCHAR(32) NULL"),
+    ("detraf_resultado_batimento_avancado", "ref_eot_b", "ADD COLUMN ref_eot_b VARCHAR(32) NULL"),
+    ("detraf_resultado_batimento_avancado", "ref_origem_a", "ADD COLUMN ref_origem_a VARCHAR(20) NULL"),
+    ("detraf_resultado_batimento_avancado", "ref_origem_b", "ADD COLUMN ref_origem_b VARCHAR(20) NULL"),
+]
+UPGRADE_INDEXES = [
+    ("detraf_arquivo_batimento_avancado", "idx_detraf_match", "ADD INDEX idx_detraf_match (a_num, b_num, data_hora)"),
+]
+
+def _table_exists(cur, table: str) -> bool:
+    cur.execute(
+        "SELECT 1 FROM information_schema.tables WHERE table_schema = DATABASE() AND table_name = %s LIMIT 1",
+        (table,),
+    )
+    return cur.fetchone() is not None
+
+def _column_exists(cur, table: str, column: str) -> bool:
+    cur.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s LIMIT 1",
+        (table, column),
+    )
+    return cur.fetchone() is not None
+
+def _index_exists(cur, table: str, index: str) -> bool:
+    cur.execute(
+        "SELECT 1 FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s LIMIT 1",
+        (table, index),
+    )
+    return cur.fetchone() is not None
+
+def atualizar_schema_avancado(cur) -> None:
+    """Aplica colunas/índices novos (``UPGRADE_COLUMNS``/``UPGRADE_INDEXES``) se ausentes.
+
+    Tabelas inexistentes são ignoradas (serão criadas já no formato atual).
+    Não altera `cdr`, `numeros_portados` ou `cadup`.
+    """
+    existentes = {t for t, _, _ in UPGRADE_COLUMNS + UPGRADE_INDEXES if _table_exists(cur, t)}
+    for table, column, ddl in UPGRADE_COLUMNS:
+        if table in existentes and not _column_exists(cur, table, column):
+            cur.execute(f"ALTER TABLE {table} {ddl}")
+            info(f"Coluna {table}.{column} adicionada.")
+    for table, index, ddl in UPGRADE_INDEXES:
+        if table in existentes and not _index_exists(cur, table, index):
+            cur.execute(f"ALTER TABLE {table} {ddl}")
+            info(f"Índice {table}.{index} criado.")
+
 def reset_schema_avancado() -> None:
     """Dropa e recria as tabelas avançadas do batimento.
 